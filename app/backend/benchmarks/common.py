@@ -0,0 +1,20 @@
+"""Shared helpers for benchmark scripts."""
+import statistics
+
+from core.config import settings
+
+
+def libpq_url() -> str:
+    """Database URL without the SQLAlchemy driver suffix, for direct psycopg connections."""
+    return settings.DATABASE_URL.replace("postgresql+psycopg://", "postgresql://")
+
+def percentile(samples: list[float], q: float) -> float:
+    """Nearest-rank percentile, `q` in 0 ~ 100."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+def summary(name: str, samples: list[float]) -> str:
+    """One line latency summary of samples in seconds."""
+    samples_ms = [s * 1000 for s in samples]
+    return (f"{name:<40} mean {statistics.mean(samples_ms):8.3f} ms"
+            f"  p50 {statistics.median(samples_ms):8.3f} ms  p99 {percentile(samples_ms, 99):8.3f} ms")
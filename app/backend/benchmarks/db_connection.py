@@ -0,0 +1,63 @@
+"""
+Benchmark connection setup and relational queries: plain vs AGE initialized connections.
+
+Compares:
+  - connection establishment time, plain vs `LOAD 'age'` + AGE search_path
+  - latency of a relational query (`thoughts` by primary key) under both search_path
+
+Run from the backend directory against a running database:
+  python -m benchmarks.db_connection --rounds 200
+"""
+import argparse
+import time
+
+import psycopg
+
+from .common import libpq_url, summary
+
+
+def _setup_age(conn: psycopg.Connection) -> None:
+    # Same statements the previous per connection listener executed
+    conn.execute("LOAD 'age';")
+    conn.execute("SET search_path = ag_catalog, '$user', public;")
+
+def bench_connect(rounds: int, age: bool) -> list[float]:
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        with psycopg.connect(libpq_url(), autocommit=True) as conn:
+            if age:
+                _setup_age(conn)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+def bench_query(rounds: int, age: bool) -> list[float]:
+    samples = []
+    with psycopg.connect(libpq_url(), autocommit=True) as conn:
+        if age:
+            _setup_age(conn)
+        row = conn.execute("SELECT max(thought_id) FROM thoughts").fetchone()
+        max_id = row[0] or 1
+        for i in range(rounds):
+            thought_id = i % max_id + 1
+            start = time.perf_counter()
+            conn.execute(
+                "SELECT thought_id, text, srs_due FROM thoughts WHERE thought_id = %s",
+                (thought_id,),
+            ).fetchall()
+            samples.append(time.perf_counter() - start)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200, help="Number of samples per case")
+    args = parser.parse_args()
+
+    print(summary("connect (plain)", bench_connect(args.rounds, age=False)))
+    print(summary("connect (LOAD age + search_path)", bench_connect(args.rounds, age=True)))
+    print(summary("relational query (plain search_path)", bench_query(args.rounds, age=False)))
+    print(summary("relational query (AGE search_path)", bench_query(args.rounds, age=True)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Latency of query embeddings while an import runs, with and without priority
+lanes, see `core.lanes`.
+
+The fake embedding server models a model server of limited capacity: each
+request takes a fixed latency plus a cost per text, on `--workers` workers.
+Before: an import sends its texts in one request, and queries wait behind it.
+After: the import is split into requests of `EMBEDDING_BATCH_SIZE` in the bulk
+lane, capped to `EMBEDDING_BULK_SHARE` of `EMBEDDING_CONCURRENCY`.
+
+Needs no database, the settings are pointed to the fake by environment variables.
+Run from the backend directory:
+  python -m benchmarks.embedding_lanes
+  python -m benchmarks.embedding_lanes --import-size 5000 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+from .fakes import FakeEmbeddingServer
+
+
+def configure_env(api_base: str, args) -> None:
+    os.environ.update({
+        "EMBEDDING_MODEL": "openai/fake-embedding",
+        "EMBEDDING_API_BASE": api_base,
+        "EMBEDDING_API_KEY": "fake",
+        "EMBEDDING_CACHE_SIZE": "0",
+        "EMBEDDING_BATCH_SIZE": str(args.batch_size),
+        "EMBEDDING_CONCURRENCY": str(args.concurrency),
+        "EMBEDDING_BULK_SHARE": str(args.bulk_share),
+        "USAGE_LEDGER": "false",
+        "METRICS_PORT": "0",
+        "LOG_LEVEL_GLOBAL": "WARNING",
+        "LOG_LEVEL_LiteLLM": "WARNING",
+    })
+    # Required by the settings, not used
+    for name in ("POSTGRES_DB", "POSTGRES_USER", "POSTGRES_PASSWORD", "S3_ACCESS_KEY", "S3_SECRET_KEY"):
+        os.environ.setdefault(name, "unused")
+
+def unique_texts(count: int) -> list[str]:
+    """Texts not in the litellm cache."""
+    run_id = uuid.uuid4().hex
+    return [f"text {run_id} {index}" for index in range(count)]
+
+def query_latencies(duration: float, queries: int, interval: float) -> list[float]:
+    """Single text embeddings of `queries` threads, for `duration` seconds."""
+    from utils.embeddings import get_embeddings
+
+    samples = []
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < stop_at:
+            start_time = time.perf_counter()
+            asyncio.run(get_embeddings(unique_texts(1), dimension=0))
+            samples.append(time.perf_counter() - start_time)
+            time.sleep(interval)
+
+    threads = [threading.Thread(target=client) for _ in range(queries)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+def run_case(name: str, args, lanes: bool) -> None:
+    import utils.embeddings
+    from core.config import settings
+    from core.lanes import BULK, LaneScheduler, embedding_lane
+    from .common import summary
+
+    # Before: one request per import, no cap of bulk work
+    settings.EMBEDDING_BATCH_SIZE = args.batch_size if lanes else args.import_size
+    utils.embeddings._scheduler = LaneScheduler(args.concurrency, args.bulk_share if lanes else 1.0)
+
+    stop = threading.Event()
+    imported = []
+
+    def importer():
+        with embedding_lane(BULK):
+            while not stop.is_set():
+                asyncio.run(utils.embeddings.get_embeddings(unique_texts(args.import_size), dimension=0))
+                imported.append(args.import_size)
+
+    thread = threading.Thread(target=importer)
+    start_time = time.perf_counter()
+    thread.start()
+    samples = query_latencies(args.duration, args.queries, args.interval)
+    stop.set()
+    thread.join()
+    elapsed = time.perf_counter() - start_time
+
+    print(summary(f"{name}: query during import", samples))
+    print(f"{name}: import {sum(imported) / elapsed:,.0f} texts/s, {len(imported)} imports in {elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--import-size", type=int, default=2000, help="Texts per import")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of queries per case")
+    parser.add_argument("--queries", type=int, default=2, help="Query threads")
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between queries of a thread")
+    parser.add_argument("--batch-size", type=int, default=64, help="EMBEDDING_BATCH_SIZE")
+    parser.add_argument("--concurrency", type=int, default=2, help="EMBEDDING_CONCURRENCY")
+    parser.add_argument("--bulk-share", type=float, default=0.5, help="EMBEDDING_BULK_SHARE")
+    parser.add_argument("--workers", type=int, default=1, help="Requests the fake server works on at once")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds per request of the fake")
+    parser.add_argument("--text-latency", type=float, default=0.0005, help="Seconds per text of the fake")
+    args = parser.parse_args()
+
+    with FakeEmbeddingServer(dimension=64, latency=args.latency, text_latency=args.text_latency, workers=args.workers) as server:
+        configure_env(server.api_base, args)
+        from .common import summary
+        print(summary("idle: query", query_latencies(min(args.duration, 5), args.queries, args.interval)))
+        run_case("before", args, lanes=False)
+        run_case("after", args, lanes=True)
+
+
+if __name__ == "__main__":
+    main()
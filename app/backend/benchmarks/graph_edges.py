@@ -0,0 +1,127 @@
+"""
+Benchmark DERIVED_TO edge creation at different graph sizes.
+
+Compares:
+  - label scan: vertices matched by property maps, no indexes (previous behavior)
+  - indexed: vertices matched by vertex ID, with the indexes of `migrations/001-graph-indexes.sql`
+
+Uses a scratch graph, vertices are bulk inserted with SQL. Run from the backend directory:
+  python -m benchmarks.graph_edges --sizes 100000 1000000 --edges 200
+"""
+import argparse
+import json
+import random
+import time
+
+import psycopg
+
+from .common import libpq_url, summary
+
+BENCH_GRAPH = "bench_graph_edges"
+SOURCES_PER_THOUGHTS = 100 # One source every N thoughts
+
+
+def _cypher(conn: psycopg.Connection, query: str, params: dict) -> list:
+    return conn.execute(
+        f"SELECT * FROM ag_catalog.cypher('{BENCH_GRAPH}', $${query}$$, %s) AS (r ag_catalog.agtype)",
+        (json.dumps(params),),
+        prepare=True,
+    ).fetchall()
+
+def setup_graph(conn: psycopg.Connection, size: int) -> None:
+    """Creates the scratch graph with `size` Thought vertices."""
+    exists = conn.execute("SELECT 1 FROM ag_catalog.ag_graph WHERE name = %s", (BENCH_GRAPH,)).fetchone()
+    if exists:
+        conn.execute(f"SELECT ag_catalog.drop_graph('{BENCH_GRAPH}', true)")
+    conn.execute(f"SELECT ag_catalog.create_graph('{BENCH_GRAPH}')")
+    for label in ("Source", "Thought"):
+        conn.execute(f"SELECT ag_catalog.create_vlabel('{BENCH_GRAPH}', '{label}')")
+    conn.execute(f"SELECT ag_catalog.create_elabel('{BENCH_GRAPH}', 'DERIVED_TO')")
+
+    conn.execute(f"""
+        INSERT INTO {BENCH_GRAPH}."Thought" (properties)
+        SELECT format('{{"pg_table_id": %s}}', g)::ag_catalog.agtype
+        FROM generate_series(1, {size}) g
+    """)
+    conn.execute(f"""
+        INSERT INTO {BENCH_GRAPH}."Source" (properties)
+        SELECT format('{{"keys": {{"type": "book", "isbn": "%s"}}}}', g)::ag_catalog.agtype
+        FROM generate_series(1, {max(1, size // SOURCES_PER_THOUGHTS)}) g
+    """)
+    conn.execute(f'ANALYZE {BENCH_GRAPH}."Thought"')
+    conn.execute(f'ANALYZE {BENCH_GRAPH}."Source"')
+
+def create_indexes(conn: psycopg.Connection) -> None:
+    conn.execute(f'CREATE INDEX ON {BENCH_GRAPH}."Source" USING btree (id)')
+    conn.execute(f'CREATE INDEX ON {BENCH_GRAPH}."Thought" USING btree (id)')
+    conn.execute(f"""
+        CREATE INDEX ON {BENCH_GRAPH}."Thought"
+        USING btree (ag_catalog.agtype_access_operator(VARIADIC ARRAY[properties, '"pg_table_id"'::ag_catalog.agtype]))
+    """)
+    conn.execute(f'CREATE INDEX ON {BENCH_GRAPH}."DERIVED_TO" USING btree (start_id)')
+    conn.execute(f'CREATE INDEX ON {BENCH_GRAPH}."DERIVED_TO" USING btree (end_id)')
+    conn.execute(f'ANALYZE {BENCH_GRAPH}."Thought"')
+    conn.execute(f'ANALYZE {BENCH_GRAPH}."Source"')
+
+def bench_label_scan(conn: psycopg.Connection, size: int, edges: int) -> list[float]:
+    query = """
+        MATCH (t:Thought {pg_table_id: $thought_id})
+        MATCH (s:Source {keys: $keys})
+        MERGE (s)-[r:DERIVED_TO {type: 'note'}]->(t)
+        RETURN r
+    """
+    source_count = max(1, size // SOURCES_PER_THOUGHTS)
+    samples = []
+    for _ in range(edges):
+        params = {
+            "thought_id": random.randint(1, size),
+            "keys": {"type": "book", "isbn": str(random.randint(1, source_count))},
+        }
+        start = time.perf_counter()
+        _cypher(conn, query, params)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def bench_indexed(conn: psycopg.Connection, edges: int) -> list[float]:
+    query = """
+        MATCH (s:Source), (t:Thought)
+        WHERE id(s) = $source_id AND id(t) = $thought_vertex_id
+        MERGE (s)-[r:DERIVED_TO {type: 'note'}]->(t)
+        RETURN r
+    """
+    thought_ids = [r[0] for r in conn.execute(
+        f'SELECT id::text::bigint FROM {BENCH_GRAPH}."Thought" TABLESAMPLE SYSTEM (1) LIMIT %s', (edges,)
+    )]
+    source_ids = [r[0] for r in conn.execute(
+        f'SELECT id::text::bigint FROM {BENCH_GRAPH}."Source" LIMIT 1000'
+    )]
+    samples = []
+    for thought_vertex_id in thought_ids:
+        params = {"source_id": random.choice(source_ids), "thought_vertex_id": thought_vertex_id}
+        start = time.perf_counter()
+        _cypher(conn, query, params)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="Number of Thought vertices")
+    parser.add_argument("--edges", type=int, default=200, help="Number of edges created per case")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch graph after the run")
+    args = parser.parse_args()
+
+    with psycopg.connect(libpq_url(), autocommit=True) as conn:
+        conn.execute("LOAD 'age'")
+        for size in args.sizes:
+            print(f"--- {size} Thought vertices ---")
+            setup_graph(conn, size)
+            print(summary("edge creation (label scan)", bench_label_scan(conn, size, args.edges)))
+            create_indexes(conn)
+            print(summary("edge creation (indexed, vertex ID)", bench_indexed(conn, args.edges)))
+
+        if not args.keep:
+            conn.execute(f"SELECT ag_catalog.drop_graph('{BENCH_GRAPH}', true)")
+
+
+if __name__ == "__main__":
+    main()
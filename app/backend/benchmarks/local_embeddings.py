@@ -0,0 +1,166 @@
+"""
+Benchmark the local embedding backend against the HTTP path, same model on
+the same machine, see `utils.local_embeddings`.
+
+HTTP: `get_embeddings` through litellm to an OpenAI compatible server. By
+default a server process running the same sentence-transformers model is
+started here, `--api-base` points to another one, like Infinity, instead.
+Local: `EMBEDDING_BACKEND=local`, the model in a worker process, results
+through shared memory.
+
+Reports latency by texts per call, and throughput of concurrent callers.
+Needs the `sentence-transformers` package, no database.
+Run from the backend directory:
+  python -m benchmarks.local_embeddings
+  python -m benchmarks.local_embeddings --model BAAI/bge-small-en-v1.5 --runtime onnx --clients 8
+"""
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .fakes import free_port
+
+WORDS = ("memory review note idea book chapter spaced repetition learning thought context "
+         "attention habit practice question answer reading writing summary concept example").split()
+
+
+def serve_model_http(model_name: str, runtime: str, threads: int, port: int, ready) -> None:
+    """OpenAI compatible `/embeddings` server of a sentence-transformers model, in its own process."""
+    from utils.local_embeddings import _load_model
+
+    model = _load_model(model_name, runtime, threads)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            with lock:
+                vectors = model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+            data = []
+            for index, vector in enumerate(vectors):
+                if body.get("encoding_format") == "base64":
+                    embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode()
+                else:
+                    embedding = vector.tolist()
+                data.append({"object": "embedding", "index": index, "embedding": embedding})
+            payload = json.dumps({"object": "list", "data": data, "model": model_name,
+                                  "usage": {"prompt_tokens": 0, "total_tokens": 0}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    ready.set()
+    server.serve_forever()
+
+def configure_env() -> None:
+    os.environ.update({
+        "EMBEDDING_CACHE_SIZE": "0",
+        "USAGE_LEDGER": "false",
+        "METRICS_PORT": "0",
+        "LOG_LEVEL_GLOBAL": "WARNING",
+        "LOG_LEVEL_LiteLLM": "WARNING",
+    })
+    # Required by the settings, not used
+    for name in ("POSTGRES_DB", "POSTGRES_USER", "POSTGRES_PASSWORD", "S3_ACCESS_KEY", "S3_SECRET_KEY"):
+        os.environ.setdefault(name, "unused")
+
+def sample_texts(count: int, rng: random.Random) -> list[str]:
+    """Note sized texts, unique so the litellm cache is not hit."""
+    run_id = uuid.uuid4().hex[:8]
+    return [f"{run_id} {index} " + " ".join(rng.choices(WORDS, k=rng.randint(10, 40))) for index in range(count)]
+
+def bench_backend(name: str, embed, args) -> None:
+    from .common import summary
+
+    rng = random.Random(42)
+    embed(sample_texts(8, rng)) # Warm up connections and the model
+    for size in args.sizes:
+        samples = []
+        for _ in range(args.rounds):
+            texts = sample_texts(size, rng)
+            start_time = time.perf_counter()
+            embed(texts)
+            samples.append(time.perf_counter() - start_time)
+        print(summary(f"{name}: {size} texts per call", samples))
+
+    done = []
+    stop_at = time.perf_counter() + args.duration
+
+    def client(seed: int):
+        client_rng = random.Random(seed)
+        while time.perf_counter() < stop_at:
+            embed(sample_texts(args.client_batch, client_rng))
+            done.append(args.client_batch)
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(args.clients)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"{name}: {sum(done) / (time.perf_counter() - start_time):,.0f} texts/s"
+          f" with {args.clients} callers of {args.client_batch} texts")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2", help="sentence-transformers model")
+    parser.add_argument("--runtime", choices=["torch", "onnx"], default="torch")
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads of the model, 0 for the runtime default")
+    parser.add_argument("--api-base", help="OpenAI compatible server of the same model, instead of starting one")
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[1, 16, 128],
+                        help="Texts per call of the latency runs")
+    parser.add_argument("--rounds", type=int, default=50, help="Calls per latency run")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent callers of the throughput run")
+    parser.add_argument("--client-batch", type=int, default=16, help="Texts per call of the throughput run")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of the throughput run")
+    args = parser.parse_args()
+
+    configure_env()
+    os.environ.update({
+        "EMBEDDING_LOCAL_RUNTIME": args.runtime,
+        "EMBEDDING_LOCAL_THREADS": str(args.threads),
+    })
+    from core.config import settings
+    from utils.embeddings import get_embeddings
+
+    server = None
+    api_base = args.api_base
+    if api_base is None:
+        port = free_port()
+        context = multiprocessing.get_context("spawn")
+        ready = context.Event()
+        server = context.Process(target=serve_model_http, args=(args.model, args.runtime, args.threads, port, ready), daemon=True)
+        server.start()
+        if not ready.wait(timeout=600):
+            raise RuntimeError("Embedding server of the model did not start")
+        api_base = f"http://127.0.0.1:{port}/v1"
+
+    try:
+        settings.EMBEDDING_BACKEND = "api"
+        bench_backend("http", lambda texts: asyncio.run(get_embeddings(
+            texts, model=f"openai/{args.model}", api_base=api_base, api_key="none", dimension=0)), args)
+        settings.EMBEDDING_BACKEND = "local"
+        bench_backend("local", lambda texts: asyncio.run(get_embeddings(texts, model=args.model, dimension=0)), args)
+    finally:
+        if server is not None:
+            server.kill()
+
+
+if __name__ == "__main__":
+    main()
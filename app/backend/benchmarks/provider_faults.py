@@ -0,0 +1,174 @@
+"""
+Embeddings through the provider gateway against a fault-injecting embedding
+server, see `core.gateway` and `benchmarks.fakes.FakeEmbeddingServer`.
+
+Phases:
+  - flaky: a share of requests fail, retries should hide most of them
+  - outage: every request fails, the circuit should open and calls fail fast
+    without reaching the server
+  - cancelled probe: the probe after the reset time is cancelled, before and
+    during its request, the circuit must let the next call probe instead of
+    staying half open
+  - probe, recovery: the server is back, a probe after the reset time closes
+    the circuit and calls succeed again
+
+Each phase is checked, the script exits with 1 if a check fails.
+Needs no database, the settings are pointed to the fake by environment variables.
+Run from the backend directory:
+  python -m benchmarks.provider_faults
+  python -m benchmarks.provider_faults --error-rate 0.5 --error-status 503 --calls 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from typing import Optional
+
+from .fakes import FakeEmbeddingServer
+
+MODEL = "openai/fake-embedding"
+FLAKY_SUCCESS_MIN = 0.8 # Share of calls retries should save in the flaky phase
+
+failures = []
+
+
+def check(condition: bool, message: str) -> None:
+    print(f"  {'ok' if condition else 'FAILED'}: {message}")
+    if not condition:
+        failures.append(message)
+
+
+def configure_env(api_base: str, args) -> None:
+    os.environ.update({
+        "EMBEDDING_MODEL": MODEL,
+        "EMBEDDING_API_BASE": api_base,
+        "EMBEDDING_API_KEY": "fake",
+        "EMBEDDING_CACHE_SIZE": "0",
+        "USAGE_LEDGER": "false",
+        "METRICS_PORT": "0",
+        "LOG_LEVEL_GLOBAL": "CRITICAL", # Failures are counted below, not logged
+        "LOG_LEVEL_LiteLLM": "CRITICAL",
+        "PROVIDER_RETRIES": str(args.retries),
+        "PROVIDER_RETRY_BASE_SECONDS": str(args.retry_base),
+        "PROVIDER_BREAKER_FAILURES": str(args.breaker_failures),
+        "PROVIDER_BREAKER_RESET_SECONDS": str(args.breaker_reset),
+    })
+    # Required by the settings, not used
+    for name in ("POSTGRES_DB", "POSTGRES_USER", "POSTGRES_PASSWORD", "S3_ACCESS_KEY", "S3_SECRET_KEY"):
+        os.environ.setdefault(name, "unused")
+
+def counter(name: str) -> float:
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value(name, {"model": MODEL}) or 0
+
+async def run_phase(name: str, calls: int, concurrency: int, server: FakeEmbeddingServer) -> dict:
+    """Runs `calls` embeddings, returns counts of outcomes, server requests, retries and calls failed fast."""
+    from core.gateway import ProviderUnavailable, gateway
+    from utils.embeddings import get_embeddings
+    from .common import summary
+
+    outcomes = {"ok": [], "unavailable": [], "error": []}
+    semaphore = asyncio.Semaphore(concurrency)
+    run_id = uuid.uuid4().hex # Texts not in the litellm cache
+    requests, retries, rejected = server.requests, counter("provider_retries_total"), counter("provider_rejected_total")
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                await get_embeddings([f"{name} {run_id} {index}"], dimension=0)
+                outcome = "ok"
+            except ProviderUnavailable:
+                outcome = "unavailable"
+            except Exception:
+                outcome = "error"
+            outcomes[outcome].append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(calls)))
+    elapsed = time.perf_counter() - start_time
+
+    print(f"{name}: {calls} calls in {elapsed:.2f}s, circuit {gateway(MODEL).state}")
+    print(f"  ok {len(outcomes['ok'])}, unavailable {len(outcomes['unavailable'])}, other errors {len(outcomes['error'])}"
+          f" ({len(outcomes['ok']) / calls:.1%} success)")
+    print(f"  server requests {server.requests - requests}, retries {counter('provider_retries_total') - retries:.0f},"
+          f" failed fast {counter('provider_rejected_total') - rejected:.0f}")
+    for outcome, samples in outcomes.items():
+        if samples:
+            print("  " + summary(outcome, samples))
+    return {
+        **{outcome: len(samples) for outcome, samples in outcomes.items()},
+        "requests": server.requests - requests,
+        "retries": counter("provider_retries_total") - retries,
+        "rejected": counter("provider_rejected_total") - rejected,
+    }
+
+async def cancel_probe(server: FakeEmbeddingServer, after: Optional[float]) -> None:
+    """Cancels the probe call `after` seconds, None for right after it was admitted, before its request."""
+    from core.gateway import gateway
+    from utils.embeddings import get_embeddings
+
+    latency, server.latency = server.latency, 1.0
+    task = asyncio.ensure_future(get_embeddings([f"probe {uuid.uuid4().hex}"], dimension=0))
+    if after is None:
+        # The probe waits for the rate limit once admitted, even without limit
+        while not gateway(MODEL).breaker.probing:
+            await asyncio.sleep(0)
+    else:
+        await asyncio.sleep(after)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    server.latency = latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100, help="Calls per phase")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds per request of the fake")
+    parser.add_argument("--error-rate", type=float, default=0.3, help="Share of failed requests in the flaky phase")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status of injected errors")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--retry-base", type=float, default=0.05, help="Backoff ceiling before the first retry")
+    parser.add_argument("--breaker-failures", type=int, default=5)
+    parser.add_argument("--breaker-reset", type=float, default=2.0, help="Seconds before the open circuit probes")
+    args = parser.parse_args()
+
+    with FakeEmbeddingServer(dimension=64, latency=args.latency, error_rate=args.error_rate,
+                             error_status=args.error_status, seed=42) as server:
+        configure_env(server.api_base, args)
+        from core.gateway import CLOSED, HALF_OPEN, OPEN, gateway
+        breaker = gateway(MODEL).breaker
+
+        result = asyncio.run(run_phase("flaky", args.calls, args.concurrency, server))
+        check(server.errors > 0 and result["retries"] > 0, "faults were injected and retried")
+        check(result["ok"] >= FLAKY_SUCCESS_MIN * args.calls, f"retries hide faults, at least {FLAKY_SUCCESS_MIN:.0%} success")
+
+        server.error_rate = 0
+        server.outage = True
+        result = asyncio.run(run_phase("outage", args.calls, args.concurrency, server))
+        check(breaker.state == OPEN, "circuit opens")
+        check(result["rejected"] > 0 and result["requests"] < args.calls, "calls fail fast without reaching the server")
+
+        server.outage = False
+        for name, after in (("before the request", None), ("waiting for the server", 0.2)):
+            time.sleep(args.breaker_reset)
+            print(f"probe cancelled {name}")
+            asyncio.run(cancel_probe(server, after))
+            check(breaker.state == HALF_OPEN and not breaker.probing, "cancelled probe is released")
+
+        # Calls beside the probe still fail fast until it succeeds
+        result = asyncio.run(run_phase("probe", 1, 1, server))
+        check(result["ok"] == 1 and breaker.state == CLOSED, "next probe succeeds and closes the circuit")
+        result = asyncio.run(run_phase("recovery", args.calls, args.concurrency, server))
+        check(result["ok"] == args.calls and breaker.state == CLOSED, "all calls succeed after recovery")
+
+    if failures:
+        print(f"{len(failures)} checks failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark re-importing an unchanged book notes file.
+
+Generates a Kindle HTML export with unique notes, imports it once, then times
+importing the same file again, and with a few new notes appended. Embedding
+calls are counted by wrapping `get_embeddings` of the thoughts service, the
+re-import of an unchanged file should embed nothing.
+
+Needs the database and the embedding service. Run from the backend directory:
+  python -m benchmarks.reimport --notes 2000
+"""
+import argparse
+import time
+import uuid
+
+import modules.thoughts_services as thoughts_services
+from modules.add_data import AddData
+from utils.notes import kindle_html
+
+_embedded_texts = 0
+
+
+def _count_embeddings():
+    """Wraps the embedding call of the thoughts service to count embedded texts."""
+    get_embeddings = thoughts_services.get_embeddings
+
+    async def counted(texts, *args, **kwargs):
+        global _embedded_texts
+        _embedded_texts += len(texts)
+        return await get_embeddings(texts, *args, **kwargs)
+
+    thoughts_services.get_embeddings = counted
+
+def run_import(title: str, file_content: bytes) -> tuple[float, int]:
+    """Returns seconds taken and number of texts embedded."""
+    global _embedded_texts
+    _embedded_texts = 0
+    start = time.perf_counter()
+    AddData(
+        task="note",
+        source_type="book",
+        source_identifiers={"title": title},
+        file_content=file_content,
+    ).run()
+    return time.perf_counter() - start, _embedded_texts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=2000, help="Number of notes in the file")
+    parser.add_argument("--runs", type=int, default=3, help="Number of re-imports to time")
+    parser.add_argument("--new-notes", type=int, default=2, help="Number of notes appended for the last import")
+    args = parser.parse_args()
+
+    # Unique per run, so results do not depend on earlier runs
+    run_id = uuid.uuid4().hex[:8]
+    title = f"Benchmark book {run_id}"
+    notes = [f"Benchmark note {run_id} number {i}: the quick brown fox jumps over the lazy dog." for i in range(args.notes)]
+    file_content = kindle_html(title, notes)
+
+    _count_embeddings()
+    seconds, embedded = run_import(title, file_content)
+    print(f"First import     {args.notes} notes  {seconds:8.2f} s  {embedded} texts embedded")
+    for i in range(args.runs):
+        seconds, embedded = run_import(title, file_content)
+        print(f"Re-import {i + 1:<6} {args.notes} notes  {seconds:8.2f} s  {embedded} texts embedded")
+
+    # Cumulative export: same notes plus a few new ones
+    notes += [f"Benchmark note {run_id} new {i}: a later highlight of the same book." for i in range(args.new_notes)]
+    seconds, embedded = run_import(title, kindle_html(title, notes))
+    print(f"With {args.new_notes} new     {len(notes)} notes  {seconds:8.2f} s  {embedded} texts embedded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Benchmark kNN search and dedup latency and recall on synthetic vectors, by embedding storage.
+
+Loads a scratch table shaped like `thoughts` by binary COPY, exact results are
+taken from it without index. For each storage mode a copy of the table is indexed
+the same way as `thoughts`, and compared with the exact results:
+  - vector: full precision, DiskANN memory optimized (binary quantized) with rescoring
+  - vector-plain: full precision, DiskANN plain layout, for reference
+  - halfvec: half precision, HNSW
+
+Search queries are new vectors near the data, recall@k is reported.
+Dedup queries are stored vectors with small noise, the top-1 result must match.
+
+Run from the backend directory:
+  python -m benchmarks.search --sizes 100000 1000000 --queries 100 --k 10
+  python -m benchmarks.search --storage vector halfvec --rescore 0 50 200
+"""
+import argparse
+import time
+
+import numpy as np
+import psycopg
+from pgvector.psycopg import register_vector
+
+from .common import libpq_url, summary
+
+BENCH_TABLE = "bench_search_thoughts"
+CLUSTERS = 1000 # Synthetic data is clustered, like thoughts from the same sources
+DEDUP_NOISE = 0.005 # Scale of noise added to stored vectors for dedup queries
+
+STORAGES = {
+    "vector": {
+        "column": "embedding::vector({dim})",
+        "index": "USING diskann (embedding vector_cosine_ops) WITH (storage_layout = memory_optimized)",
+        "query": "%s",
+    },
+    "vector-plain": {
+        "column": "embedding::vector({dim})",
+        "index": "USING diskann (embedding vector_cosine_ops) WITH (storage_layout = plain)",
+        "query": "%s",
+    },
+    "halfvec": {
+        "column": "embedding::halfvec({dim})",
+        "index": "USING hnsw (embedding halfvec_cosine_ops)",
+        "query": "%s::halfvec({dim})",
+    },
+}
+
+
+def synthetic_vectors(count: int, dim: int, rng: np.random.Generator, centers: np.ndarray) -> np.ndarray:
+    """Unit vectors scattered around random cluster centers."""
+    labels = rng.integers(0, len(centers), size=count)
+    vectors = centers[labels] + rng.normal(scale=0.05, size=(count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+def setup_base(conn: psycopg.Connection, size: int, dim: int, rng: np.random.Generator, centers: np.ndarray) -> None:
+    conn.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE {BENCH_TABLE} (
+            thought_id BIGSERIAL PRIMARY KEY,
+            embedding VECTOR({dim}) NOT NULL,
+            srs_discard BOOLEAN
+        )
+    """)
+    chunk = 10_000
+    loaded = 0
+    start = time.perf_counter()
+    with conn.cursor() as cursor:
+        with cursor.copy(f"COPY {BENCH_TABLE} (embedding) FROM STDIN WITH (FORMAT BINARY)") as copy:
+            copy.set_types(["vector"])
+            while loaded < size:
+                for vector in synthetic_vectors(min(chunk, size - loaded), dim, rng, centers):
+                    copy.write_row((vector,))
+                loaded += chunk
+    print(f"Loaded {size} vectors in {time.perf_counter() - start:.1f}s")
+
+def setup_storage(conn: psycopg.Connection, storage: str, dim: int) -> str:
+    """Indexed copy of the base table in a storage mode, returns the table name."""
+    config = STORAGES[storage]
+    table = f"{BENCH_TABLE}_{storage.replace('-', '_')}"
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute(f"""
+        CREATE TABLE {table} AS
+        SELECT thought_id, {config['column'].format(dim=dim)} AS embedding, srs_discard
+        FROM {BENCH_TABLE}
+    """)
+    start = time.perf_counter()
+    conn.execute(f"CREATE INDEX {table}_embedding ON {table} {config['index']}")
+    conn.execute(f"ANALYZE {table}")
+    table_size, index_size = conn.execute(
+        "SELECT pg_relation_size(%s), pg_relation_size(%s)", (table, f"{table}_embedding")
+    ).fetchone()
+    print(f"{storage}: index built in {time.perf_counter() - start:.1f}s, "
+          f"table {table_size / 2**20:.1f} MiB, index {index_size / 2**20:.1f} MiB")
+    return table
+
+def knn(conn: psycopg.Connection, table: str, query_sql: str, query: np.ndarray, k: int) -> list[int]:
+    rows = conn.execute(
+        f"SELECT thought_id FROM {table} WHERE srs_discard IS NOT TRUE ORDER BY embedding <=> {query_sql} LIMIT %s",
+        (query, k),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+def exact(conn: psycopg.Connection, queries: np.ndarray, k: int) -> list[list[int]]:
+    """Exact results of the full precision base table, it has no vector index."""
+    return [knn(conn, BENCH_TABLE, "%s", q, k) for q in queries]
+
+def bench(conn: psycopg.Connection, table: str, query_sql: str, queries: np.ndarray, truths: list[list[int]], k: int) -> tuple[list[float], float]:
+    """Returns index search latencies and mean recall@k against exact results."""
+    samples, recalls = [], []
+    for query, truth in zip(queries, truths):
+        start = time.perf_counter()
+        found = knn(conn, table, query_sql, query, k)
+        samples.append(time.perf_counter() - start)
+        recalls.append(len(set(truth[:k]).intersection(found)) / k)
+    return samples, float(np.mean(recalls))
+
+def dedup_queries(conn: psycopg.Connection, count: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    """Stored vectors with small noise, like re-worded duplicates."""
+    rows = conn.execute(f"SELECT embedding FROM {BENCH_TABLE} ORDER BY random() LIMIT %s", (count,)).fetchall()
+    vectors = np.stack([r[0] for r in rows]) + rng.normal(scale=DEDUP_NOISE, size=(len(rows), dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+def set_rescore(conn: psycopg.Connection, storage: str, rescore: int) -> None:
+    if storage.startswith("vector"):
+        if rescore > 0:
+            conn.execute(f"SET diskann.query_rescore = {rescore}")
+        else:
+            conn.execute("RESET diskann.query_rescore")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="Number of vectors")
+    parser.add_argument("--dim", type=int, default=1536, help="Vector dimension")
+    parser.add_argument("--queries", type=int, default=100, help="Number of queries per case")
+    parser.add_argument("--k", type=int, default=10, help="Number of neighbors")
+    parser.add_argument("--storage", nargs="+", choices=list(STORAGES), default=list(STORAGES), help="Storage modes")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 200], help="DiskANN rescore depths, 0 for server default")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch tables after the run")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    centers = rng.normal(size=(CLUSTERS, args.dim)).astype(np.float32)
+    with psycopg.connect(libpq_url(), autocommit=True) as conn:
+        register_vector(conn)
+        conn.execute("SET hnsw.iterative_scan = strict_order")
+        tables = [BENCH_TABLE]
+        for size in args.sizes:
+            print(f"--- {size} vectors, dim {args.dim} ---")
+            setup_base(conn, size, args.dim, rng, centers)
+            search = synthetic_vectors(args.queries, args.dim, rng, centers)
+            dedup = dedup_queries(conn, args.queries, args.dim, rng)
+            search_truths = exact(conn, search, args.k)
+            dedup_truths = exact(conn, dedup, 1)
+
+            for storage in args.storage:
+                table = setup_storage(conn, storage, args.dim)
+                tables.append(table)
+                query_sql = STORAGES[storage]["query"].format(dim=args.dim)
+                # Rescoring applies to the quantized DiskANN layout only
+                depths = args.rescore if storage == "vector" else [0]
+                for rescore in depths:
+                    set_rescore(conn, storage, rescore)
+                    label = f"{storage} rescore={rescore or 'default'}" if storage == "vector" else storage
+                    samples, recall = bench(conn, table, query_sql, search, search_truths, args.k)
+                    print(summary(f"search {label}", samples) + f"  recall@{args.k} {recall:.3f}")
+                    samples, recall = bench(conn, table, query_sql, dedup, dedup_truths, 1)
+                    print(summary(f"dedup {label}", samples) + f"  top-1 match {recall:.3f}")
+                set_rescore(conn, storage, 0)
+
+        if not args.keep:
+            for table in tables:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Scenario benchmarks of the backend against local fakes of every external
+dependency, see `benchmarks.fakes`:
+  - kindle_import: AddData of Kindle HTML exports, notes per second
+  - find_thoughts: FindThoughts end to end, stub LM, embeddings and dedup
+  - review: GetNextReviewCards and SubmitReviewGrade latency
+  - dedup: nearest thought lookup of new notes against table size
+
+RPCs go through an in-process gRPC server with the real servicers and
+interceptor. The database is a disposable container of `app/database`,
+embeddings are deterministic, so runs on the same machine are comparable.
+Results are written as JSON to `benchmarks/results`, `--compare` prints the
+change from an earlier result and exits with 1 on regressions.
+
+Needs Docker, the generated gRPC code and `moto[server]` (or `--s3-endpoint`).
+Run from the backend directory:
+  python -m benchmarks.suite
+  python -m benchmarks.suite --dedup-sizes 1000,10000 --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from .fakes import STUB_LM_MODEL, DatabaseContainer, FakeEmbeddingServer, FakeS3, StubLM, fake_embedding
+
+# App modules read settings at import, they are imported in the functions
+# below, after the environment points the settings to the fakes.
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+SCENARIOS = ("kindle_import", "find_thoughts", "review", "dedup")
+REGRESSION_THRESHOLD = 0.10 # Relative change reported as regression
+
+
+def configure_env(database: dict, embedding_api_base: str, s3_endpoint: str, fake_s3: bool) -> None:
+    os.environ.update(database)
+    os.environ.update({
+        "EMBEDDING_MODEL": "openai/fake-embedding",
+        "EMBEDDING_API_BASE": embedding_api_base,
+        "EMBEDDING_API_KEY": "fake",
+        "S3_ENDPOINT_URL": s3_endpoint,
+        "LLM_MODEL": STUB_LM_MODEL,
+        "TRACING_EXPORTER": "none",
+        "METRICS_PORT": "0",
+        "LOG_LEVEL_GLOBAL": "WARNING",
+        "LOG_LEVEL_LiteLLM": "WARNING",
+    })
+    if fake_s3:
+        os.environ.update({"S3_ACCESS_KEY": "fake", "S3_SECRET_KEY": "fake"})
+
+def start_server(workers: int):
+    """In-process server with the servicers and interceptor of `server.py`, returns the server and its channel."""
+    from concurrent import futures
+
+    import grpc
+
+    from generated import conscious_api_pb2_grpc
+    from interceptors.logging_timing import LoggingTimingInterceptor
+    from servicers.add_servicer import DataServiceServicer
+    from servicers.find_servicer import FindServiceServicer
+    from servicers.review_servicer import ReviewServiceServicer
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers), interceptors=[LoggingTimingInterceptor()])
+    conscious_api_pb2_grpc.add_FindServiceServicer_to_server(FindServiceServicer(), server)
+    conscious_api_pb2_grpc.add_ReviewServiceServicer_to_server(ReviewServiceServicer(), server)
+    conscious_api_pb2_grpc.add_DataServiceServicer_to_server(DataServiceServicer(), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    return server, grpc.insecure_channel(f"127.0.0.1:{port}")
+
+def latency(samples: list[float], prefix: str = "") -> dict:
+    """p50 and p99 in milliseconds of samples in seconds."""
+    from .common import percentile
+
+    samples_ms = [s * 1000 for s in samples]
+    return {f"{prefix}p50_ms": percentile(samples_ms, 50), f"{prefix}p99_ms": percentile(samples_ms, 99)}
+
+def note_text(run_id: str, *parts) -> str:
+    """Unique note of about 20 words, varied so that embeddings and hashes differ."""
+    words = hashlib.sha256(f"{run_id} {parts}".encode()).hexdigest()
+    return (f"Benchmark {run_id} {' '.join(map(str, parts))}: the note about "
+            f"{' '.join(words[i:i + 6] for i in range(0, 48, 6))} and why it matters.")
+
+
+def bench_kindle_import(channel, run_id: str, books: int, notes: int) -> dict:
+    from generated import conscious_api_pb2, conscious_api_pb2_grpc
+
+    from utils.notes import kindle_html
+
+    stub = conscious_api_pb2_grpc.DataServiceStub(channel)
+    samples = []
+    for book in range(books):
+        title = f"Benchmark book {run_id} {book}"
+        request = conscious_api_pb2.AddDataRequest(
+            task="note",
+            source_type="book",
+            source_identifiers={"title": title},
+            file_content=kindle_html(title, [note_text(run_id, book, i) for i in range(notes)]),
+        )
+        start = time.perf_counter()
+        response = stub.AddData(request)
+        samples.append(time.perf_counter() - start)
+        if not response.success or response.added != notes:
+            raise RuntimeError(f"Import of {title} failed: {response.message}")
+    return {
+        "books": books,
+        "notes_per_book": notes,
+        "notes_per_second": books * notes / sum(samples),
+        **latency(samples, "book_"),
+    }
+
+def bench_find_thoughts(channel, run_id: str, requests: int) -> dict:
+    from generated import conscious_api_pb2, conscious_api_pb2_grpc
+
+    stub = conscious_api_pb2_grpc.FindServiceStub(channel)
+    samples = []
+    for i in range(requests):
+        text = " ".join(note_text(run_id, "article", i, sentence) for sentence in range(5))
+        request = conscious_api_pb2.FindThoughtsRequest(
+            text=text, type="article", identifiers={"title": f"Benchmark article {run_id} {i}"},
+        )
+        start = time.perf_counter()
+        stub.FindThoughts(request)
+        samples.append(time.perf_counter() - start)
+    return {"requests": requests, **latency(samples)}
+
+def bench_review(channel, rounds: int, count: int) -> dict:
+    from generated import conscious_api_pb2, conscious_api_pb2_grpc
+
+    stub = conscious_api_pb2_grpc.ReviewServiceStub(channel)
+    next_samples, grade_samples = [], []
+    for i in range(rounds):
+        start = time.perf_counter()
+        cards = stub.GetNextReviewCards(conscious_api_pb2.GetNextReviewCardsRequest(count=count)).cards
+        next_samples.append(time.perf_counter() - start)
+        for j, card in enumerate(cards):
+            # All grades, so cards move through every FSRS state
+            request = conscious_api_pb2.SubmitReviewGradeRequest(thought_id=card.thought_id, grade=(i + j) % 4 + 1)
+            start = time.perf_counter()
+            stub.SubmitReviewGrade(request)
+            grade_samples.append(time.perf_counter() - start)
+    if not grade_samples:
+        raise RuntimeError("No review cards, run with the kindle_import scenario first")
+    return {
+        "rounds": rounds,
+        "grades": len(grade_samples),
+        **latency(next_samples, "next_cards_"),
+        **latency(grade_samples, "submit_grade_"),
+    }
+
+def load_thoughts(run_id: str, start: int, stop: int, dimension: int) -> None:
+    """Adds synthetic thoughts by COPY, faster than the import path for large tables."""
+    import psycopg
+    from pgvector.psycopg import register_vector
+
+    from .common import libpq_url
+
+    with psycopg.connect(libpq_url()) as conn:
+        register_vector(conn)
+        with conn.cursor() as cursor:
+            with cursor.copy("COPY thoughts (text, text_hash, embedding) FROM STDIN WITH (FORMAT BINARY)") as copy:
+                copy.set_types(["text", "bytea", "vector"])
+                for i in range(start, stop):
+                    text = note_text(run_id, "loaded", i)
+                    copy.write_row((text, hashlib.sha256(text.encode()).digest(), fake_embedding(text, dimension)))
+        conn.execute("ANALYZE thoughts")
+
+def bench_dedup(run_id: str, sizes: list[int], queries: int, dimension: int) -> dict:
+    """Lookup of the nearest thought for new notes, as by ingestion, once the table has each size."""
+    from sqlalchemy import func, select
+
+    from core.config import settings
+    from db.models import Thoughts
+    from db.session import get_db_session
+    from modules.thoughts_services import ThoughtsService
+
+    results = {}
+    loaded = 0
+    for size in sorted(sizes):
+        with get_db_session() as session:
+            rows = session.scalar(select(func.count()).select_from(Thoughts))
+        if rows < size:
+            start = time.perf_counter()
+            load_thoughts(run_id, loaded, loaded + size - rows, dimension)
+            print(f"Loaded {size - rows} thoughts in {time.perf_counter() - start:.1f}s")
+            loaded += size - rows
+            rows = size
+
+        samples = []
+        with get_db_session() as session:
+            service = ThoughtsService(session)
+            for i in range(queries):
+                text = note_text(run_id, "dedup", size, i)
+                start = time.perf_counter()
+                service.find_similar_content(
+                    [text], "thought_id", "text", "thoughts",
+                    distance_max=settings.DUPLICATE_EMBEDDING_DISTANCE_MAX,
+                    embeddings=[fake_embedding(text, dimension)],
+                )
+                samples.append(time.perf_counter() - start)
+        results[str(rows)] = latency(samples)
+    return {"queries": queries, "by_rows": results}
+
+
+def git_commit() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() or "unknown"
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    metrics = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            metrics[f"{prefix}{key}"] = value
+    return metrics
+
+def compare(previous: dict, current: dict) -> int:
+    """Prints changes of latencies and throughputs, returns the number of regressions."""
+    before = flatten(previous["scenarios"])
+    after = flatten(current["scenarios"])
+    print(f"\nCompared to {previous['meta']['commit']} of {previous['meta']['time']}")
+    regressions = 0
+    for name, value in after.items():
+        if name not in before or not before[name]:
+            continue
+        if name.endswith("_ms"):
+            change = value / before[name] - 1
+        elif name.endswith("_per_second"):
+            change = before[name] / value - 1 # Positive when slower, like latencies
+        else:
+            continue
+        flag = ""
+        if change > REGRESSION_THRESHOLD:
+            flag = "REGRESSION"
+            regressions += 1
+        elif change < -REGRESSION_THRESHOLD:
+            flag = "improved"
+        print(f"{name:<50} {before[name]:10.2f} -> {value:10.2f}  {change:+7.1%}  {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated scenarios to run")
+    parser.add_argument("--books", type=int, default=5, help="Kindle exports imported")
+    parser.add_argument("--notes", type=int, default=500, help="Notes per Kindle export")
+    parser.add_argument("--find-requests", type=int, default=50, help="FindThoughts calls")
+    parser.add_argument("--review-rounds", type=int, default=200, help="GetNextReviewCards calls, each card is graded")
+    parser.add_argument("--review-count", type=int, default=10, help="Cards per GetNextReviewCards call")
+    parser.add_argument("--dedup-sizes", default="1000,10000,50000", help="Comma separated table sizes of the dedup scenario")
+    parser.add_argument("--dedup-queries", type=int, default=200, help="Lookups per table size")
+    parser.add_argument("--dimension", type=int, default=1536, help="Dimension of fake embeddings, must match the database")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Seconds added to each embedding request")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds added to each LLM call")
+    parser.add_argument("--workers", type=int, default=10, help="Worker threads of the gRPC server")
+    parser.add_argument("--no-container", action="store_true", help="Use the database of the POSTGRES_* env instead of a container, data is added to it")
+    parser.add_argument("--build", action="store_true", help="Rebuild the database image")
+    parser.add_argument("--s3-endpoint", help="S3 endpoint like MinIO, with S3_ACCESS_KEY and S3_SECRET_KEY in env, instead of moto")
+    parser.add_argument("--output", help="Result file, default benchmarks/results/<time>-<commit>.json")
+    parser.add_argument("--compare", help="Earlier result file to compare with")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    meta = {
+        "commit": git_commit(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+    }
+    results = {}
+    with ExitStack() as stack:
+        database = {} if args.no_container else stack.enter_context(DatabaseContainer(build=args.build)).env()
+        embeddings = stack.enter_context(FakeEmbeddingServer(args.dimension, latency=args.embedding_latency))
+        s3_endpoint = args.s3_endpoint or stack.enter_context(FakeS3()).endpoint_url
+        configure_env(database, embeddings.api_base, s3_endpoint, fake_s3=not args.s3_endpoint)
+
+        import dspy
+
+        import modules.find_thoughts # Configures its LM at import, replaced by the stub
+        from utils.embeddings import init_vector_dimension
+
+        dimension = init_vector_dimension()
+        dspy.settings.configure(lm=StubLM(latency=args.llm_latency))
+        server, channel = start_server(args.workers)
+        stack.callback(server.stop, None)
+        stack.callback(channel.close)
+
+        run_id = uuid.uuid4().hex[:8]
+        for scenario in scenarios:
+            start = time.perf_counter()
+            if scenario == "kindle_import":
+                results[scenario] = bench_kindle_import(channel, run_id, args.books, args.notes)
+            elif scenario == "find_thoughts":
+                results[scenario] = bench_find_thoughts(channel, run_id, args.find_requests)
+            elif scenario == "review":
+                results[scenario] = bench_review(channel, args.review_rounds, args.review_count)
+            elif scenario == "dedup":
+                sizes = [int(s) for s in args.dedup_sizes.split(",")]
+                results[scenario] = bench_dedup(run_id, sizes, args.dedup_queries, dimension)
+            print(f"{scenario:<16} {time.perf_counter() - start:8.1f} s  {json.dumps(results[scenario])}")
+        meta["embedding_requests"] = embeddings.requests
+
+    current = {"meta": meta, "scenarios": results}
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{meta['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), current)
+        if regressions:
+            print(f"{regressions} metrics regressed by more than {REGRESSION_THRESHOLD:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
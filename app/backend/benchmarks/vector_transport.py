@@ -0,0 +1,115 @@
+"""
+Benchmark vector bind and parse cost, and memory per vector: list of floats with
+text literals vs float32 NumPy arrays with the binary format.
+
+Before: embeddings as `list[float]` from the JSON response, bound as text
+literal `'[0.1,0.2,...]'` and read back by parsing the text.
+After: embeddings as float32 arrays, bound and read in the binary format.
+
+Without database the adapters are timed in process, with `--db` a scratch
+table is written and read with both formats.
+
+Run from the backend directory:
+  python -m benchmarks.vector_transport --rounds 2000
+  python -m benchmarks.vector_transport --db --rows 2000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+from pgvector import Vector
+
+from .common import summary
+
+BENCH_TABLE = "bench_vector_transport"
+
+
+def timed(function, rounds: int) -> list[float]:
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def allocated(function) -> int:
+    """Bytes still allocated by the result of `function`."""
+    tracemalloc.start()
+    result = function()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+def bench_in_process(dim: int, rounds: int, rng: np.random.Generator) -> None:
+    array = rng.normal(size=dim).astype(np.float32)
+    values = array.tolist()
+    response_json = json.dumps({"embedding": values})
+    text_literal = Vector(values).to_text()
+    binary = Vector(array).to_binary()
+
+    print(summary("response -> list[float]", timed(lambda: json.loads(response_json)["embedding"], rounds)))
+    print(summary("response -> float32 array", timed(lambda: np.asarray(json.loads(response_json)["embedding"], dtype=np.float32), rounds)))
+    print(summary("bind list[float] as text", timed(lambda: Vector(values).to_text(), rounds)))
+    print(summary("bind float32 array as binary", timed(lambda: Vector(array).to_binary(), rounds)))
+    print(summary("parse text to array", timed(lambda: Vector.from_text(text_literal).to_numpy(), rounds)))
+    print(summary("parse binary to array", timed(lambda: Vector.from_binary(binary).to_numpy(), rounds)))
+
+    print(f"{'memory list[float]':<40} {allocated(lambda: json.loads(response_json)['embedding']):>10} bytes")
+    print(f"{'memory float32 array':<40} {allocated(lambda: np.asarray(values, dtype=np.float32)):>10} bytes")
+    print(f"{'size text literal':<40} {len(text_literal):>10} bytes")
+    print(f"{'size binary':<40} {len(binary):>10} bytes")
+
+def bench_db(dim: int, rows: int, rng: np.random.Generator) -> None:
+    import psycopg
+    from pgvector.psycopg import register_vector
+
+    from .common import libpq_url
+
+    arrays = rng.normal(size=(rows, dim)).astype(np.float32)
+    lists = arrays.tolist()
+    with psycopg.connect(libpq_url(), autocommit=True) as conn:
+        register_vector(conn)
+        conn.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        conn.execute(f"CREATE TABLE {BENCH_TABLE} (id BIGSERIAL PRIMARY KEY, embedding VECTOR({dim}))")
+        try:
+            with conn.cursor() as cursor:
+                start = time.perf_counter()
+                cursor.executemany(
+                    f"INSERT INTO {BENCH_TABLE} (embedding) VALUES (%s::vector)",
+                    [(Vector(values).to_text(),) for values in lists],
+                )
+                print(f"{'insert text literals':<40} {time.perf_counter() - start:8.3f} s for {rows} rows")
+
+                start = time.perf_counter()
+                cursor.executemany(f"INSERT INTO {BENCH_TABLE} (embedding) VALUES (%b)", [(array,) for array in arrays])
+                print(f"{'insert binary arrays':<40} {time.perf_counter() - start:8.3f} s for {rows} rows")
+
+            for binary in (False, True):
+                with conn.cursor(binary=binary) as cursor:
+                    start = time.perf_counter()
+                    cursor.execute(f"SELECT embedding FROM {BENCH_TABLE}")
+                    fetched = cursor.fetchall()
+                    label = "select binary" if binary else "select text"
+                    print(f"{label:<40} {time.perf_counter() - start:8.3f} s for {len(fetched)} rows")
+        finally:
+            conn.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=1536, help="Vector dimension")
+    parser.add_argument("--rounds", type=int, default=2000, help="Rounds per in-process case")
+    parser.add_argument("--db", action="store_true", help="Also write and read a scratch table")
+    parser.add_argument("--rows", type=int, default=2000, help="Rows of the scratch table")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    bench_in_process(args.dim, args.rounds, rng)
+    if args.db:
+        bench_db(args.dim, args.rows, rng)
+
+
+if __name__ == "__main__":
+    main()
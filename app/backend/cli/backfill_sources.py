@@ -0,0 +1,53 @@
+"""
+Backfill the `sources` table from existing Source vertices.
+
+Run once after `migrations/002-sources-table.sql`, from the backend directory:
+  python -m cli.backfill_sources
+
+Vertices whose keys share the same canonical form are reported, the one
+with the lowest vertex ID is used for lookups.
+"""
+import json
+import logging
+
+from sqlalchemy.dialects.postgresql import insert
+
+from db.models import Sources
+from db.session import get_graph_session
+from utils.helpers import execute_cypher, canonical_source_keys, source_hash
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_sources() -> int:
+    """Adds missing rows of existing Source vertices, returns number of rows added."""
+    with get_graph_session() as session:
+        rows = execute_cypher(session, "MATCH (v:Source) RETURN id(v), v.keys ORDER BY id(v)", columns=2)
+
+        by_hash = {}
+        for vertex_id, keys in rows:
+            keys = canonical_source_keys(json.loads(keys) if keys else {})
+            if not keys.get('type'):
+                logger.warning(f"Skipping Source vertex {vertex_id} without type in keys: {keys}")
+                continue
+            hash_value = source_hash(keys)
+            if hash_value in by_hash:
+                logger.warning(f"Source vertex {vertex_id} duplicates vertex {by_hash[hash_value]['vertex_id']}, keys {keys}")
+                continue
+            by_hash[hash_value] = {
+                "source_hash": hash_value,
+                "vertex_id": int(vertex_id),
+                "source_type": keys['type'],
+                "keys": keys,
+            }
+
+        if not by_hash:
+            return 0
+        stmt = insert(Sources).values(list(by_hash.values())).on_conflict_do_nothing()
+        added = session.execute(stmt).rowcount
+        logger.info(f"Sources backfill: {len(rows)} vertices, {added} rows added.")
+        return added
+
+
+if __name__ == "__main__":
+    backfill_sources()
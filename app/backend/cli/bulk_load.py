@@ -0,0 +1,288 @@
+"""
+Bulk load thoughts from JSONL or Parquet files, for migrating existing knowledge bases.
+
+Fields of each record:
+  - text: content of the thought
+  - embedding: optional, generated if missing
+  - source: optional dict of source keys including `type`, default to `--source`
+
+Records are processed in chunks, one transaction each, so memory is bounded by
+the chunk size however large the file is. A chunk is written by binary COPY into
+a temporary staging table, then deduplicated and merged into `thoughts`, the graph
+and the link tables with set-based statements.
+
+Run from the backend directory:
+  python -m cli.bulk_load notes.jsonl --source '{"type": "website", "url": "https://example.com"}'
+  python -m cli.bulk_load export.parquet --chunk-size 5000
+
+Parquet files need the `pyarrow` package.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from db.session import get_graph_session
+from enums import ThoughtType
+from modules.thoughts_services import ThoughtsService
+from utils.embeddings import get_embeddings, init_vector_dimension
+from utils.helpers import execute_cypher, canonical_source_keys, text_hash
+from utils.vectors import collapse_near_duplicates, storage_sql, set_ann_search, truncate_embeddings
+
+logger = logging.getLogger(__name__)
+
+STAGING_TABLE = "bulk_staging"
+
+
+def read_records(path: str, batch_size: int) -> Iterator[dict]:
+    """Streams records of a JSONL or Parquet file."""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Loading Parquet files requires the `pyarrow` package.") from e
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def chunked(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    iterator = iter(records)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class BulkLoader:
+    def __init__(self, task: ThoughtType = ThoughtType.note, default_source: Optional[dict] = None, chunk_size: int = 10_000):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self.task = task
+        self.default_source = default_source
+        self.chunk_size = chunk_size
+        self.line_no = 0 # Record number in the file, across chunks
+
+    def _prepare(self, records: List[dict], counts: Dict[str, int]) -> List[dict]:
+        """Validates records, and generates missing embeddings of the chunk in one call."""
+        rows = []
+        for record in records:
+            self.line_no += 1
+            content = record.get("text")
+            source = record.get("source") or self.default_source
+            if isinstance(source, str):
+                source = json.loads(source)
+            keys = canonical_source_keys(source) if source else {}
+            embedding = record.get("embedding")
+
+            if not content or not isinstance(content, str):
+                logger.warning(f"Skipping record {self.line_no}: empty text")
+            elif not keys.get("type"):
+                logger.warning(f"Skipping record {self.line_no}: source keys without type")
+            elif embedding is not None and len(embedding) < settings.VECTOR_DIMENSION:
+                logger.warning(f"Skipping record {self.line_no}: embedding dimension {len(embedding)} < {settings.VECTOR_DIMENSION}")
+            else:
+                if embedding is not None and len(embedding) > settings.VECTOR_DIMENSION:
+                    # Same shape as generated embeddings, which come truncated
+                    embedding = truncate_embeddings(np.asarray(embedding, dtype=np.float32)[np.newaxis], settings.VECTOR_DIMENSION)[0]
+                rows.append({"line_no": self.line_no, "text": content, "keys": keys, "embedding": embedding})
+                continue
+            counts["skipped"] += 1
+
+        missing = [row for row in rows if row["embedding"] is None]
+        if missing:
+            embeddings = asyncio.run(get_embeddings([row["text"] for row in missing]))
+            for row, embedding in zip(missing, embeddings):
+                row["embedding"] = embedding
+            counts["embedded"] += len(missing)
+        return rows
+
+    def _stage(self, session: Session, rows: List[dict], vertex_ids: List[int]) -> None:
+        """Creates the staging table for this transaction and fills it by binary COPY."""
+        vectors = np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+        # Near duplicates within the chunk point to their representative row
+        representatives = collapse_near_duplicates(
+            vectors,
+            distance_max=settings.DUPLICATE_EMBEDDING_DISTANCE_MAX,
+            block_size=settings.DEDUP_BLOCK_SIZE,
+        )
+
+        session.execute(text(f"""
+            CREATE TEMP TABLE {STAGING_TABLE} (
+                line_no BIGINT PRIMARY KEY,
+                representative BIGINT NOT NULL,
+                text TEXT NOT NULL,
+                text_hash BYTEA NOT NULL,
+                embedding VECTOR({settings.VECTOR_DIMENSION}) NOT NULL,
+                vertex_id BIGINT NOT NULL,
+                thought_id BIGINT,
+                is_new BOOLEAN NOT NULL DEFAULT false
+            ) ON COMMIT DROP
+        """))
+
+        # Vector type is registered on the engine connections, see `db.session`
+        driver_connection = session.connection().connection.driver_connection
+        with driver_connection.cursor() as cursor:
+            with cursor.copy(
+                f"COPY {STAGING_TABLE} (line_no, representative, text, text_hash, embedding, vertex_id) FROM STDIN WITH (FORMAT BINARY)"
+            ) as copy:
+                copy.set_types(["int8", "int8", "text", "bytea", "vector", "int8"])
+                for row, representative, vector, vertex_id in zip(rows, representatives, vectors, vertex_ids):
+                    copy.write_row((
+                        row["line_no"],
+                        rows[int(representative)]["line_no"],
+                        row["text"],
+                        text_hash(row["text"]),
+                        vector,
+                        vertex_id,
+                    ))
+
+    def _merge(self, session: Session) -> List[int]:
+        """Resolves each staged row to an existing or new thought. Returns IDs of the new thoughts."""
+        # Exact duplicates of stored thoughts
+        session.execute(text(f"""
+            UPDATE {STAGING_TABLE} s SET thought_id = t.thought_id
+            FROM thoughts t
+            WHERE t.text_hash = s.text_hash
+        """))
+
+        # Near duplicates of stored thoughts, one ANN lookup per representative row
+        set_ann_search(session)
+        staged = storage_sql("s.embedding")
+        session.execute(text(f"""
+            WITH nearest AS (
+                SELECT s.line_no, n.thought_id
+                FROM {STAGING_TABLE} s
+                CROSS JOIN LATERAL (
+                    SELECT t.thought_id, (t.embedding <=> {staged}) AS distance
+                    FROM thoughts t
+                    ORDER BY t.embedding <=> {staged}
+                    LIMIT 1
+                ) n
+                WHERE s.thought_id IS NULL AND s.line_no = s.representative AND n.distance <= :distance_max
+            )
+            UPDATE {STAGING_TABLE} s SET thought_id = nearest.thought_id
+            FROM nearest
+            WHERE s.line_no = nearest.line_no
+        """), {"distance_max": settings.DUPLICATE_EMBEDDING_DISTANCE_MAX})
+
+        # New thoughts
+        session.execute(text(f"""
+            WITH inserted AS (
+                INSERT INTO thoughts (text, text_hash, embedding)
+                SELECT text, text_hash, embedding
+                FROM {STAGING_TABLE}
+                WHERE thought_id IS NULL AND line_no = representative
+                ORDER BY line_no
+                ON CONFLICT (text_hash) DO NOTHING
+                RETURNING thought_id, text_hash
+            )
+            UPDATE {STAGING_TABLE} s SET thought_id = inserted.thought_id, is_new = true
+            FROM inserted
+            WHERE s.text_hash = inserted.text_hash AND s.thought_id IS NULL
+        """))
+
+        # Same text inserted by another representative of this chunk
+        session.execute(text(f"""
+            UPDATE {STAGING_TABLE} s SET thought_id = t.thought_id
+            FROM thoughts t
+            WHERE s.thought_id IS NULL AND t.text_hash = s.text_hash AND s.line_no = s.representative
+        """))
+
+        # Near duplicates within the chunk take the thought of their representative
+        session.execute(text(f"""
+            UPDATE {STAGING_TABLE} s SET thought_id = r.thought_id
+            FROM {STAGING_TABLE} r
+            WHERE s.thought_id IS NULL AND r.line_no = s.representative
+        """))
+
+        return list(session.execute(text(
+            f"SELECT DISTINCT thought_id FROM {STAGING_TABLE} WHERE is_new ORDER BY thought_id"
+        )).scalars())
+
+    def _link(self, session: Session, service: ThoughtsService, new_thought_ids: List[int]) -> None:
+        """Creates vertices of new thoughts, links thoughts to sources, records notes of the sources."""
+        if new_thought_ids:
+            cypher_query_thoughts = """
+            UNWIND $thought_ids AS thought_id
+            CREATE (t:Thought {pg_table_id: thought_id})
+            RETURN count(t)
+            """
+            execute_cypher(session, cypher_query_thoughts, {"thought_ids": new_thought_ids})
+
+        by_source = defaultdict(list)
+        for vertex_id, thought_id in session.execute(text(
+            f"SELECT DISTINCT vertex_id, thought_id FROM {STAGING_TABLE}"
+        )).all():
+            by_source[vertex_id].append(thought_id)
+        for vertex_id, thought_ids in by_source.items():
+            service.link_thoughts(thought_ids, [vertex_id], self.task)
+
+        session.execute(text(f"""
+            INSERT INTO source_notes (vertex_id, text_hash, thought_id)
+            SELECT DISTINCT ON (vertex_id, text_hash) vertex_id, text_hash, thought_id
+            FROM {STAGING_TABLE}
+            ORDER BY vertex_id, text_hash, line_no
+            ON CONFLICT DO NOTHING
+        """))
+
+    def load_chunk(self, records: List[dict], counts: Dict[str, int]) -> None:
+        rows = self._prepare(records, counts)
+        if not rows:
+            return
+
+        with get_graph_session() as session:
+            service = ThoughtsService(session)
+            # Sources are few compared to thoughts, get or create each once
+            vertex_by_keys = {}
+            for row in rows:
+                key = json.dumps(row["keys"], sort_keys=True)
+                if key not in vertex_by_keys:
+                    vertex_by_keys[key] = service.add_source(keys=row["keys"])
+            vertex_ids = [vertex_by_keys[json.dumps(row["keys"], sort_keys=True)] for row in rows]
+
+            self._stage(session, rows, vertex_ids)
+            new_thought_ids = self._merge(session)
+            self._link(session, service, new_thought_ids)
+
+        counts["loaded"] += len(rows)
+        counts["added"] += len(new_thought_ids)
+
+    def run(self, path: str) -> Dict[str, int]:
+        start_time = time.time()
+        init_vector_dimension()
+        counts = {"loaded": 0, "added": 0, "skipped": 0, "embedded": 0}
+        for chunk in chunked(read_records(path, self.chunk_size), self.chunk_size):
+            self.load_chunk(chunk, counts)
+            logger.info(f"Bulk load progress: {self.line_no} records read, {counts}")
+        logger.info(f"Bulk loaded {path} in {time.time() - start_time:.4f} seconds: {counts}")
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="JSONL or Parquet file")
+    parser.add_argument("--source", type=json.loads, help="Default source keys as JSON, for records without `source`")
+    parser.add_argument("--task", choices=[t.name for t in ThoughtType], default=ThoughtType.note.name, help="Task of the thoughts")
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="Records per transaction")
+    args = parser.parse_args()
+
+    BulkLoader(
+        task=ThoughtType[args.task],
+        default_source=args.source,
+        chunk_size=args.chunk_size,
+    ).run(args.path)
+
+
+if __name__ == "__main__":
+    main()
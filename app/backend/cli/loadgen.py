@@ -0,0 +1,367 @@
+"""
+Load generator of the gRPC APIs: `ReviewService`, `FindService` and `DataService`.
+
+A scenario file (TOML, see `cli/scenarios`) sets the mix of operations and the load:
+  - closed loop: `concurrency` clients, each sends a request when its previous one returned
+  - open loop: requests start at `rate` per second whatever the latency, on
+    `concurrency` senders. Starts queue while all senders wait for responses,
+    latency is taken from the scheduled start and the `timeout` counts from it
+    too, so a stalled server shows up as latency and timeouts instead of fewer
+    requests. A start queued beyond the timeout is recorded as DEADLINE_EXCEEDED
+    without being sent.
+
+Operations, picked by `weight`:
+  - review: GetNextReviewCards of `count` cards, then SubmitReviewGrade of each
+  - import: AddData of a Kindle HTML export of `notes` new notes
+  - find: FindThoughts of a text of `sentences` sentences
+  - search: SearchThoughts of a few words, in `mode` semantic or hybrid
+
+Latencies are recorded per RPC in HDR histograms, 1 us to 1 hour at 3 significant
+digits. In soak mode, `soak_interval` seconds, throughput, error rate, p99 and the
+resident memory of the server, from its Prometheus metrics, are reported every
+interval and appended as JSON lines to `--soak-log`.
+
+Needs the `hdrhistogram` package. Run from the backend directory:
+  python -m cli.loadgen cli/scenarios/review_import.toml --target localhost:50051
+  python -m cli.loadgen cli/scenarios/soak.toml --duration 21600 --soak-log soak.jsonl
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import tomllib
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import grpc
+
+from generated import conscious_api_pb2, conscious_api_pb2_grpc
+from utils.notes import kindle_html
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_MAX_US = 3_600_000_000
+PERCENTILES = (50, 90, 99, 99.9)
+WORDS = (
+    "memory attention habit context review spacing recall note idea source book chapter argument evidence "
+    "model pattern question answer practice insight language structure system change reason learning"
+).split()
+RSS_METRIC = re.compile(r"^process_resident_memory_bytes\s+(\S+)$", re.M)
+
+
+def _histogram():
+    try:
+        from hdrh.histogram import HdrHistogram
+    except ImportError as e:
+        raise RuntimeError("Load generator requires the `hdrhistogram` package.") from e
+    return HdrHistogram(1, HISTOGRAM_MAX_US, 3)
+
+def _sentence(rng: random.Random, tag: str) -> str:
+    return f"{tag} " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))) + "."
+
+def server_rss(metrics_url: Optional[str]) -> Optional[int]:
+    """Resident memory of the server in bytes, from its metrics endpoint."""
+    if not metrics_url:
+        return None
+    try:
+        with urllib.request.urlopen(metrics_url, timeout=5) as response:
+            match = RSS_METRIC.search(response.read().decode())
+        return int(float(match.group(1))) if match else None
+    except OSError as e:
+        logger.warning(f"Failed to read server metrics: {e}")
+        return None
+
+
+class Recorder:
+    """Latency histograms and status codes per RPC, for the whole run and the current interval."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total: Dict[str, object] = {}
+        self.interval: Dict[str, object] = {}
+        self.codes: Counter = Counter() # (rpc, code) -> calls
+        self.interval_codes: Counter = Counter()
+        self.record_from = 0.0 # End of the warmup, by `time.perf_counter`
+
+    def record(self, rpc: str, seconds: float, code: grpc.StatusCode) -> None:
+        if time.perf_counter() < self.record_from:
+            return
+        value = min(max(int(seconds * 1_000_000), 1), HISTOGRAM_MAX_US)
+        with self.lock:
+            for histograms in (self.total, self.interval):
+                if rpc not in histograms:
+                    histograms[rpc] = _histogram()
+                histograms[rpc].record_value(value)
+            self.codes[rpc, code.name] += 1
+            self.interval_codes[rpc, code.name] += 1
+
+    def take_interval(self) -> tuple:
+        """Histograms and codes since the last call, merged over RPCs."""
+        merged = _histogram()
+        with self.lock:
+            for histogram in self.interval.values():
+                merged.add(histogram)
+                histogram.reset()
+            codes, self.interval_codes = self.interval_codes, Counter()
+        return merged, codes
+
+
+class Client:
+    """Stubs over a few channels, and timing of calls into a recorder."""
+
+    def __init__(self, target: str, channels: int, timeout: float, recorder: Recorder):
+        # A local subchannel pool per channel, so each one opens its own connection
+        self.channels = [
+            grpc.insecure_channel(target, options=[("grpc.use_local_subchannel_pool", 1)]) for _ in range(channels)
+        ]
+        self.timeout = timeout
+        self.recorder = recorder
+        self.next_channel = 0
+
+    def stubs(self) -> dict:
+        channel = self.channels[self.next_channel % len(self.channels)]
+        self.next_channel += 1
+        return {
+            "review": conscious_api_pb2_grpc.ReviewServiceStub(channel),
+            "find": conscious_api_pb2_grpc.FindServiceStub(channel),
+            "data": conscious_api_pb2_grpc.DataServiceStub(channel),
+        }
+
+    def call(self, rpc: str, method: Callable, request, start: Optional[float] = None):
+        """Calls and records the RPC, returns the response or None on error. The timeout counts from `start`."""
+        start = start or time.perf_counter()
+        timeout = self.timeout - (time.perf_counter() - start)
+        try:
+            if timeout <= 0:
+                # Queued past its timeout, it would not have returned in time
+                response, code = None, grpc.StatusCode.DEADLINE_EXCEEDED
+            else:
+                response = method(request, timeout=timeout)
+                code = grpc.StatusCode.OK
+        except grpc.RpcError as e:
+            response = None
+            code = e.code()
+        self.recorder.record(rpc, time.perf_counter() - start, code)
+        return response
+
+    def close(self) -> None:
+        for channel in self.channels:
+            channel.close()
+
+
+def op_review(client: Client, stubs: dict, rng: random.Random, params: dict, start: float) -> None:
+    review = stubs["review"]
+    response = client.call(
+        "GetNextReviewCards", review.GetNextReviewCards,
+        conscious_api_pb2.GetNextReviewCardsRequest(count=params.get("count", 5)), start,
+    )
+    for card in response.cards if response else []:
+        client.call(
+            "SubmitReviewGrade", review.SubmitReviewGrade,
+            conscious_api_pb2.SubmitReviewGradeRequest(thought_id=card.thought_id, grade=rng.randint(1, 4)),
+        )
+
+def op_import(client: Client, stubs: dict, rng: random.Random, params: dict, start: float) -> None:
+    tag = uuid.uuid4().hex[:12] # New notes in each import
+    title = f"Load test book {tag}"
+    notes = [_sentence(rng, f"{tag}-{i}") for i in range(params.get("notes", 100))]
+    request = conscious_api_pb2.AddDataRequest(
+        task="note", source_type="book", source_identifiers={"title": title}, file_content=kindle_html(title, notes, authors="Load test"),
+    )
+    client.call("AddData", stubs["data"].AddData, request, start)
+
+def op_find(client: Client, stubs: dict, rng: random.Random, params: dict, start: float) -> None:
+    tag = uuid.uuid4().hex[:12]
+    text = " ".join(_sentence(rng, tag) for _ in range(params.get("sentences", 5)))
+    request = conscious_api_pb2.FindThoughtsRequest(text=text, type="article", identifiers={"title": f"Load test article {tag}"})
+    client.call("FindThoughts", stubs["find"].FindThoughts, request, start)
+
+def op_search(client: Client, stubs: dict, rng: random.Random, params: dict, start: float) -> None:
+    mode = conscious_api_pb2.SEARCH_MODE_HYBRID if params.get("mode") == "hybrid" else conscious_api_pb2.SEARCH_MODE_SEMANTIC
+    request = conscious_api_pb2.SearchThoughtsRequest(
+        query=" ".join(rng.sample(WORDS, 3)), limit=params.get("limit", 10), mode=mode,
+    )
+    client.call("SearchThoughts", stubs["find"].SearchThoughts, request, start)
+
+OPERATIONS = {
+    "review": op_review,
+    "import": op_import,
+    "find": op_find,
+    "search": op_search,
+}
+
+
+class LoadGenerator:
+    """Runs a scenario against a server, see the module docstring for the scenario keys."""
+
+    def __init__(self, scenario: dict, target: str, soak_log: Optional[str] = None):
+        self.mode = scenario.get("mode", "closed")
+        self.rate = float(scenario.get("rate", 10))
+        self.arrival = scenario.get("arrival", "uniform")
+        self.concurrency = int(scenario.get("concurrency", 8))
+        self.duration = float(scenario.get("duration", 60))
+        self.warmup = float(scenario.get("warmup", 0))
+        self.soak_interval = float(scenario.get("soak_interval", 0))
+        self.metrics_url = scenario.get("metrics_url")
+        self.seed = scenario.get("seed", 0)
+        self.soak_log = soak_log
+        self.operations = scenario.get("operations") or []
+        if self.mode not in ("closed", "open"):
+            raise ValueError(f"Unknown mode: {self.mode}")
+        for operation in self.operations:
+            if operation.get("kind") not in OPERATIONS:
+                raise ValueError(f"Unknown operation: {operation.get('kind')}, one of {', '.join(OPERATIONS)}")
+        if not self.operations:
+            raise ValueError("Scenario has no operations")
+
+        self.recorder = Recorder()
+        self.client = Client(target, int(scenario.get("channels", 4)), float(scenario.get("timeout", 60)), self.recorder)
+        self.weights = [float(operation.get("weight", 1)) for operation in self.operations]
+        self.stop = threading.Event()
+        self.rss: List[int] = []
+
+    def _run_one(self, rng: random.Random, start: float) -> None:
+        operation = rng.choices(self.operations, weights=self.weights)[0]
+        OPERATIONS[operation["kind"]](self.client, self.client.stubs(), rng, operation, start)
+
+    def _closed_loop(self, worker: int, end: float) -> None:
+        rng = random.Random(f"{self.seed}-{worker}")
+        while not self.stop.is_set() and time.perf_counter() < end:
+            self._run_one(rng, time.perf_counter())
+
+    def _open_loop(self, end: float) -> None:
+        rng = random.Random(self.seed)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="loadgen") as pool:
+            next_start = time.perf_counter()
+            while not self.stop.is_set() and next_start < end:
+                delay = next_start - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                # Queued while all senders are busy, not skipped, see the module docstring
+                pool.submit(self._run_one, random.Random(rng.random()), next_start)
+                next_start += rng.expovariate(self.rate) if self.arrival == "poisson" else 1 / self.rate
+
+    def _report_interval(self, interval: float) -> None:
+        histogram, codes = self.recorder.take_interval()
+        calls = sum(codes.values())
+        errors = sum(count for (_, code), count in codes.items() if code != "OK")
+        rss = server_rss(self.metrics_url)
+        if rss is not None:
+            self.rss.append(rss)
+        point = {
+            "time": time.time(),
+            "rps": calls / interval,
+            "error_rate": errors / calls if calls else 0.0,
+            "p99_ms": histogram.get_value_at_percentile(99) / 1000,
+            "server_rss_bytes": rss,
+            "errors": {f"{rpc} {code}": count for (rpc, code), count in codes.items() if code != "OK"},
+        }
+        rss_text = f"  server RSS {rss / 2 ** 20:8.1f} MiB" if rss is not None else ""
+        print(f"{time.strftime('%H:%M:%S')}  {point['rps']:8.1f} rps  errors {point['error_rate']:6.2%}"
+              f"  p99 {point['p99_ms']:9.2f} ms{rss_text}", flush=True)
+        if self.soak_log:
+            with open(self.soak_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(point) + "\n")
+
+    def _soak(self) -> None:
+        last = time.perf_counter()
+        while not self.stop.wait(self.soak_interval):
+            now = time.perf_counter()
+            self._report_interval(now - last)
+            last = now
+
+    def run(self) -> dict:
+        start = time.perf_counter()
+        end = start + self.warmup + self.duration
+        self.recorder.record_from = start + self.warmup
+        if self.soak_interval > 0:
+            rss = server_rss(self.metrics_url)
+            if rss is not None:
+                self.rss.append(rss)
+            threading.Thread(target=self._soak, name="loadgen-soak", daemon=True).start()
+
+        logger.info(f"{self.mode} loop for {self.duration:.0f}s after {self.warmup:.0f}s warmup, concurrency {self.concurrency}")
+        try:
+            if self.mode == "open":
+                self._open_loop(end)
+            else:
+                workers = [
+                    threading.Thread(target=self._closed_loop, args=(i, end), name=f"loadgen-{i}", daemon=True)
+                    for i in range(self.concurrency)
+                ]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+        except KeyboardInterrupt:
+            logger.warning("Interrupted, reporting results so far")
+        finally:
+            self.stop.set()
+            self.client.close()
+        return self.summary(min(time.perf_counter(), end) - start - self.warmup)
+
+    def summary(self, seconds: float) -> dict:
+        rpcs = {}
+        for rpc, histogram in sorted(self.recorder.total.items()):
+            calls = sum(count for (name, _), count in self.recorder.codes.items() if name == rpc)
+            rpcs[rpc] = {
+                "calls": calls,
+                "rps": calls / seconds if seconds > 0 else 0.0,
+                "errors": {code: count for (name, code), count in self.recorder.codes.items() if name == rpc and code != "OK"},
+                "mean_ms": histogram.get_mean_value() / 1000,
+                **{f"p{p:g}_ms": histogram.get_value_at_percentile(p) / 1000 for p in PERCENTILES},
+                "max_ms": histogram.get_max_value() / 1000,
+                "histogram": histogram.encode().decode(), # Compressed HDR histogram, to merge or plot
+            }
+        result = {"seconds": seconds, "rpcs": rpcs}
+        if self.rss:
+            result["server_rss_bytes"] = {"first": self.rss[0], "last": self.rss[-1], "max": max(self.rss)}
+        return result
+
+
+def print_summary(summary: dict) -> None:
+    print(f"\n{'RPC':<20} {'calls':>8} {'rps':>8} {'errors':>7} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'p99.9':>9} {'max':>9}  (ms)")
+    for rpc, stats in summary["rpcs"].items():
+        print(f"{rpc:<20} {stats['calls']:>8} {stats['rps']:>8.1f} {sum(stats['errors'].values()):>7}"
+              f" {stats['mean_ms']:>9.2f} {stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} {stats['p99_ms']:>9.2f}"
+              f" {stats['p99.9_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+        for code, count in stats["errors"].items():
+            print(f"  {code}: {count}")
+    if "server_rss_bytes" in summary:
+        rss = summary["server_rss_bytes"]
+        print(f"Server RSS {rss['first'] / 2 ** 20:.1f} MiB -> {rss['last'] / 2 ** 20:.1f} MiB, max {rss['max'] / 2 ** 20:.1f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", help="Scenario TOML file")
+    parser.add_argument("--target", default="localhost:50051", help="Server address")
+    parser.add_argument("--duration", type=float, help="Seconds, overrides the scenario")
+    parser.add_argument("--rate", type=float, help="Requests per second of the open loop, overrides the scenario")
+    parser.add_argument("--concurrency", type=int, help="Overrides the scenario")
+    parser.add_argument("--metrics-url", help="Prometheus metrics of the server, for its memory, like http://localhost:9464/metrics")
+    parser.add_argument("--soak-log", help="JSON lines file of soak intervals")
+    parser.add_argument("--output", help="JSON file of the summary, with encoded histograms")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    with open(args.scenario, "rb") as f:
+        scenario = tomllib.load(f)
+    for key in ("duration", "rate", "concurrency", "metrics_url"):
+        if getattr(args, key) is not None:
+            scenario[key] = getattr(args, key)
+
+    summary = LoadGenerator(scenario, args.target, soak_log=args.soak_log).run()
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"scenario": scenario, "target": args.target, **summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
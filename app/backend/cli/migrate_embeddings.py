@@ -0,0 +1,308 @@
+"""
+Change the dimension or model of stored embeddings online.
+
+Embeddings are written in batches to a shadow column `embedding_new`, then an
+index is built on it concurrently, and the columns and indexes are swapped in one
+short transaction that only renames. Reads and writes keep working until the swap.
+Between the swap and the restart of the backend with the new `VECTOR_DIMENSION`
+(and model), adding thoughts and `halfvec` searches fail on the dimension: keep
+that window short, restart right after the swap.
+
+Modes:
+  - truncate: keep the leading dimensions and renormalize, in SQL. For Matryoshka
+    models, no embedding calls. A trigger keeps new rows in sync until the swap.
+  - reembed: embed all texts again, for a new model or a larger dimension.
+    Rows added during the backfill are caught up before the swap, without locks.
+    The swap gives up its lock and catches up again while rows are missing.
+
+Progress is kept in `job_watermarks`, an interrupted run continues where it stopped.
+Related thoughts are recomputed after the swap.
+
+Run from the backend directory:
+  python -m cli.migrate_embeddings --dimension 512
+  python -m cli.migrate_embeddings --dimension 1024 --mode reembed --model openai/text-embedding-3-large
+  python -m cli.migrate_embeddings --abort
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from db.session import engine, get_db_session
+from utils.embeddings import get_embeddings, get_column_dimension
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "migrate_embeddings"
+SHADOW_COLUMN = "embedding_new"
+SHADOW_INDEX = "idx_thoughts_embedding_new"
+SHADOW_TRIGGER = "thoughts_embedding_shadow"
+LOCK_TIMEOUT = "5s" # Give up on schema changes instead of queueing behind long queries
+SWAP_ATTEMPTS = 10 # Catch-ups before the swap, while thoughts keep being added without embeddings
+
+
+class EmbeddingMigration:
+    def __init__(
+        self,
+        dimension: int,
+        mode: str = "truncate",
+        model: str = settings.EMBEDDING_MODEL,
+        api_base: str = settings.EMBEDDING_API_BASE,
+        api_key: str = settings.EMBEDDING_API_KEY,
+        batch_size: int = 500,
+    ):
+        if dimension <= 0 or batch_size <= 0:
+            raise ValueError("dimension and batch_size must be positive")
+        if mode not in ("truncate", "reembed"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.dimension = dimension
+        self.mode = mode
+        self.model = model
+        self.api_base = api_base
+        self.api_key = api_key
+        self.batch_size = batch_size
+
+        storage = "HALFVEC" if settings.EMBEDDING_STORAGE == "halfvec" else "VECTOR"
+        self.column_type = f"{storage}({dimension})"
+        if settings.EMBEDDING_STORAGE == "halfvec":
+            self.index_method = f"USING hnsw ({SHADOW_COLUMN} halfvec_cosine_ops)"
+        else:
+            self.index_method = f"USING diskann ({SHADOW_COLUMN} vector_cosine_ops) WITH (storage_layout = memory_optimized)"
+
+    def _truncated_sql(self, column: str = "embedding") -> str:
+        return f"l2_normalize(subvector({column}, 1, {self.dimension}))"
+
+    def prepare(self) -> None:
+        """Adds the shadow column, and for truncation the trigger filling it on writes."""
+        shadow_dimension = get_column_dimension("thoughts", SHADOW_COLUMN)
+        if shadow_dimension is not None:
+            if shadow_dimension != self.dimension:
+                raise ValueError(f"Shadow column has dimension {shadow_dimension}, abort the previous migration first")
+            logger.info("Shadow column exists, continuing the migration.")
+            return
+
+        current_dimension = get_column_dimension()
+        if self.mode == "truncate" and self.dimension > current_dimension:
+            raise ValueError(f"Cannot truncate {current_dimension} dimensions to {self.dimension}, use mode reembed")
+
+        with get_db_session() as session:
+            session.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+            session.execute(text(f"ALTER TABLE thoughts ADD COLUMN {SHADOW_COLUMN} {self.column_type}"))
+            if self.mode == "truncate":
+                session.execute(text(f"""
+                    CREATE OR REPLACE FUNCTION {SHADOW_TRIGGER}() RETURNS trigger AS $$
+                    BEGIN
+                        NEW.{SHADOW_COLUMN} := {self._truncated_sql("NEW.embedding")};
+                        RETURN NEW;
+                    END
+                    $$ LANGUAGE plpgsql
+                """))
+                session.execute(text(f"""
+                    CREATE TRIGGER {SHADOW_TRIGGER}
+                    BEFORE INSERT OR UPDATE OF embedding ON thoughts
+                    FOR EACH ROW EXECUTE FUNCTION {SHADOW_TRIGGER}()
+                """))
+            session.execute(
+                text("""
+                    INSERT INTO job_watermarks (job_name, last_id) VALUES (:job_name, 0)
+                    ON CONFLICT (job_name) DO UPDATE SET last_id = 0, updated_at = now()
+                """),
+                {"job_name": JOB_NAME},
+            )
+        logger.info(f"Shadow column {SHADOW_COLUMN} {self.column_type} added.")
+
+    def _fill(self, session: Session, thought_ids_sql: str, params: dict) -> list[int]:
+        """Fills the shadow column of the selected thoughts, returns their IDs."""
+        if self.mode == "truncate":
+            return list(session.execute(text(f"""
+                UPDATE thoughts SET {SHADOW_COLUMN} = {self._truncated_sql()}
+                WHERE thought_id IN ({thought_ids_sql})
+                RETURNING thought_id
+            """), params).scalars())
+
+        rows = session.execute(text(f"""
+            SELECT thought_id, text FROM thoughts
+            WHERE thought_id IN ({thought_ids_sql})
+            ORDER BY thought_id
+        """), params).all()
+        if not rows:
+            return []
+        embeddings = asyncio.run(get_embeddings(
+            [row[1] for row in rows], self.model, self.api_base, self.api_key, dimension=self.dimension,
+        ))
+        session.execute(
+            text(f"UPDATE thoughts SET {SHADOW_COLUMN} = :embedding WHERE thought_id = :thought_id"),
+            [{"thought_id": row[0], "embedding": embedding} for row, embedding in zip(rows, embeddings)],
+        )
+        return [row[0] for row in rows]
+
+    def backfill(self) -> int:
+        """Fills the shadow column in batches by thought ID, one transaction per batch. Returns number of rows filled."""
+        start_time = time.time()
+        filled = 0
+        while True:
+            with get_db_session() as session:
+                last_id = session.execute(
+                    text("SELECT last_id FROM job_watermarks WHERE job_name = :job_name FOR UPDATE"),
+                    {"job_name": JOB_NAME},
+                ).scalar_one()
+                thought_ids = self._fill(
+                    session,
+                    "SELECT thought_id FROM thoughts WHERE thought_id > :last_id ORDER BY thought_id LIMIT :limit",
+                    {"last_id": last_id, "limit": self.batch_size},
+                )
+                if not thought_ids:
+                    break
+                session.execute(
+                    text("UPDATE job_watermarks SET last_id = :last_id, updated_at = now() WHERE job_name = :job_name"),
+                    {"last_id": max(thought_ids), "job_name": JOB_NAME},
+                )
+            filled += len(thought_ids)
+            logger.info(f"Backfilled {filled} thoughts, up to ID {max(thought_ids)}")
+
+        filled += self.catch_up()
+        logger.info(f"Backfill done: {filled} thoughts in {time.time() - start_time:.1f} seconds")
+        return filled
+
+    def catch_up(self) -> int:
+        """Fills the shadow column of thoughts without it, until none is left. Returns number of rows filled."""
+        filled = 0
+        while True:
+            with get_db_session() as session:
+                thought_ids = self._fill(
+                    session,
+                    f"SELECT thought_id FROM thoughts WHERE {SHADOW_COLUMN} IS NULL ORDER BY thought_id LIMIT :limit",
+                    {"limit": self.batch_size},
+                )
+            if not thought_ids:
+                return filled
+            filled += len(thought_ids)
+            logger.info(f"Caught up {filled} thoughts added during the migration")
+
+    def build_index(self) -> None:
+        """Builds the index of the shadow column without blocking writes."""
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            valid = connection.execute(
+                text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:index)"),
+                {"index": SHADOW_INDEX},
+            ).scalar_one_or_none()
+            if valid:
+                logger.info(f"Index {SHADOW_INDEX} exists.")
+                return
+            if valid is False:
+                # Left by an interrupted concurrent build
+                connection.execute(text(f"DROP INDEX CONCURRENTLY {SHADOW_INDEX}"))
+
+            start_time = time.time()
+            connection.execute(text(f"CREATE INDEX CONCURRENTLY {SHADOW_INDEX} ON thoughts {self.index_method}"))
+            logger.info(f"Index {SHADOW_INDEX} built in {time.time() - start_time:.1f} seconds")
+
+    def _lock_caught_up(self, session: Session) -> bool:
+        """Locks the table for the swap, False with the lock given up if thoughts without shadow embeddings are left."""
+        session.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        session.execute(text("LOCK TABLE thoughts IN ACCESS EXCLUSIVE MODE"))
+        if self.mode == "truncate":
+            # Rows of transactions older than the trigger, filled in SQL without embedding calls
+            self._fill(session, f"SELECT thought_id FROM thoughts WHERE {SHADOW_COLUMN} IS NULL", {})
+            return True
+        missing = session.execute(text(f"SELECT EXISTS (SELECT 1 FROM thoughts WHERE {SHADOW_COLUMN} IS NULL)")).scalar_one()
+        if missing:
+            session.rollback() # No embedding calls under the lock
+        return not missing
+
+    def swap(self) -> None:
+        """Replaces the embedding column and index by the shadow ones."""
+        with get_db_session() as session:
+            for attempt in range(SWAP_ATTEMPTS):
+                if self._lock_caught_up(session):
+                    break
+                logger.info(f"Thoughts added since the catch-up, catching up again ({attempt + 1}/{SWAP_ATTEMPTS})")
+                self.catch_up()
+            else:
+                raise RuntimeError(f"Thoughts are added faster than caught up, swap not done after {SWAP_ATTEMPTS} attempts")
+
+            session.execute(text(f"DROP TRIGGER IF EXISTS {SHADOW_TRIGGER} ON thoughts"))
+            session.execute(text(f"DROP FUNCTION IF EXISTS {SHADOW_TRIGGER}()"))
+            session.execute(text("DROP INDEX IF EXISTS idx_thoughts_embedding"))
+            session.execute(text("ALTER TABLE thoughts DROP COLUMN embedding"))
+            session.execute(text(f"ALTER TABLE thoughts RENAME COLUMN {SHADOW_COLUMN} TO embedding"))
+            session.execute(text(f"ALTER INDEX {SHADOW_INDEX} RENAME TO idx_thoughts_embedding"))
+            # Checked for new rows now, validated for existing rows below without blocking
+            session.execute(text(
+                "ALTER TABLE thoughts ADD CONSTRAINT thoughts_embedding_not_null CHECK (embedding IS NOT NULL) NOT VALID"
+            ))
+
+            # Neighbors by the old embeddings are stale, all are computed again
+            session.execute(text("TRUNCATE thought_neighbors"))
+            session.execute(text(
+                "INSERT INTO related_thoughts_queue (thought_id) SELECT thought_id FROM thoughts ON CONFLICT DO NOTHING"
+            ))
+            session.execute(text("DELETE FROM job_watermarks WHERE job_name = :job_name"), {"job_name": JOB_NAME})
+        logger.warning(f"Swapped in embeddings of dimension {self.dimension}. Restart the backend now with VECTOR_DIMENSION={self.dimension}, "
+                       "adding thoughts fails until then.")
+
+        with get_db_session() as session:
+            session.execute(text("ALTER TABLE thoughts VALIDATE CONSTRAINT thoughts_embedding_not_null"))
+        with get_db_session() as session:
+            # Uses the validated constraint instead of scanning the table
+            session.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+            session.execute(text("ALTER TABLE thoughts ALTER COLUMN embedding SET NOT NULL"))
+            session.execute(text("ALTER TABLE thoughts DROP CONSTRAINT thoughts_embedding_not_null"))
+
+    def run(self, swap: bool = True) -> None:
+        self.prepare()
+        self.backfill()
+        self.build_index()
+        if swap:
+            # Catch up rows added during the index build, outside the swap lock
+            self.catch_up()
+            self.swap()
+
+    @staticmethod
+    def abort() -> None:
+        """Removes the shadow column, index and trigger of an unfinished migration."""
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {SHADOW_INDEX}"))
+        with get_db_session() as session:
+            session.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+            session.execute(text(f"DROP TRIGGER IF EXISTS {SHADOW_TRIGGER} ON thoughts"))
+            session.execute(text(f"DROP FUNCTION IF EXISTS {SHADOW_TRIGGER}()"))
+            session.execute(text(f"ALTER TABLE thoughts DROP COLUMN IF EXISTS {SHADOW_COLUMN}"))
+            session.execute(text("DELETE FROM job_watermarks WHERE job_name = :job_name"), {"job_name": JOB_NAME})
+        logger.info("Embedding migration aborted.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dimension", type=int, help="New embedding dimension")
+    parser.add_argument("--mode", choices=["truncate", "reembed"], default="truncate", help="How to compute new embeddings")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL, help="Embedding model for mode reembed")
+    parser.add_argument("--api-base", default=settings.EMBEDDING_API_BASE, help="Embedding API base for mode reembed")
+    parser.add_argument("--api-key", default=settings.EMBEDDING_API_KEY, help="Embedding API key for mode reembed")
+    parser.add_argument("--batch-size", type=int, default=500, help="Thoughts per batch and transaction")
+    parser.add_argument("--no-swap", action="store_true", help="Stop after the index build, run again to swap")
+    parser.add_argument("--abort", action="store_true", help="Remove the shadow column of an unfinished migration")
+    args = parser.parse_args()
+
+    if args.abort:
+        EmbeddingMigration.abort()
+        return
+    if not args.dimension:
+        parser.error("--dimension is required")
+
+    EmbeddingMigration(
+        dimension=args.dimension,
+        mode=args.mode,
+        model=args.model,
+        api_base=args.api_base,
+        api_key=args.api_key,
+        batch_size=args.batch_size,
+    ).run(swap=not args.no_swap)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""
+Update precomputed related thoughts for thoughts added since the last run.
+
+Run from the backend directory:
+  python -m cli.related_thoughts
+"""
+from modules.related_thoughts import RelatedThoughts
+
+
+if __name__ == "__main__":
+    RelatedThoughts().run()
@@ -0,0 +1,32 @@
+"""
+Sync a local vault of Markdown files, for example an Obsidian vault.
+
+Run from the backend directory:
+  python -m cli.vault_sync /path/to/vault            # One-shot scan
+  python -m cli.vault_sync /path/to/vault --watch    # Scan, then sync on file changes
+"""
+import argparse
+
+from core.config import settings
+from modules.vault_sync import VaultSync
+from utils.embeddings import init_vector_dimension
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("vault_dir", help="Vault directory")
+    parser.add_argument("--name", help="Vault name used in source keys, default to the directory name")
+    parser.add_argument("--watch", action="store_true", help="Keep watching for changes after the scan")
+    parser.add_argument("--debounce", type=float, default=settings.VAULT_DEBOUNCE_SECONDS, help="Seconds without file events before syncing")
+    args = parser.parse_args()
+
+    init_vector_dimension()
+    vault = VaultSync(args.vault_dir, vault_name=args.name)
+    if args.watch:
+        vault.watch(debounce_seconds=args.debounce)
+    else:
+        vault.sync()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import logging
+from typing import Dict, Literal
 from pydantic import field_validator, computed_field, ValidationError, Field
 from pydantic_settings import BaseSettings
 
@@ -7,6 +8,28 @@ class Settings(BaseSettings):
     LOG_LEVEL_GLOBAL: str = "INFO"
     LOG_LEVEL_LiteLLM: str = "INFO"
 
+    # Metrics
+    METRICS_PORT: int = 9464 # HTTP port of Prometheus metrics of the server, 0 to disable
+
+    # Admission control, see `interceptors.admission`. Per pool of RPCs: calls running at most, and calls waiting at most before RESOURCE_EXHAUSTED
+    POOL_INTERACTIVE_CONCURRENCY: int = 8 # Review, search, config and other quick RPCs
+    POOL_INTERACTIVE_QUEUE: int = 32
+    POOL_INFERENCE_CONCURRENCY: int = 4 # FindThoughts, bound by the LLM
+    POOL_INFERENCE_QUEUE: int = 8
+    POOL_INGEST_CONCURRENCY: int = 2 # AddData, bound by embeddings and dedup
+    POOL_INGEST_QUEUE: int = 4
+    POOL_QUEUE_TIMEOUT_SECONDS: float = 10.0 # Wait for a slot at most, or until the deadline of the call if sooner
+
+    # Tracing
+    TRACING_EXPORTER: Literal["none", "file", "otlp"] = "none" # Where spans are exported, see `core.tracing`
+    TRACING_FILE: str = "/tmp/conscious-traces.jsonl" # Spans as JSON lines, for exporter `file`
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4317" # Collector, for exporter `otlp`
+    TRACING_SAMPLE_RATIO: float = 0.1 # Share of traces recorded, unless the client decided
+
+    # Usage ledger
+    USAGE_LEDGER: bool = True # Record LLM and embedding calls in table `inference_usage`
+    USAGE_FLUSH_SECONDS: float = 5.0 # Delay before queued usage rows are written, to batch them
+
     # DB Connection
     POSTGRES_DB: str
     POSTGRES_USER: str
@@ -16,12 +39,24 @@ class Settings(BaseSettings):
 
     # DB others
     GRAPH_NAME: str = "conscious_graph"
-    VECTOR_DIMENSION: int = 1536 # TO-DO: maybe get dimension from model data directly?
+    VECTOR_DIMENSION: int = 0 # Dimension of stored embeddings, 0 for the model's dimension detected at startup, or the dimension of the database column. Below the model's dimension embeddings are truncated, for Matryoshka models.
+    SOURCE_CACHE_SIZE: int = 1024 # Number of recent sources kept in process, 0 to disable
+    EMBEDDING_STORAGE: Literal["vector", "halfvec"] = "vector" # Column type of embeddings, `halfvec` halves the table size. Must match the database.
+    DISKANN_QUERY_RESCORE: int = 0 # Candidates rescored with full vectors after the quantized DiskANN search, 0 for server default
 
     # Embedding (default to OpenAI compatible API)
     EMBEDDING_MODEL: str = "openai/Alibaba-NLP/gte-Qwen2-1.5B-instruct"
     EMBEDDING_API_BASE: str = "http://localhost:7997/"
     EMBEDDING_API_KEY: str = 'no_key'
+    EMBEDDING_CACHE_SIZE: int = 1024 # Number of query embeddings kept in process, 0 to disable
+    EMBEDDING_BATCH_SIZE: int = 64 # Texts per request to the embedding server, larger calls are split
+    EMBEDDING_CONCURRENCY: int = 8 # Requests in flight to the embedding server, see `core.lanes`
+    EMBEDDING_BULK_SHARE: float = 0.5 # Share of EMBEDDING_CONCURRENCY imports may take, the rest is kept for queries
+    EMBEDDING_BACKEND: Literal["api", "local"] = "api" # `local` runs EMBEDDING_MODEL, a sentence-transformers model, in a worker process on CPU, see `utils.local_embeddings`
+    EMBEDDING_LOCAL_RUNTIME: Literal["torch", "onnx"] = "torch" # Runtime of the local model, `onnx` needs `sentence-transformers[onnx]`
+    EMBEDDING_LOCAL_THREADS: int = 0 # CPU threads of the local model, 0 for the runtime default
+    EMBEDDING_LOCAL_MAX_BATCH: int = 128 # Texts of concurrent requests encoded together at most
+    EMBEDDING_LOCAL_MAX_WAIT_MS: float = 2.0 # Wait for more requests to join a batch
 
     # LLM (default to Gemini)
     LLM_MODEL: str = "gemini/learnlm-1.5-pro-experimental"
@@ -36,8 +71,33 @@ class Settings(BaseSettings):
     S3_ACCESS_KEY: str
     S3_SECRET_KEY: str
 
+    # Provider gateway of LLM and embedding calls, see `core.gateway`
+    PROVIDER_RATE_LIMITS: Dict[str, float] = {} # Requests per second by model, as JSON like {"openai/text-embedding-3-small": 50}. Models not listed are not limited
+    PROVIDER_RATE_BURST_SECONDS: float = 1.0 # Requests of this many seconds at the rate may start at once
+    PROVIDER_RETRIES: int = 3 # Retries of rate limited, timed out and server errors
+    PROVIDER_RETRY_BASE_SECONDS: float = 0.5 # Backoff ceiling before the first retry, doubled each retry, with full jitter
+    PROVIDER_RETRY_MAX_SECONDS: float = 20.0
+    PROVIDER_BREAKER_WINDOW: int = 20 # Recent attempts the circuit breaker looks at
+    PROVIDER_BREAKER_FAILURES: int = 5 # Failed attempts of the window that open the circuit, calls then fail fast
+    PROVIDER_BREAKER_FAILURE_RATIO: float = 0.5 # ... if also at least this share of the window
+    PROVIDER_BREAKER_RESET_SECONDS: float = 30.0 # Open circuit lets a probe call through after this
+
+    # Search
+    SEARCH_HYBRID_CANDIDATES: int = 50 # Results taken from each of full-text and vector search before fusion
+    SEARCH_RRF_K: int = 60 # Reciprocal rank fusion constant
+    SEARCH_FULLTEXT_SCAN_MAX: int = 5000 # Full-text matches ranked at most, bounds cost of common terms. Matches beyond it are not ranked.
+
+    # Related thoughts
+    RELATED_THOUGHTS_K: int = 10 # Neighbors kept per thought
+    RELATED_THOUGHTS_BATCH_SIZE: int = 100 # Thoughts per kNN batch and transaction
+    RELATED_THOUGHTS_INTERVAL_SECONDS: int = 900 # Interval of the scheduled update in server, 0 to disable
+
+    # Vault sync
+    VAULT_DEBOUNCE_SECONDS: float = 2.0 # Quiet period after file events before the watcher syncs
+
     # Experimental parameters
     DUPLICATE_EMBEDDING_DISTANCE_MAX: float = 0.05 # Consider duplicate if embedding cosine distance below
+    DEDUP_BLOCK_SIZE: int = 1024 # Rows per block of the in-batch similarity matrix, bounds memory
 
     # Validator for LOG_LEVEL
     @field_validator('LOG_LEVEL_GLOBAL', 'LOG_LEVEL_LiteLLM', mode='before')
@@ -0,0 +1,161 @@
+"""
+Deadline and cancellation of a call, passed from the servicer down the pipeline.
+
+`CallDeadline.from_context` follows the gRPC call: it is cancelled once the
+client goes away, and expires at the client's deadline. Stages `check` it
+before expensive work. Waits for models are cut short by `run` and `call`,
+which raise `CallCancelled` as soon as the call is cancelled or expires, the
+transaction of the caller is then rolled back by `get_db_session`. Statements
+ended by the `statement_timeout` of the deadline are mapped to it by `stopped_error`,
+once, where the RPC status is set.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from psycopg.errors import QueryCanceled
+
+CANCELLED = "cancelled"
+DEADLINE_EXCEEDED = "deadline_exceeded"
+UNBOUNDED_SECONDS = 86400 # Time remaining reported by gRPC for calls without deadline is far beyond
+
+
+class CallCancelled(Exception):
+    """The call was cancelled by the client, or its deadline passed."""
+
+    def __init__(self, reason: str, stage: str):
+        self.reason = reason
+        self.stage = stage
+        super().__init__(f"Call {'cancelled by the client' if reason == CANCELLED else 'deadline exceeded'} at {stage}")
+
+
+def stopped_error(e: BaseException, stage: str) -> Optional[CallCancelled]:
+    """`CallCancelled` of an error that stopped the call, a statement ended by `statement_timeout` included. None for other errors."""
+    if isinstance(e, CallCancelled):
+        return e
+    if isinstance(getattr(e, "orig", e), QueryCanceled): # Wrapped by SQLAlchemy
+        return CallCancelled(DEADLINE_EXCEEDED, stage)
+    return None
+
+
+class CallDeadline:
+    """Cancellation state and deadline of a call, a call without either never stops."""
+
+    def __init__(self, expires_at: Optional[float] = None):
+        self.expires_at = expires_at # By `time.monotonic`
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._waiters: List[Callable[[], None]] = []
+
+    @classmethod
+    def from_context(cls, context) -> "CallDeadline":
+        """Deadline of a gRPC call, cancelled when the call terminates."""
+        remaining = context.time_remaining()
+        bounded = remaining is not None and remaining < UNBOUNDED_SECONDS
+        deadline = cls(time.monotonic() + remaining if bounded else None)
+        # Runs once the RPC terminates for any reason, only a call still in progress is affected
+        context.add_callback(deadline.cancel)
+        return deadline
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, None without deadline."""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            waiters, self._waiters = self._waiters, []
+        for wake in waiters:
+            wake()
+
+    def _error(self, stage: str) -> CallCancelled:
+        # gRPC also terminates the call once the deadline passes
+        return CallCancelled(CANCELLED if self.cancelled and self.remaining() != 0 else DEADLINE_EXCEEDED, stage)
+
+    def check(self, stage: str) -> None:
+        """Raises `CallCancelled` if the call should stop before `stage`."""
+        if self.cancelled or self.remaining() == 0:
+            raise self._error(stage)
+
+    def _add_waiter(self, wake: Callable[[], None]) -> None:
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._waiters.append(wake)
+                return
+        wake()
+
+    def _remove_waiter(self, wake: Callable[[], None]) -> None:
+        with self._lock:
+            if wake in self._waiters:
+                self._waiters.remove(wake)
+
+    async def _guarded(self, awaitable: Awaitable, stage: str) -> Any:
+        loop = asyncio.get_running_loop()
+        stopped = loop.create_future()
+
+        def wake():
+            try:
+                loop.call_soon_threadsafe(lambda: stopped.done() or stopped.set_result(None))
+            except RuntimeError:
+                pass # Loop closed, the wait is over
+
+        task = asyncio.ensure_future(awaitable)
+        self._add_waiter(wake)
+        try:
+            done, _ = await asyncio.wait({task, stopped}, timeout=self.remaining(), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._remove_waiter(wake)
+        if task in done:
+            return task.result()
+
+        # Cancels the HTTP requests of the model client
+        task.cancel()
+        await asyncio.wait({task}, timeout=1)
+        raise self._error(stage)
+
+    def run(self, awaitable: Awaitable, stage: str) -> Any:
+        """Runs a coroutine to completion, or cancels it once the call is cancelled or expires."""
+        self.check(stage)
+        return asyncio.run(self._guarded(awaitable, stage))
+
+    def call(self, function: Callable, *args, stage: str, **kwargs) -> Any:
+        """
+        Runs a blocking function, like a DSPy program, on a daemon thread and waits for
+        its result until the call is cancelled or expires. A blocking HTTP request can
+        not be interrupted, the thread is then left to finish and its result dropped.
+        """
+        self.check(stage)
+        result = concurrent.futures.Future()
+        stopped = concurrent.futures.Future()
+        context = contextvars.copy_context() # Keeps the current span and usage context
+
+        def target():
+            try:
+                result.set_result(context.run(function, *args, **kwargs))
+            except BaseException as e:
+                result.set_exception(e)
+
+        def wake():
+            if not stopped.done():
+                stopped.set_result(None)
+
+        self._add_waiter(wake)
+        try:
+            threading.Thread(target=target, name=f"call-{stage}", daemon=True).start()
+            concurrent.futures.wait([result, stopped], timeout=self.remaining(), return_when=concurrent.futures.FIRST_COMPLETED)
+        finally:
+            self._remove_waiter(wake)
+        if result.done():
+            return result.result()
+        raise self._error(stage)
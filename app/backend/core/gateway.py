@@ -0,0 +1,259 @@
+"""
+Provider gateway in front of LLM and embedding calls, one per model:
+  - token bucket rate limit, `PROVIDER_RATE_LIMITS` requests per second by model
+  - retries of rate limited, timed out and server errors, exponential backoff with full jitter
+  - circuit breaker: once most of the recent attempts failed, calls fail fast with
+    `ProviderUnavailable`, until a probe call succeeds after `PROVIDER_BREAKER_RESET_SECONDS`
+
+Used by `utils.embeddings.get_embeddings` and the DSPy LM of `modules.find_thoughts`,
+circuit states are reported by the health service.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import litellm
+
+from core import metrics
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Provider clients of litellm retry twice by default, `max_retries=0` of a call is
+# not honored for embeddings, retries are owned by the gateway
+litellm.DEFAULT_MAX_RETRIES = 0
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+CIRCUIT_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+RETRY_AFTER_MAX_SECONDS = 60 # Longer waits asked by the provider are cut to this
+
+
+class ProviderUnavailable(Exception):
+    """The provider of a model is failing, the call was not made or all retries failed."""
+
+    def __init__(self, model: str, message: str, retry_after: float = 0):
+        self.model = model
+        self.retry_after = retry_after
+        super().__init__(f"Provider of {model} unavailable: {message}")
+
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, (litellm.exceptions.APIConnectionError, litellm.exceptions.Timeout)):
+        return True
+    return getattr(e, "status_code", None) in RETRYABLE_STATUS
+
+def _retry_after(e: Exception) -> Optional[float]:
+    """Seconds asked by the `Retry-After` header of the provider, if any."""
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return min(float(headers.get("retry-after")), RETRY_AFTER_MAX_SECONDS)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Requests per second with a burst, a request may take a token ahead and wait for it."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(burst, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token, returns seconds to wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class CircuitBreaker:
+    """
+    Opens once `failures` of the last `window` attempts failed, at least `ratio` of them,
+    so scattered errors under concurrency do not open it but an outage does quickly.
+    """
+
+    def __init__(self, model: str, failures: int, ratio: float, window: int, reset_seconds: float):
+        self.model = model
+        self.failures_min = max(failures, 1)
+        self.ratio = ratio
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=max(window, self.failures_min)) # True for a failed attempt
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+        metrics.PROVIDER_CIRCUIT_STATE.labels(model).set(CIRCUIT_STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit of {self.model}: {self.state} -> {state}")
+            self.state = state
+            metrics.PROVIDER_CIRCUIT_STATE.labels(self.model).set(CIRCUIT_STATE_VALUES[state])
+
+    def allow(self) -> Tuple[float, bool]:
+        """
+        Returns 0 if a call may go, else seconds until the circuit lets a probe through,
+        and whether the call is the probe. A probe must end with `success`, `failure` or `release`.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return 0.0, False
+            wait = self.opened_at + self.reset_seconds - time.monotonic()
+            if wait > 0 or self.probing:
+                return max(wait, 1.0), False
+            # One probe call at a time while half open
+            self._set_state(HALF_OPEN)
+            self.probing = True
+            return 0.0, True
+
+    def success(self) -> None:
+        with self.lock:
+            self.outcomes.append(False)
+            self.probing = False
+            self._set_state(CLOSED)
+
+    def failure(self) -> None:
+        with self.lock:
+            self.outcomes.append(True)
+            self.probing = False
+            failures = sum(self.outcomes)
+            if self.state == HALF_OPEN or (failures >= self.failures_min and failures >= self.ratio * len(self.outcomes)):
+                self.outcomes.clear()
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self) -> None:
+        """Ends a probe without result, like a cancelled call."""
+        with self.lock:
+            self.probing = False
+
+
+class ProviderGateway:
+    """Rate limit, retries and circuit breaker of one model."""
+
+    def __init__(self, model: str):
+        self.model = model
+        rate = settings.PROVIDER_RATE_LIMITS.get(model, 0)
+        self.bucket = TokenBucket(rate, rate * settings.PROVIDER_RATE_BURST_SECONDS) if rate > 0 else None
+        self.breaker = CircuitBreaker(
+            model,
+            failures=settings.PROVIDER_BREAKER_FAILURES,
+            ratio=settings.PROVIDER_BREAKER_FAILURE_RATIO,
+            window=settings.PROVIDER_BREAKER_WINDOW,
+            reset_seconds=settings.PROVIDER_BREAKER_RESET_SECONDS,
+        )
+
+    @property
+    def state(self) -> str:
+        return self.breaker.state
+
+    def _admit(self) -> Tuple[float, bool]:
+        """Checks the circuit, returns seconds to wait for the rate limit, and whether the attempt is the probe."""
+        retry_after, probe = self.breaker.allow()
+        if retry_after:
+            metrics.PROVIDER_REJECTED.labels(self.model).inc()
+            raise ProviderUnavailable(self.model, "circuit open", retry_after)
+        if self.bucket is None:
+            return 0.0, probe
+        wait = self.bucket.reserve()
+        metrics.PROVIDER_RATE_LIMIT_WAIT.labels(self.model).observe(wait)
+        return wait, probe
+
+    def _abandon(self, probe: bool) -> None:
+        """Ends an attempt without result, like a cancelled one."""
+        if probe:
+            self.breaker.release()
+
+    def _backoff(self, e: Exception, attempt: int, probe: bool) -> Optional[float]:
+        """Records a failed attempt, returns seconds before the retry, None to raise."""
+        if not is_retryable(e):
+            # A bad request says nothing about the health of the provider
+            self._abandon(probe)
+            return None
+        self.breaker.failure()
+        if attempt >= settings.PROVIDER_RETRIES or self.breaker.state == OPEN:
+            return None
+        metrics.PROVIDER_RETRIES.labels(self.model).inc()
+        ceiling = min(settings.PROVIDER_RETRY_MAX_SECONDS, settings.PROVIDER_RETRY_BASE_SECONDS * 2 ** attempt)
+        delay = max(random.uniform(0, ceiling), _retry_after(e) or 0)
+        logger.warning(f"Retrying {self.model} in {delay:.2f}s, attempt {attempt + 1}: {type(e).__name__}: {e}")
+        return delay
+
+    def _unavailable(self, e: Exception) -> ProviderUnavailable:
+        return ProviderUnavailable(self.model, f"{type(e).__name__}: {e}", _retry_after(e) or 0)
+
+    async def acall(self, function: Callable, *args, **kwargs) -> Any:
+        """Awaits `function(*args, **kwargs)` through the gateway."""
+        attempt = 0
+        while True:
+            wait, probe = self._admit()
+            try:
+                await asyncio.sleep(wait)
+                result = await function(*args, **kwargs)
+            except Exception as e:
+                delay = self._backoff(e, attempt, probe)
+                if delay is None:
+                    if is_retryable(e):
+                        raise self._unavailable(e) from e
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled, a probe must not keep the circuit half open
+                self._abandon(probe)
+                raise
+            self.breaker.success()
+            return result
+
+    def call(self, function: Callable, *args, **kwargs) -> Any:
+        """Calls `function(*args, **kwargs)` through the gateway, blocking."""
+        attempt = 0
+        while True:
+            wait, probe = self._admit()
+            try:
+                time.sleep(wait)
+                result = function(*args, **kwargs)
+            except Exception as e:
+                delay = self._backoff(e, attempt, probe)
+                if delay is None:
+                    if is_retryable(e):
+                        raise self._unavailable(e) from e
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self._abandon(probe)
+                raise
+            self.breaker.success()
+            return result
+
+
+_gateways: Dict[str, ProviderGateway] = {}
+_gateways_lock = threading.Lock()
+
+
+def gateway(model: str) -> ProviderGateway:
+    """Gateway of a model, created on first use."""
+    with _gateways_lock:
+        if model not in _gateways:
+            _gateways[model] = ProviderGateway(model)
+        return _gateways[model]
+
+def provider_states() -> Dict[str, str]:
+    """Circuit state by model, of models called so far."""
+    with _gateways_lock:
+        return {model: gateway.state for model, gateway in _gateways.items()}
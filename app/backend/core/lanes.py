@@ -0,0 +1,118 @@
+"""
+Priority lanes of embedding requests, so queries do not wait behind imports.
+
+Work runs in the lane of `embedding_lane`, `interactive` by default: single
+thoughts, dedup of FindThoughts and search queries. Imports run in `bulk`.
+Requests to the embedding server take a slot of `LaneScheduler`: waiting
+interactive requests get free slots before waiting bulk ones, and bulk holds
+at most `EMBEDDING_BULK_SHARE` of the slots, so the rest stay free for queries.
+Bulk calls are split into requests of `EMBEDDING_BATCH_SIZE` texts by
+`utils.embeddings.get_embeddings`, a query waits for one request at most.
+
+Each call of `get_embeddings` runs its own event loop on the thread of the
+RPC, so the scheduler is thread safe and wakes waiters on their own loop.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Tuple
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK) # By priority
+
+_embedding_lane: ContextVar[str] = ContextVar("embedding_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def embedding_lane(lane: str):
+    """Embedding requests made inside run in `lane`."""
+    if lane not in LANES:
+        raise ValueError(f"Unknown embedding lane '{lane}', expected one of: {', '.join(LANES)}")
+    token = _embedding_lane.set(lane)
+    try:
+        yield
+    finally:
+        _embedding_lane.reset(token)
+
+def current_lane() -> str:
+    return _embedding_lane.get()
+
+
+class LaneScheduler:
+    """`concurrency` slots shared by the lanes, see the module docstring."""
+
+    def __init__(self, concurrency: int, bulk_share: float):
+        self.concurrency = max(concurrency, 1)
+        self.limits = {
+            INTERACTIVE: self.concurrency,
+            BULK: min(max(math.floor(self.concurrency * bulk_share), 1), self.concurrency),
+        }
+        self.active = {lane: 0 for lane in LANES}
+        self.waiters: Dict[str, Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {lane: deque() for lane in LANES}
+        self.lock = threading.Lock()
+        for lane in LANES:
+            metrics.EMBEDDING_LANE_LIMIT.labels(lane).set(self.limits[lane])
+            metrics.EMBEDDING_LANE_ACTIVE.labels(lane).set_function(lambda lane=lane: self.active[lane])
+            metrics.EMBEDDING_LANE_QUEUED.labels(lane).set_function(lambda lane=lane: len(self.waiters[lane]))
+
+    def _free(self, lane: str) -> bool:
+        return sum(self.active.values()) < self.concurrency and self.active[lane] < self.limits[lane]
+
+    def _dispatch(self) -> None:
+        """Grants free slots to waiters by lane priority. Called with the lock held."""
+        for lane in LANES:
+            while self.waiters[lane] and self._free(lane):
+                loop, future = self.waiters[lane].popleft()
+                self.active[lane] += 1
+                try:
+                    loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+                except RuntimeError:
+                    self.active[lane] -= 1 # Loop of the waiter closed
+
+    async def acquire(self, lane: str) -> None:
+        with self.lock:
+            # Waiters of the lane, and of lanes before it, go first
+            ahead = any(self.waiters[other] for other in LANES[:LANES.index(lane) + 1])
+            if not ahead and self._free(lane):
+                self.active[lane] += 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            self.waiters[lane].append((asyncio.get_running_loop(), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self.lock:
+                try:
+                    self.waiters[lane].remove((asyncio.get_running_loop(), future))
+                    granted = False
+                except ValueError:
+                    granted = True
+            if granted:
+                self.release(lane)
+            raise
+
+    def release(self, lane: str) -> None:
+        with self.lock:
+            self.active[lane] -= 1
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, lane: str):
+        """Holds a slot of `lane` inside."""
+        start_time = time.perf_counter()
+        await self.acquire(lane)
+        metrics.EMBEDDING_LANE_WAIT_SECONDS.labels(lane).observe(time.perf_counter() - start_time)
+        try:
+            yield
+        finally:
+            self.release(lane)
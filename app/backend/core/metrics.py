@@ -0,0 +1,145 @@
+"""
+Prometheus metrics of the gRPC server, served on `METRICS_PORT`.
+
+RPC metrics are recorded by `interceptors.logging_timing.LoggingTimingInterceptor`,
+admission pool metrics by `interceptors.admission.AdmissionInterceptor`,
+provider metrics by `core.gateway`, embedding lane metrics by `core.lanes`.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = tuple(4 ** i for i in range(3, 13)) # 64 B to 16 MiB
+
+RPC_LATENCY = Histogram(
+    "grpc_server_handling_seconds",
+    "Duration of RPCs, from a worker thread picking up the call to the last response",
+    ["method", "code"],
+    buckets=LATENCY_BUCKETS,
+)
+RPC_QUEUE_SECONDS = Histogram(
+    "grpc_server_queue_seconds",
+    "Wait of RPCs for a worker thread of the server executor",
+    ["method"],
+    buckets=LATENCY_BUCKETS,
+)
+RPC_IN_FLIGHT = Gauge(
+    "grpc_server_in_flight",
+    "RPCs being handled",
+    ["method"],
+)
+RPC_REQUEST_BYTES = Histogram(
+    "grpc_server_request_bytes",
+    "Serialized size of request messages",
+    ["method"],
+    buckets=SIZE_BUCKETS,
+)
+RPC_RESPONSE_BYTES = Histogram(
+    "grpc_server_response_bytes",
+    "Serialized size of response messages",
+    ["method"],
+    buckets=SIZE_BUCKETS,
+)
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "grpc_server_executor_queue_depth",
+    "RPCs waiting for a worker thread",
+)
+EXECUTOR_THREADS = Gauge(
+    "grpc_server_executor_threads",
+    "Worker threads started by the server executor",
+)
+# Recorded by `utils.helpers.execute_cypher`
+CYPHER_EXECUTIONS = Counter(
+    "age_cypher_executions_total",
+    "Cypher queries run through AGE, by query template, to find hot graph operations",
+    ["template"],
+)
+POOL_ACTIVE = Gauge(
+    "grpc_server_pool_active",
+    "RPCs running in an admission pool",
+    ["pool"],
+)
+POOL_QUEUED = Gauge(
+    "grpc_server_pool_queued",
+    "RPCs waiting for a slot of an admission pool",
+    ["pool"],
+)
+POOL_LIMIT = Gauge(
+    "grpc_server_pool_limit",
+    "Concurrency limit of an admission pool, saturation is active / limit",
+    ["pool"],
+)
+POOL_WAIT_SECONDS = Histogram(
+    "grpc_server_pool_wait_seconds",
+    "Wait of admitted RPCs for a slot of their pool",
+    ["pool"],
+    buckets=LATENCY_BUCKETS,
+)
+POOL_REJECTED = Counter(
+    "grpc_server_pool_rejected_total",
+    "RPCs rejected with RESOURCE_EXHAUSTED, by pool and reason: queue_full or timeout",
+    ["pool", "reason"],
+)
+
+EMBEDDING_LANE_ACTIVE = Gauge(
+    "embedding_lane_active",
+    "Embedding requests in flight, by lane: interactive or bulk",
+    ["lane"],
+)
+EMBEDDING_LANE_QUEUED = Gauge(
+    "embedding_lane_queued",
+    "Embedding requests waiting for a slot, by lane",
+    ["lane"],
+)
+EMBEDDING_LANE_LIMIT = Gauge(
+    "embedding_lane_limit",
+    "Embedding requests in flight at most, by lane",
+    ["lane"],
+)
+EMBEDDING_LANE_WAIT_SECONDS = Histogram(
+    "embedding_lane_wait_seconds",
+    "Wait of embedding requests for a slot, by lane",
+    ["lane"],
+    buckets=LATENCY_BUCKETS,
+)
+
+PROVIDER_CIRCUIT_STATE = Gauge(
+    "provider_circuit_state",
+    "Circuit breaker of a model provider: 0 closed, 1 half open, 2 open",
+    ["model"],
+)
+PROVIDER_RETRIES = Counter(
+    "provider_retries_total",
+    "Retries of failed LLM and embedding calls",
+    ["model"],
+)
+PROVIDER_REJECTED = Counter(
+    "provider_rejected_total",
+    "LLM and embedding calls failed fast by an open circuit",
+    ["model"],
+)
+PROVIDER_RATE_LIMIT_WAIT = Histogram(
+    "provider_rate_limit_wait_seconds",
+    "Wait of LLM and embedding calls for the rate limit of their model",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def observe_executor(executor: ThreadPoolExecutor) -> None:
+    """Reports queue depth and threads of the server executor, read at scrape time."""
+    # No public API for these, the attributes are stable across CPython versions
+    EXECUTOR_QUEUE_DEPTH.set_function(lambda: executor._work_queue.qsize())
+    EXECUTOR_THREADS.set_function(lambda: len(executor._threads))
+
+def start_metrics_server(port: int) -> None:
+    """Serves metrics over HTTP on a daemon thread, 0 to disable."""
+    if port <= 0:
+        logger.info("Metrics server disabled.")
+        return
+    start_http_server(port)
+    logger.info(f"Metrics served on port {port} at /metrics")
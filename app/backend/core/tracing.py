@@ -0,0 +1,64 @@
+"""
+Tracing of RPCs and their stages, with OpenTelemetry.
+
+Each RPC is a span, see `interceptors.logging_timing`, stages like parsing,
+LLM calls, embeddings, S3 uploads, dedup queries and Cypher are child spans.
+Spans are no-ops until `init_tracing` installs an exporter by `TRACING_EXPORTER`:
+  - file: one JSON span per line in `TRACING_FILE`
+  - otlp: OTLP over gRPC to `TRACING_OTLP_ENDPOINT`, for a collector or Jaeger.
+    Needs the `opentelemetry-exporter-otlp-proto-grpc` package.
+
+Traces are sampled at `TRACING_SAMPLE_RATIO`, a trace started by the client
+keeps the client's sampling decision.
+"""
+import logging
+
+from opentelemetry import trace
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "conscious-backend"
+
+tracer = trace.get_tracer("conscious")
+
+
+def init_tracing() -> None:
+    """Installs the tracer provider and exporter by settings, once at startup."""
+    if settings.TRACING_EXPORTER == "none":
+        return
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    if settings.TRACING_EXPORTER == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        except ImportError as e:
+            raise RuntimeError("Exporting traces by OTLP requires the `opentelemetry-exporter-otlp-proto-grpc` package.") from e
+        exporter = OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+        destination = settings.TRACING_OTLP_ENDPOINT
+    else:
+        exporter = ConsoleSpanExporter(
+            out=open(settings.TRACING_FILE, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+        destination = settings.TRACING_FILE
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATIO)),
+    )
+    # Spans are exported in batches on a background thread, off the request path
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Tracing to {destination}, sample ratio {settings.TRACING_SAMPLE_RATIO}")
+
+def shutdown_tracing() -> None:
+    """Exports pending spans."""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
@@ -0,0 +1,174 @@
+"""
+Ledger of LLM and embedding calls, in the `inference_usage` hypertable.
+
+Calls are recorded by `utils.embeddings.get_embeddings` and the DSPy LM of
+`modules.find_thoughts`, with the calling RPC and source taken from
+`usage_context`. Rows are queued and written in batches by a background
+thread, the request path does not wait for the database.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from db.models import InferenceUsage
+from db.session import get_db_session
+
+logger = logging.getLogger(__name__)
+
+QUEUE_MAX = 10_000 # Rows waiting to be written, beyond that new rows are dropped
+# Group columns and order of summaries
+SUMMARY_GROUPS = {
+    "day": (["time_bucket('1 day', time) AS day"], "day DESC, cost DESC"),
+    "source": (["source_type", "source_id"], "cost DESC, latency_seconds DESC"),
+    "rpc": (["rpc"], "cost DESC, latency_seconds DESC"),
+}
+
+# Attributes of the current call chain: rpc, source_type, source_id
+_usage_context: ContextVar[Dict[str, Any]] = ContextVar("usage_context", default={})
+
+
+@contextmanager
+def usage_context(**attributes):
+    """Attributes recorded with the calls made inside, nested contexts add to outer ones."""
+    token = _usage_context.set({**_usage_context.get(), **attributes})
+    try:
+        yield
+    finally:
+        _usage_context.reset(token)
+
+
+class UsageLedger:
+    """Queue of usage rows, written in batches by a daemon thread."""
+
+    def __init__(self, flush_seconds: float = settings.USAGE_FLUSH_SECONDS, batch_size: int = 500):
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=QUEUE_MAX)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.pending = threading.Event()
+        self.dropped = 0
+
+    def _start(self) -> None:
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="usage-ledger", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def put(self, row: dict) -> None:
+        if self.thread is None:
+            self._start()
+        try:
+            self.queue.put_nowait(row)
+            self.pending.set()
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Usage ledger queue full, {self.dropped} rows dropped")
+
+    def _drain(self) -> List[dict]:
+        rows = []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def flush(self) -> None:
+        """Writes all queued rows."""
+        while rows := self._drain():
+            try:
+                with get_db_session() as session:
+                    session.execute(insert(InferenceUsage), rows)
+            except Exception as e:
+                logger.error(f"Failed to write {len(rows)} usage rows: {e}")
+                return
+
+    def _run(self) -> None:
+        while True:
+            self.pending.wait()
+            time.sleep(self.flush_seconds) # Let rows batch up
+            self.pending.clear()
+            self.flush()
+
+
+_ledger = UsageLedger()
+
+
+def record_usage(
+    kind: str,
+    model: str,
+    latency: float,
+    items: int = 1,
+    cached_items: int = 0,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    cost: Optional[float] = None,
+    success: bool = True,
+) -> None:
+    """
+    Queues a usage row with the attributes of the current `usage_context`.
+
+    Args:
+      - kind: `llm` or `embedding`
+      - latency: seconds spent waiting for the model, 0 if all items were cached
+    """
+    if not settings.USAGE_LEDGER:
+        return
+    attributes = _usage_context.get()
+    _ledger.put({
+        "time": datetime.now(timezone.utc),
+        "kind": kind,
+        "model": model,
+        "rpc": attributes.get("rpc"),
+        "source_type": attributes.get("source_type"),
+        "source_id": attributes.get("source_id"),
+        "items": items,
+        "cached_items": cached_items,
+        "input_tokens": input_tokens or 0,
+        "output_tokens": output_tokens or 0,
+        "latency_ms": latency * 1000,
+        "cost": cost,
+        "success": success,
+    })
+
+
+def summarize_usage(session: Session, days: int = 30, group_by: str = "day") -> List[dict]:
+    """
+    Totals of calls over the last `days`, by kind and model, and by `group_by`:
+    `day`, `source` or `rpc`. Latest days first, or most expensive then slowest groups first.
+    """
+    if group_by not in SUMMARY_GROUPS:
+        raise ValueError(f"Unknown usage group: {group_by}")
+    group, order = SUMMARY_GROUPS[group_by]
+    columns = group + ["kind", "model"]
+    group_columns = ", ".join(str(i + 1) for i in range(len(columns)))
+    rows = session.execute(text(f"""
+        SELECT
+            {", ".join(columns)},
+            count(*) AS calls,
+            sum(items) AS items,
+            sum(cached_items) AS cached_items,
+            sum(input_tokens) AS input_tokens,
+            sum(output_tokens) AS output_tokens,
+            sum(latency_ms) / 1000 AS latency_seconds,
+            coalesce(sum(cost), 0) AS cost,
+            count(*) FILTER (WHERE NOT success) AS failures
+        FROM inference_usage
+        WHERE time >= now() - make_interval(days => :days)
+        GROUP BY {group_columns}
+        ORDER BY {order}
+    """), {"days": days}).mappings().all()
+    return [dict(row) for row in rows]
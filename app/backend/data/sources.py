@@ -41,6 +41,27 @@ define_sources = {
             }
         }
     },
+    'markdown': {
+        'keys': {
+            'vault': {
+                'label': 'Vault',
+                'required': True,
+                'desc': "Name of the vault, for example an Obsidian vault",
+                'examples': [
+                    'notes'
+                ],
+            },
+            'path': {
+                'label': 'Path',
+                'required': True,
+                'desc': "Path of the Markdown file relative to the vault",
+                'examples': [
+                    'reading/How to Read a Book.md'
+                ],
+            }
+        },
+        'label': "Markdown note"
+    },
     'dev-test': {
         'keys': {
             'test_identifier_1': {
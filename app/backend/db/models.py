@@ -1,19 +1,54 @@
 from sqlalchemy import (Column, Integer, BigInteger, Boolean, DateTime, 
-                        Float, Text, func, SmallInteger, PrimaryKeyConstraint)
-from sqlalchemy.dialects.postgresql import REAL, TIMESTAMP # Use specific PG types
-from pgvector.sqlalchemy import VECTOR
+                        Float, Text, func, SmallInteger, PrimaryKeyConstraint, LargeBinary, ForeignKey, Computed)
+from sqlalchemy.dialects.postgresql import REAL, TIMESTAMP, JSONB, TSVECTOR # Use specific PG types
+from sqlalchemy.orm import deferred
+import numpy as np
+from pgvector.sqlalchemy import VECTOR, HALFVEC
 
 from .session import Base
 from core.config import settings
 
 
+class NumpyVector(VECTOR):
+    """
+    `VECTOR` bound as float32 NumPy array instead of a text literal,
+    the pgvector adapter registered on the engine sends it in binary.
+    """
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            return None if value is None else np.asarray(value, dtype=np.float32)
+        return process
+
+
+class NumpyHalfVector(HALFVEC):
+    """
+    `HALFVEC` bound as float32 NumPy array, sent as `vector` in binary and
+    converted to half precision by the database on assignment.
+    """
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            return None if value is None else np.asarray(value, dtype=np.float32)
+        return process
+
+
+EmbeddingType = NumpyHalfVector if settings.EMBEDDING_STORAGE == "halfvec" else NumpyVector
+
+
 # TO-DO: is it a good practice to use FSRSState value in database level directly?
 class Thoughts(Base):
     __tablename__ = "thoughts"
     thought_id = Column(BigInteger, primary_key=True)
     text = Column(Text, nullable=False)
-    embedding = Column(VECTOR(settings.VECTOR_DIMENSION), nullable=False)
+    text_hash = Column(LargeBinary, unique=True) # SHA-256 of the normalized text
+    # Deferred: loaded only when accessed, queries of text and SRS fields skip the vector
+    embedding = deferred(Column(EmbeddingType(settings.VECTOR_DIMENSION or None), nullable=False))
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # Full-text search, generated by database. `simple` config keeps names and codes as is.
+    text_search = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', text)", persisted=True)))
 
     # SRS Fields
     srs_due = Column(DateTime(timezone=True), index=True)
@@ -31,6 +66,82 @@ class Thoughts(Base):
         return f"<Thoughts(id={self.thought_id}, text='{preview}')>"
 
 
+class Sources(Base):
+    """
+    Relational lookup of Source vertices, by hash of the canonical identifiers.
+    """
+    __tablename__ = "sources"
+    source_id = Column(BigInteger, primary_key=True)
+    source_hash = Column(LargeBinary, nullable=False, unique=True)
+    vertex_id = Column(BigInteger, nullable=False, unique=True) # AGE vertex ID
+    source_type = Column(Text, nullable=False)
+    keys = Column(JSONB, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<Sources(id={self.source_id}, vertex_id={self.vertex_id}, keys={self.keys})>"
+
+
+class ThoughtSources(Base):
+    """
+    Relational copy of the Source -DERIVED_TO-> Thought links, for filters in SQL.
+    """
+    __tablename__ = "thought_sources"
+    thought_id = Column(BigInteger, ForeignKey("thoughts.thought_id", ondelete="CASCADE"), primary_key=True)
+    vertex_id = Column(BigInteger, ForeignKey("sources.vertex_id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
+class SourceNotes(Base):
+    """
+    Fingerprints of notes ingested from a source, for incremental re-imports.
+    """
+    __tablename__ = "source_notes"
+    vertex_id = Column(BigInteger, ForeignKey("sources.vertex_id", ondelete="CASCADE"), primary_key=True)
+    text_hash = Column(LargeBinary, primary_key=True)
+    thought_id = Column(BigInteger, ForeignKey("thoughts.thought_id", ondelete="CASCADE"), nullable=False)
+
+
+class ThoughtNeighbors(Base):
+    """
+    Precomputed top-k nearest thoughts of each thought.
+    """
+    __tablename__ = "thought_neighbors"
+    thought_id = Column(BigInteger, ForeignKey("thoughts.thought_id", ondelete="CASCADE"), primary_key=True)
+    neighbor_id = Column(BigInteger, ForeignKey("thoughts.thought_id", ondelete="CASCADE"), primary_key=True)
+    distance = Column(REAL, nullable=False)
+
+
+class RelatedThoughtsQueue(Base):
+    """
+    Thoughts whose neighbors are not computed yet, filled by a trigger on insert.
+    """
+    __tablename__ = "related_thoughts_queue"
+    thought_id = Column(BigInteger, ForeignKey("thoughts.thought_id", ondelete="CASCADE"), primary_key=True)
+
+
+class JobWatermarks(Base):
+    """
+    Progress of incremental jobs.
+    """
+    __tablename__ = "job_watermarks"
+    job_name = Column(Text, primary_key=True)
+    last_id = Column(BigInteger, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
+class VaultFiles(Base):
+    """
+    Manifest of synced Markdown files of local vaults, by path relative to the vault.
+    """
+    __tablename__ = "vault_files"
+    vault = Column(Text, primary_key=True)
+    path = Column(Text, primary_key=True)
+    mtime_ns = Column(BigInteger, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    content_hash = Column(LargeBinary, nullable=False)
+    synced_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
 class ReviewLogs(Base):
     """
     TimescaleDB table for review logs.
@@ -57,4 +168,28 @@ class ReviewLogs(Base):
     # Define the composite primary key
     __table_args__ = (
         PrimaryKeyConstraint('time', 'thought_id', name='review_logs_pkey'),
-    )
\ No newline at end of file
+    )
+
+class InferenceUsage(Base):
+    """
+    TimescaleDB table of LLM and embedding calls, see `core.usage`.
+    Append only, the table has no primary key.
+    """
+    __tablename__ = 'inference_usage'
+
+    time = Column(TIMESTAMP(timezone=True), nullable=False)
+    kind = Column(Text, nullable=False) # `llm` or `embedding`
+    model = Column(Text, nullable=False)
+    rpc = Column(Text) # Calling RPC method, None for jobs and CLIs
+    source_type = Column(Text)
+    source_id = Column(BigInteger) # AGE vertex ID of the source, if known
+    items = Column(Integer, nullable=False) # Texts embedded, or 1 per LLM call
+    cached_items = Column(Integer, nullable=False)
+    input_tokens = Column(Integer, nullable=False)
+    output_tokens = Column(Integer, nullable=False)
+    latency_ms = Column(REAL, nullable=False)
+    cost = Column(REAL) # USD by the litellm price table, None if unknown
+    success = Column(Boolean, nullable=False)
+
+    # Identity for the ORM only
+    __mapper_args__ = {"primary_key": [time, kind, model]}
@@ -5,11 +5,14 @@ import logging
 from datetime import datetime
 from typing import List, Optional
 from botocore.exceptions import ClientError
+from opentelemetry import trace
 
 from core.config import settings
+from core.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+@tracer.start_as_current_span("s3.upload")
 def upload_texts_to_s3(
     texts: List[str],
     bucket_name: str,
@@ -104,4 +107,8 @@ def upload_texts_to_s3(
 
         uploaded_urls.append(object_url) # Append URL or None
 
+    span = trace.get_current_span()
+    span.set_attribute("s3.bucket", bucket_name)
+    span.set_attribute("s3.objects", len(texts))
+    span.set_attribute("s3.failed", uploaded_urls.count(None))
     return uploaded_urls
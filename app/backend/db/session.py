@@ -1,36 +1,47 @@
-# TO-DO: more efficient way to laod AGE,and avoid unnecessary load
-
 import logging
 from contextlib import contextmanager
+from pgvector.psycopg import register_vector
 from sqlalchemy import create_engine, event
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import sessionmaker, declarative_base, Session
 
 from core.config import settings
 
 logger = logging.getLogger(__name__)
 
 # --- SQLAlchemy Setup ---
+# Plain relational engine: ORM, pgvector and review queries run with the default search_path.
 Base = declarative_base()
 engine = create_engine(settings.DATABASE_URL, echo=False) # Set echo=True for debugging SQL
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@event.listens_for(engine, "connect")
+def register_vector_types(dbapi_connection, connection_record):
+    """Registers pgvector adapters for each new connection: NumPy arrays are sent in binary, vectors loaded as NumPy arrays."""
+    register_vector(dbapi_connection)
+
 # --- AGE Session Setup ---
-def setup_age_connection(dbapi_connection, connection_record) -> None:
+# Key in the per DBAPI connection `info` dict, survives pool check-in/check-out
+AGE_LOADED_KEY = "age_loaded"
+
+def ensure_age_loaded(session: Session) -> None:
     """
-    Sets up AGE essentials (LOAD, search_path) for new connections.
+    Loads AGE for the connection of this session, only once per pooled connection.
+
+    The search_path is left untouched, Cypher calls use schema qualified
+    `ag_catalog` names instead. Relational queries sharing the connection
+    are therefore not affected by AGE.
     """
-    cursor = dbapi_connection.cursor()
+    connection = session.connection()
+    if connection.info.get(AGE_LOADED_KEY):
+        return
+
     try:
-        cursor.execute("LOAD 'age';")
-        cursor.execute("SET search_path = ag_catalog, '$user', public;")
-        logger.debug("AGE loaded and search_path set for new connection.")
+        connection.exec_driver_sql("LOAD 'age';")
     except Exception as e:
-        logger.error(f"Error setting up AGE for connection: {e}")
-    finally:
-        cursor.close()
-
-# Listen for new connections to automatically configure AGE
-event.listen(engine, "connect", setup_age_connection)
+        logger.error(f"Error loading AGE for connection: {e}")
+        raise
+    connection.info[AGE_LOADED_KEY] = True
+    logger.debug("AGE loaded for pooled connection.")
 
 @contextmanager
 def get_db_session():
@@ -50,3 +61,12 @@ def get_db_session():
     finally:
         session.close()
         logger.debug("DB Session closed.")
+
+@contextmanager
+def get_graph_session():
+    """
+    Same as `get_db_session`, with AGE loaded before the first Cypher query.
+    """
+    with get_db_session() as session:
+        ensure_age_loaded(session)
+        yield session
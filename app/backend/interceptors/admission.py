@@ -0,0 +1,168 @@
+# interceptors/admission.py
+"""
+Admission control: RPCs run in bounded pools by method class, so slow calls
+can not take the workers of quick ones.
+
+Each pool runs up to `concurrency` calls, up to `queue` more wait for a slot.
+A call beyond the queue, or not admitted within `POOL_QUEUE_TIMEOUT_SECONDS`
+or its deadline, is rejected with RESOURCE_EXHAUSTED at once. Waiting calls
+hold a server worker thread, so the server executor is sized by
+`required_workers` for every pool to fill its slots and queue.
+"""
+import threading
+import time
+import logging
+import grpc
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from google.rpc import code_pb2, error_details_pb2
+from google.protobuf import duration_pb2
+
+from core import metrics
+from core.config import settings
+from interceptors.logging_timing import create_status_proto
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL = "interactive"
+# Methods outside the default pool
+METHOD_POOLS = {
+    "/conscious.v1.FindService/FindThoughts": "inference",
+    "/conscious.v1.DataService/AddData": "ingest",
+}
+REJECT_HEADROOM = 4 # Worker threads beyond the pools, for rejecting calls
+RETRY_DELAY_SECONDS = 1 # Suggested to clients of rejected calls
+
+
+class Pool:
+    """Bounded concurrency with a bounded wait queue."""
+
+    def __init__(self, name: str, concurrency: int, queue: int):
+        self.name = name
+        self.concurrency = max(concurrency, 1)
+        self.queue = max(queue, 0)
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+        metrics.POOL_LIMIT.labels(name).set(self.concurrency)
+        metrics.POOL_ACTIVE.labels(name).set_function(lambda: self.active)
+        metrics.POOL_QUEUED.labels(name).set_function(lambda: self.waiting)
+
+    def acquire(self, timeout: float) -> Optional[str]:
+        """Takes a slot, returns the reason if rejected: `queue_full` or `timeout`."""
+        start_time = time.perf_counter()
+        with self.condition:
+            if self.active >= self.concurrency:
+                if self.waiting >= self.queue:
+                    return "queue_full"
+                self.waiting += 1
+                try:
+                    if not self.condition.wait_for(lambda: self.active < self.concurrency, timeout):
+                        return "timeout"
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+        metrics.POOL_WAIT_SECONDS.labels(self.name).observe(time.perf_counter() - start_time)
+        return None
+
+    def release(self) -> None:
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+
+def _pool_settings() -> Dict[str, tuple]:
+    return {
+        "interactive": (settings.POOL_INTERACTIVE_CONCURRENCY, settings.POOL_INTERACTIVE_QUEUE),
+        "inference": (settings.POOL_INFERENCE_CONCURRENCY, settings.POOL_INFERENCE_QUEUE),
+        "ingest": (settings.POOL_INGEST_CONCURRENCY, settings.POOL_INGEST_QUEUE),
+    }
+
+def required_workers() -> int:
+    """Server worker threads for all pools to run and queue calls at their limits."""
+    return sum(max(concurrency, 1) + max(queue, 0) for concurrency, queue in _pool_settings().values()) + REJECT_HEADROOM
+
+
+class AdmissionInterceptor(grpc.ServerInterceptor):
+    """
+    gRPC interceptor admitting calls into their pool, see the module docstring.
+    Place after `LoggingTimingInterceptor`, so rejected calls are logged and measured.
+    """
+
+    def __init__(self):
+        self.pools = {name: Pool(name, concurrency, queue) for name, (concurrency, queue) in _pool_settings().items()}
+        logger.info("Admission pools: " + ", ".join(
+            f"{pool.name} {pool.concurrency} running + {pool.queue} queued" for pool in self.pools.values()
+        ))
+
+    def _admit(self, pool: Pool, method_name: str, context: grpc.ServicerContext) -> None:
+        """Waits for a slot of the pool, or aborts the call with RESOURCE_EXHAUSTED."""
+        timeout = settings.POOL_QUEUE_TIMEOUT_SECONDS
+        remaining = context.time_remaining()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        reason = pool.acquire(max(timeout, 0))
+        if reason is None:
+            return
+
+        metrics.POOL_REJECTED.labels(pool.name, reason).inc()
+        message = f"Server busy, {pool.name} pool is full. Retry later."
+        status_proto = create_status_proto(
+            code=code_pb2.RESOURCE_EXHAUSTED,
+            message=message,
+            details=[
+                error_details_pb2.ErrorInfo(
+                    reason=f"POOL_{reason.upper()}",
+                    domain="conscious.api.grpc",
+                    metadata={"method": method_name, "pool": pool.name},
+                ),
+                error_details_pb2.RetryInfo(retry_delay=duration_pb2.Duration(seconds=RETRY_DELAY_SECONDS)),
+            ],
+        )
+        context.set_trailing_metadata((('grpc-status-details-bin', status_proto.SerializeToString()),))
+        context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, message)
+
+    def intercept_service(self, continuation: Callable[[grpc.HandlerCallDetails], grpc.RpcMethodHandler],
+                          handler_call_details: grpc.HandlerCallDetails) -> grpc.RpcMethodHandler:
+        method_name = handler_call_details.method
+        original_handler = continuation(handler_call_details)
+        if original_handler is None:
+            return None
+        pool = self.pools[METHOD_POOLS.get(method_name, DEFAULT_POOL)]
+
+        def unary_response(behavior: Callable) -> Callable:
+            def wrapper(request: Any, context: grpc.ServicerContext) -> Any:
+                self._admit(pool, method_name, context)
+                try:
+                    return behavior(request, context)
+                finally:
+                    pool.release()
+            return wrapper
+
+        def stream_response(behavior: Callable) -> Callable:
+            def wrapper(request: Any, context: grpc.ServicerContext) -> Iterator[Any]:
+                self._admit(pool, method_name, context)
+                try:
+                    # The slot is held until the stream ends
+                    yield from behavior(request, context)
+                finally:
+                    pool.release()
+            return wrapper
+
+        handler_factories = (
+            ("unary_unary", grpc.unary_unary_rpc_method_handler, unary_response),
+            ("stream_unary", grpc.stream_unary_rpc_method_handler, unary_response),
+            ("unary_stream", grpc.unary_stream_rpc_method_handler, stream_response),
+            ("stream_stream", grpc.stream_stream_rpc_method_handler, stream_response),
+        )
+        for attribute, method_handler, wrap in handler_factories:
+            behavior = getattr(original_handler, attribute)
+            if behavior:
+                return method_handler(
+                    wrap(behavior),
+                    request_deserializer=original_handler.request_deserializer,
+                    response_serializer=original_handler.response_serializer,
+                )
+
+        logger.error(f"Unsupported RPC type for method {method_name} in admission interceptor.")
+        return original_handler
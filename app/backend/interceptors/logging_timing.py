@@ -3,12 +3,20 @@
 import time
 import logging
 import grpc
-from typing import Any, Callable
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
 
 # Import status and error detail types
 from google.rpc import status_pb2, code_pb2
 from google.rpc import error_details_pb2
-from google.protobuf import any_pb2
+from google.protobuf import any_pb2, duration_pb2
+from opentelemetry import propagate, trace
+
+from core import metrics
+from core.deadline import CANCELLED, stopped_error
+from core.gateway import ProviderUnavailable
+from core.tracing import tracer
+from core.usage import usage_context
 
 logger = logging.getLogger(__name__)
 
@@ -22,94 +30,238 @@ def create_status_proto(code: int, message: str, details: list = None) -> status
             status_proto.details.append(any_detail)
     return status_proto
 
+_END_OF_STREAM = object()
+
+def _message_size(message: Any) -> int:
+    return message.ByteSize() if hasattr(message, "ByteSize") else 0
+
+
+class _RpcCall:
+    """Timing, span, in-flight count and final status of one RPC, from the call start."""
+
+    def __init__(self, method_name: str, context: grpc.ServicerContext, received_time: float):
+        self.method_name = method_name
+        self.context = context
+        self.start_time = time.perf_counter()
+        self.finished = False
+        metrics.RPC_QUEUE_SECONDS.labels(method_name).observe(self.start_time - received_time)
+        metrics.RPC_IN_FLIGHT.labels(method_name).inc()
+        # Child of the client's span if it sent trace context in metadata
+        self.span = tracer.start_span(
+            method_name,
+            context=propagate.extract(dict(context.invocation_metadata() or ())),
+            kind=trace.SpanKind.SERVER,
+            attributes={"rpc.system": "grpc", "rpc.method": method_name, "client.address": context.peer()},
+        )
+        logger.info(f"RPC Start: {method_name} from {context.peer()}")
+
+    @contextmanager
+    def active(self):
+        """Makes the RPC span current, so spans of the stages nest under it, and tags model calls with the RPC."""
+        with trace.use_span(self.span, end_on_exit=False, record_exception=False, set_status_on_exception=False), \
+                usage_context(rpc=self.method_name):
+            yield
+
+    def observe_request(self, request: Any) -> None:
+        metrics.RPC_REQUEST_BYTES.labels(self.method_name).observe(_message_size(request))
+
+    def observe_response(self, response: Any) -> None:
+        metrics.RPC_RESPONSE_BYTES.labels(self.method_name).observe(_message_size(response))
+
+    def finish(self, code: Optional[grpc.StatusCode] = None) -> None:
+        """Records the RPC once. Status is taken from the context if not given."""
+        if self.finished:
+            return
+        self.finished = True
+        process_time = time.perf_counter() - self.start_time
+        code = code or self.context.code() or grpc.StatusCode.OK
+        metrics.RPC_IN_FLIGHT.labels(self.method_name).dec()
+        metrics.RPC_LATENCY.labels(self.method_name, code.name).observe(process_time)
+        self.span.set_attribute("rpc.grpc.status_code", code.value[0])
+        if code != grpc.StatusCode.OK:
+            self.span.set_status(trace.Status(trace.StatusCode.ERROR, code.name))
+        self.span.end()
+
+        if code == grpc.StatusCode.OK:
+            logger.info(f"RPC Success: {self.method_name} - Completed in {process_time:.4f}s")
+        else:
+            # Aborted by the servicer or cancelled by the client, gRPC handles sending the status
+            logger.warning(
+                f"RPC Ended: {self.method_name} - Duration {process_time:.4f}s"
+                f" - Code: {code} Details: '{self.context.details()}'"
+            )
+
+    def fail(self, e: Exception) -> None:
+        """Records an exception of the servicer and aborts with rich status details. Always raises."""
+        code = self.context.code()
+        if code is not None and code != grpc.StatusCode.OK:
+            # Raised by `context.abort()` of the servicer, keep its status
+            self.finish(code)
+            raise e
+
+        stopped = stopped_error(e, "database")
+        if stopped is not None:
+            # Work stopped for the client or by the deadline, not a server error
+            code = grpc.StatusCode.CANCELLED if stopped.reason == CANCELLED else grpc.StatusCode.DEADLINE_EXCEEDED
+            self.span.set_attribute("rpc.stopped_at", stopped.stage)
+            self.finish(code)
+            if self.context.is_active():
+                self.context.abort(code, str(stopped))
+            raise e
+
+        if isinstance(e, ProviderUnavailable):
+            # A model provider is down or rate limiting, the client may retry later
+            self.span.record_exception(e)
+            self.finish(grpc.StatusCode.UNAVAILABLE)
+            logger.warning(f"RPC {self.method_name} failed: {e}")
+            if self.context.is_active():
+                status_proto = create_status_proto(
+                    code=code_pb2.UNAVAILABLE,
+                    message=str(e),
+                    details=[
+                        error_details_pb2.ErrorInfo(
+                            reason="PROVIDER_UNAVAILABLE",
+                            domain="conscious.api.grpc",
+                            metadata={"method": self.method_name, "model": e.model},
+                        ),
+                        error_details_pb2.RetryInfo(retry_delay=duration_pb2.Duration(seconds=max(round(e.retry_after), 1))),
+                    ],
+                )
+                self.context.set_trailing_metadata((('grpc-status-details-bin', status_proto.SerializeToString()),))
+                self.context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+            raise e
+
+        self.span.record_exception(e)
+        self.finish(grpc.StatusCode.INTERNAL)
+        logger.error(
+            f"RPC Unhandled Exception: {self.method_name} - Error: {type(e).__name__}: {e}",
+            exc_info=True # Include stack trace for server logs
+        )
+
+        # Check if context already aborted (less likely here, but possible race)
+        if not self.context.is_active():
+            logger.error(f"Context was already inactive during exception handling for {self.method_name}")
+            raise e # Let gRPC handle the already aborted state
+
+        # --- Richer Error Handling ---
+        # Create a standard ErrorInfo detail
+        error_info = error_details_pb2.ErrorInfo(
+            reason=f"UNHANDLED_EXCEPTION_{type(e).__name__.upper()}",
+            domain="conscious.api.grpc", # Your service domain
+            metadata={"method": self.method_name}
+        )
+        # Create the main status proto
+        status_proto = create_status_proto(
+            code=code_pb2.INTERNAL, # Map exception to gRPC code
+            message="An unexpected internal error occurred.", # User-friendly message
+            details=[error_info] # Attach structured details
+        )
+
+        # Set the rich status details before aborting
+        # Trailing metadata is the standard way to send google.rpc.Status
+        self.context.set_trailing_metadata((('grpc-status-details-bin', status_proto.SerializeToString()),))
+
+        # Abort with the basic code and message (clients relying solely on this still get info)
+        self.context.abort(
+            code=grpc.StatusCode.INTERNAL,
+            details="An unexpected internal error occurred."
+        )
+        # Raising after abort might not be strictly necessary as abort signals gRPC,
+        # but ensures the Python execution flow stops here.
+        raise e
+
+
 class LoggingTimingInterceptor(grpc.ServerInterceptor):
     """
-    gRPC interceptor for logging, timing, and handling exceptions
-    with richer google.rpc.Status details.
+    gRPC interceptor for logging, timing, metrics, and handling exceptions
+    with richer google.rpc.Status details. Supports all four RPC types.
     """
 
     def intercept_service(self, continuation: Callable[[grpc.HandlerCallDetails], grpc.RpcMethodHandler],
                           handler_call_details: grpc.HandlerCallDetails) -> grpc.RpcMethodHandler:
         method_name = handler_call_details.method
-        start_time = time.perf_counter()
-
-        def wrapper(request: Any, context: grpc.ServicerContext) -> Any:
-            peer = context.peer()
-            logger.info(f"RPC Start: {method_name} from {peer}")
-
-            try:
-                # Proceed with the actual RPC method execution
-                response = continuation(handler_call_details).unary_unary(request, context) # Adjust for streaming
-
-                # Check if context was aborted by the servicer logic *before* returning
-                # This can happen if the servicer calls context.abort()
-                if not context.is_active():
-                    # If aborted, gRPC framework handles sending the status. Log it here.
-                    process_time = time.perf_counter() - start_time
-                    # Note: context.details() and context.code() might require specific setup or
-                    # might not be reliable immediately after user abort. Logging the fact is key.
-                    logger.warning(
-                        f"RPC Aborted by Servicer: {method_name} - Duration {process_time:.4f}s"
-                        f" - Code: {context.code()} Details: '{context.details()}'" # Log reported status
-                    )
-                    # Response might be None or invalid if aborted, let gRPC handle it.
-                    return response # Or potentially None, depending on handler expectations
-
-                process_time = time.perf_counter() - start_time
-                logger.info(f"RPC Success: {method_name} - Completed in {process_time:.4f}s")
-                return response
-
-            except Exception as e:
-                process_time = time.perf_counter() - start_time
-                logger.error(
-                    f"RPC Unhandled Exception: {method_name} - Failed in {process_time:.4f}s. Error: {type(e).__name__}: {e}",
-                    exc_info=True # Include stack trace for server logs
-                )
-
-                # Check if context already aborted (less likely here, but possible race)
-                if not context.is_active():
-                    logger.error(f"Context was already inactive during exception handling for {method_name}")
-                    raise # Let gRPC handle the already aborted state
-
-                # --- Richer Error Handling ---
-                # Create a standard ErrorInfo detail
-                error_info = error_details_pb2.ErrorInfo(
-                    reason=f"UNHANDLED_EXCEPTION_{type(e).__name__.upper()}",
-                    domain="conscious.api.grpc", # Your service domain
-                    metadata={"method": method_name}
-                )
-                # Create the main status proto
-                status_proto = create_status_proto(
-                    code=code_pb2.INTERNAL, # Map exception to gRPC code
-                    message="An unexpected internal error occurred.", # User-friendly message
-                    details=[error_info] # Attach structured details
-                )
+        # Called once per call on the serving thread, before the call waits for a worker thread
+        received_time = time.perf_counter()
+        original_handler = continuation(handler_call_details)
+        if original_handler is None:
+            return None # Unknown method, gRPC replies UNIMPLEMENTED
 
-                # Set the rich status details before aborting
-                # Trailing metadata is the standard way to send google.rpc.Status
-                context.set_trailing_metadata((('grpc-status-details-bin', status_proto.SerializeToString()),))
+        def observed_requests(call: _RpcCall, request_iterator: Iterator[Any]) -> Iterator[Any]:
+            for request in request_iterator:
+                call.observe_request(request)
+                yield request
 
-                # Abort with the basic code and message (clients relying solely on this still get info)
-                context.abort(
-                    code=grpc.StatusCode.INTERNAL,
-                    details="An unexpected internal error occurred."
-                )
-                # Raising after abort might not be strictly necessary as abort signals gRPC,
-                # but ensures the Python execution flow stops here.
-                raise e
+        def unary_response(behavior: Callable, request_streaming: bool) -> Callable:
+            def wrapper(request: Any, context: grpc.ServicerContext) -> Any:
+                # Timing starts here, when a worker thread picks up the call
+                call = _RpcCall(method_name, context, received_time)
+                if request_streaming:
+                    request = observed_requests(call, request)
+                else:
+                    call.observe_request(request)
+                try:
+                    # Proceed with the actual RPC method execution
+                    with call.active():
+                        response = behavior(request, context)
+                except Exception as e:
+                    call.fail(e)
+                if response is not None:
+                    call.observe_response(response)
+                call.finish(None if context.is_active() or context.code() else grpc.StatusCode.CANCELLED)
+                return response
+            return wrapper
 
+        def stream_response(behavior: Callable, request_streaming: bool) -> Callable:
+            def wrapper(request: Any, context: grpc.ServicerContext) -> Iterator[Any]:
+                call = _RpcCall(method_name, context, received_time)
+                if request_streaming:
+                    request = observed_requests(call, request)
+                else:
+                    call.observe_request(request)
+                try:
+                    with call.active():
+                        responses = iter(behavior(request, context))
+                    while True:
+                        # The span is current only while the servicer runs, not while the response is sent
+                        with call.active():
+                            response = next(responses, _END_OF_STREAM)
+                        if response is _END_OF_STREAM:
+                            break
+                        call.observe_response(response)
+                        yield response
+                except GeneratorExit:
+                    # Stream closed before the end, by the client or the deadline
+                    call.finish(grpc.StatusCode.CANCELLED)
+                    raise
+                except Exception as e:
+                    call.fail(e)
+                call.finish()
+            return wrapper
 
-        original_handler = continuation(handler_call_details)
-        # Ensure this matches the type of RPC (unary_unary, unary_stream, etc.)
         if original_handler.unary_unary:
-             return grpc.unary_unary_rpc_method_handler(
-                wrapper,
+            return grpc.unary_unary_rpc_method_handler(
+                unary_response(original_handler.unary_unary, request_streaming=False),
                 request_deserializer=original_handler.request_deserializer,
                 response_serializer=original_handler.response_serializer,
             )
-        # Add similar blocks for unary_stream, stream_unary, stream_stream if needed
-        else:
-             # Fallback or raise error if handler type is unexpected/unsupported
-             logger.error(f"Unsupported RPC type for method {method_name} in interceptor.")
-             # Return the original handler to avoid breaking the call, but log error
-             return original_handler
\ No newline at end of file
+        if original_handler.stream_unary:
+            return grpc.stream_unary_rpc_method_handler(
+                unary_response(original_handler.stream_unary, request_streaming=True),
+                request_deserializer=original_handler.request_deserializer,
+                response_serializer=original_handler.response_serializer,
+            )
+        if original_handler.unary_stream:
+            return grpc.unary_stream_rpc_method_handler(
+                stream_response(original_handler.unary_stream, request_streaming=False),
+                request_deserializer=original_handler.request_deserializer,
+                response_serializer=original_handler.response_serializer,
+            )
+        if original_handler.stream_stream:
+            return grpc.stream_stream_rpc_method_handler(
+                stream_response(original_handler.stream_stream, request_streaming=True),
+                request_deserializer=original_handler.request_deserializer,
+                response_serializer=original_handler.response_serializer,
+            )
+
+        logger.error(f"Unsupported RPC type for method {method_name} in interceptor.")
+        return original_handler
@@ -3,6 +3,10 @@ import logging
 from utils.notes import extract_book_notes
 from modules.thoughts_services import ThoughtsService
 from db.session import get_db_session
+from core.deadline import CallDeadline
+from core.lanes import BULK, embedding_lane
+from core.tracing import tracer
+from core.usage import usage_context
 from enums import ThoughtType
 
 logger = logging.getLogger(__name__)
@@ -15,7 +19,8 @@ class AddData:
         source_type: str, 
         source_identifiers: dict, 
         file_content: bytes | None = None, 
-        text_list: list[str] | None = None
+        text_list: list[str] | None = None,
+        deadline: CallDeadline | None = None,
     ):
         if not file_content and not text_list:
             raise ValueError("File and texts are both empty")
@@ -25,6 +30,7 @@ class AddData:
         self.text_list = text_list
         self.source_type = source_type
         self.source_identifiers = source_identifiers
+        self.deadline = deadline or CallDeadline()
 
         self.source_identifiers['type'] = self.source_type
 
@@ -35,21 +41,27 @@ class AddData:
         # TO-DO: check file type if html
         # Prioritize file content instead of text list
         if self.file_content:
-            self.content = self.file_content.decode()
-            self.notes = extract_book_notes(self.content).get('notes')
+            with tracer.start_as_current_span("add_data.parse_html", attributes={"html.bytes": len(self.file_content)}) as span:
+                self.content = self.file_content.decode()
+                self.notes = extract_book_notes(self.content).get('notes')
+                span.set_attribute("notes.items", len(self.notes or []))
         else:
             self.notes = self.text_list # TO-DO: value check
 
         with get_db_session() as session:
-            thoughts_service = ThoughtsService(session)
-            source_ids, thought_ids = thoughts_service.add_collection(
+            thoughts_service = ThoughtsService(session, deadline=self.deadline)
+            # Exports are cumulative, only notes new to this source are added
+            return thoughts_service.sync_collection(
                 contents=self.notes,
                 task=ThoughtType.note,
                 source_keys=self.source_identifiers,
                 source_contents=[], # TO-DO: implement file save
             )
 
-    def run(self):
+    def run(self) -> dict:
+        """Returns dict of source_id, and counts of added, unchanged and removed notes."""
         if self.task != 'note':
             raise NotImplementedError("Only task note are supplorted at present.")
-        self._notes()
\ No newline at end of file
+        # Imports yield the embedding server to queries, see `core.lanes`
+        with usage_context(source_type=self.source_type), embedding_lane(BULK):
+            return self._notes()
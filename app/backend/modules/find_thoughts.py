@@ -1,15 +1,51 @@
 import dspy
 from typing import List
 import logging
+import time
 
 from db.session import get_db_session
 from .thoughts_services import ThoughtsService
 from core.config import settings
+from core.deadline import CallDeadline
+from core.gateway import gateway
+from core.tracing import tracer
+from core.usage import record_usage, usage_context
+from enums import ThoughtType
 
 logger = logging.getLogger(__name__)
 
 
-lm = dspy.LM(model=settings.LLM_MODEL, api_key=settings.LLM_API_KEY, cache=settings.DSPY_CACHE)
+class UsageRecordingLM(dspy.LM):
+    """
+    DSPy LM recording each call in the usage ledger, see `core.usage`.
+    Calls go through the provider gateway, which owns retries, see `core.gateway`.
+    """
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            response = gateway(self.model).call(super().forward, prompt=prompt, messages=messages, **kwargs)
+        except Exception:
+            record_usage(kind="llm", model=self.model, latency=time.perf_counter() - start_time, success=False)
+            raise
+
+        usage = dict(getattr(response, "usage", None) or {})
+        # Hits of the litellm cache are flagged, DSPy clears usage on hits of its in-memory cache
+        cached = bool(getattr(response, "cache_hit", False)) or not usage
+        record_usage(
+            kind="llm",
+            model=self.model,
+            latency=time.perf_counter() - start_time,
+            cached_items=int(cached),
+            input_tokens=0 if cached else usage.get("prompt_tokens", 0),
+            output_tokens=0 if cached else usage.get("completion_tokens", 0),
+            cost=None if cached else getattr(response, "_hidden_params", {}).get("response_cost"),
+        )
+        return response
+
+
+lm = UsageRecordingLM(model=settings.LLM_MODEL, api_key=settings.LLM_API_KEY, cache=settings.DSPY_CACHE,
+                      num_retries=0) # Retried by the gateway
 dspy.settings.configure(lm=lm)
 logger.info(f"DSPy configured with model: {settings.LLM_MODEL}")
 
@@ -44,15 +80,18 @@ class FindThoughtsModule(dspy.Module):
     
 
 class FindThoughts:
-    def __init__(self, text: str, identifiers: str):
+    def __init__(self, text: str, identifiers: str, deadline: CallDeadline | None = None):
         self.text = text
         self.identifiers = identifiers
+        self.deadline = deadline or CallDeadline()
 
+    @tracer.start_as_current_span("find_thoughts.save")
     def save_to_db(self, texts):
         with get_db_session() as session:
-            thoughts_service = ThoughtsService(session)
+            thoughts_service = ThoughtsService(session, deadline=self.deadline)
             source_ids, thought_ids = thoughts_service.add_collection(
                 contents=texts,
+                task=ThoughtType.note,
                 source_keys=self.identifiers,
                 source_contents=[self.text]
             )
@@ -60,6 +99,10 @@ class FindThoughts:
     def find(self):
         """Inference and save to database"""
         finder = FindThoughtsModule()
-        thoughts = finder(self.text)
+        with tracer.start_as_current_span("find_thoughts.llm", attributes={"llm.model": settings.LLM_MODEL, "text.chars": len(self.text)}) as span:
+            with usage_context(source_type=self.identifiers.get('type')):
+                # The wait for the LLM ends when the client goes away
+                thoughts = self.deadline.call(finder, self.text, stage="find_thoughts.llm")
+            span.set_attribute("thoughts.items", len(thoughts))
         self.save_to_db(thoughts)
         return thoughts
@@ -0,0 +1,116 @@
+"""
+Precomputed related thoughts: top-k nearest neighbors of each thought by embedding.
+
+Each run computes neighbors of the thoughts in `related_thoughts_queue`, in
+batches by ID. A trigger queues thoughts on insert, in the transaction of the
+insert, so a long import that commits late is still picked up, which an ID
+watermark would skip. A batch is removed from the queue in its transaction.
+Neighbor lists of older thoughts are updated with the new thoughts as
+candidates and trimmed back to k.
+"""
+import logging
+import time
+from typing import List
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from db.session import get_db_session
+from utils.vectors import set_ann_search
+
+logger = logging.getLogger(__name__)
+
+
+class RelatedThoughts:
+    def __init__(self, k: int = settings.RELATED_THOUGHTS_K, batch_size: int = settings.RELATED_THOUGHTS_BATCH_SIZE):
+        if k <= 0 or batch_size <= 0:
+            raise ValueError("k and batch_size must be positive")
+        self.k = k
+        self.batch_size = batch_size
+
+    def _process_batch(self, session: Session, thought_ids: List[int]) -> int:
+        """Computes and stores neighbors of a batch of thoughts and dequeues them, returns number of rows written."""
+        params = {"ids": thought_ids, "k": self.k}
+        set_ann_search(session, candidates=self.k)
+
+        # kNN of the whole batch in one statement, each lateral query uses the DiskANN index
+        written = session.execute(text("""
+            INSERT INTO thought_neighbors (thought_id, neighbor_id, distance)
+            SELECT b.thought_id, n.thought_id, n.distance
+            FROM thoughts b
+            CROSS JOIN LATERAL (
+                SELECT t.thought_id, (t.embedding <=> b.embedding) AS distance
+                FROM thoughts t
+                WHERE t.thought_id <> b.thought_id
+                ORDER BY t.embedding <=> b.embedding
+                LIMIT :k
+            ) n
+            WHERE b.thought_id = ANY(:ids)
+            ON CONFLICT (thought_id, neighbor_id) DO UPDATE SET distance = EXCLUDED.distance
+        """), params).rowcount
+
+        # New thoughts become candidates of their neighbors
+        written += session.execute(text("""
+            INSERT INTO thought_neighbors (thought_id, neighbor_id, distance)
+            SELECT neighbor_id, thought_id, distance
+            FROM thought_neighbors
+            WHERE thought_id = ANY(:ids)
+            ON CONFLICT (thought_id, neighbor_id) DO UPDATE SET distance = EXCLUDED.distance
+        """), params).rowcount
+
+        # Keep only top k of the updated neighbor lists
+        session.execute(text("""
+            DELETE FROM thought_neighbors tn
+            USING (
+                SELECT thought_id, neighbor_id,
+                       row_number() OVER (PARTITION BY thought_id ORDER BY distance, neighbor_id) AS rank
+                FROM thought_neighbors
+                WHERE thought_id IN (SELECT neighbor_id FROM thought_neighbors WHERE thought_id = ANY(:ids))
+            ) ranked
+            WHERE tn.thought_id = ranked.thought_id
+              AND tn.neighbor_id = ranked.neighbor_id
+              AND ranked.rank > :k
+        """), params)
+
+        session.execute(text("DELETE FROM related_thoughts_queue WHERE thought_id = ANY(:ids)"), params)
+        return written
+
+    def run(self) -> int:
+        """Processes all queued thoughts, one transaction per batch. Returns number of thoughts processed."""
+        start_time = time.time()
+        processed = 0
+        while True:
+            with get_db_session() as session:
+                # Batches locked by a concurrent run are skipped
+                thought_ids = session.execute(text("""
+                    SELECT thought_id FROM related_thoughts_queue
+                    ORDER BY thought_id
+                    LIMIT :limit
+                    FOR UPDATE SKIP LOCKED
+                """), {"limit": self.batch_size}).scalars().all()
+                if not thought_ids:
+                    break
+
+                written = self._process_batch(session, list(thought_ids))
+                processed += len(thought_ids)
+                logger.debug(f"Related thoughts batch: {len(thought_ids)} thoughts up to ID {thought_ids[-1]}, {written} rows written")
+
+        if processed:
+            logger.info(f"Related thoughts updated for {processed} thoughts in {time.time() - start_time:.4f} seconds")
+        return processed
+
+
+def get_related_thoughts(session: Session, thought_id: int, limit: int) -> List[dict]:
+    """Precomputed related thoughts of a thought, nearest first. Discarded thoughts are excluded."""
+    rows = session.execute(text("""
+        SELECT t.thought_id, t.text, t.created_at, tn.distance
+        FROM thought_neighbors tn
+        JOIN thoughts t ON t.thought_id = tn.neighbor_id
+        WHERE tn.thought_id = :thought_id AND t.srs_discard IS NOT TRUE
+        ORDER BY tn.distance
+        LIMIT :limit
+    """), {"thought_id": thought_id, "limit": limit}).fetchall()
+    return [
+        {"thought_id": r[0], "text": r[1], "created_at": r[2], "distance": r[3]}
+        for r in rows
+    ]
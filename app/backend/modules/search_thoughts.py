@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import text
+
+from core.config import settings
+from core.tracing import tracer
+from db.session import get_db_session
+from utils.embeddings import get_embeddings
+from utils.vectors import storage_sql, set_ann_search
+
+logger = logging.getLogger(__name__)
+
+# ANN candidate list size default, raised for deep pages
+ANN_SEARCH_LIST_SIZE = 100
+
+
+class SearchThoughts:
+    """
+    Semantic search over stored thoughts.
+
+    Filters are part of the kNN query, the streaming DiskANN index keeps
+    returning candidates until the filtered page is filled.
+
+    With `hybrid`, full-text matches of the query are fused with the vector
+    results, to find exact terms like names and codes that embeddings miss.
+    """
+    def __init__(
+        self,
+        query: str,
+        limit: int = 10,
+        offset: int = 0,
+        source_types: Optional[List[str]] = None,
+        include_discarded: bool = False,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+        rescore: int = 0,
+        hybrid: bool = False,
+    ):
+        if not query:
+            raise ValueError("Search query is empty")
+
+        self.query = query
+        self.limit = limit
+        self.offset = offset
+        self.source_types = source_types or []
+        self.include_discarded = include_discarded
+        self.created_after = created_after
+        self.created_before = created_before
+        self.rescore = rescore
+        self.hybrid = hybrid
+
+    def _conditions(self) -> List[str]:
+        """Filters on `thoughts t`, shared by both search legs."""
+        conditions = []
+        if not self.include_discarded:
+            conditions.append("t.srs_discard IS NOT TRUE")
+        if self.created_after:
+            conditions.append("t.created_at >= :created_after")
+        if self.created_before:
+            conditions.append("t.created_at < :created_before")
+        if self.source_types:
+            conditions.append("""EXISTS (
+                    SELECT 1 FROM thought_sources ts
+                    JOIN sources s ON s.vertex_id = ts.vertex_id
+                    WHERE ts.thought_id = t.thought_id AND s.source_type = ANY(:source_types)
+                )""")
+        return conditions
+
+    def _statement(self):
+        query_vector = storage_sql(":embedding")
+        conditions = self._conditions()
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # Score: cosine similarity
+        return text(f"""
+            SELECT
+                t.thought_id,
+                t.text,
+                t.created_at,
+                (t.embedding <=> {query_vector}) AS distance,
+                1 - (t.embedding <=> {query_vector}) AS score
+            FROM thoughts t
+            {where_clause}
+            ORDER BY t.embedding <=> {query_vector}
+            LIMIT :limit OFFSET :offset
+        """)
+
+    def _hybrid_statement(self):
+        """
+        Full-text and vector search in one statement, merged by reciprocal rank fusion.
+
+        Each leg returns at most `:candidates` rows. The full-text leg ranks at most
+        `:fulltext_scan_max` matches, so the cost of frequent terms does not grow
+        with the table. Trade-off in recall: a query matching more thoughts ranks
+        the first matches found by the index, not all of them, and may miss the
+        best full-text matches. The vector leg is not affected.
+        """
+        query_vector = storage_sql(":embedding")
+        conditions = self._conditions()
+        and_conditions = "".join(f" AND {c}" for c in conditions)
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        return text(f"""
+            WITH semantic AS (
+                SELECT thought_id, row_number() OVER (ORDER BY distance) AS rank
+                FROM (
+                    SELECT t.thought_id, (t.embedding <=> {query_vector}) AS distance
+                    FROM thoughts t
+                    {where_clause}
+                    ORDER BY t.embedding <=> {query_vector}
+                    LIMIT :candidates
+                ) nearest
+            ),
+            fulltext AS (
+                SELECT thought_id, row_number() OVER (ORDER BY text_rank DESC, thought_id) AS rank
+                FROM (
+                    SELECT matched.thought_id, ts_rank_cd(matched.text_search, q) AS text_rank
+                    FROM (
+                        -- Bounded before ranking, see the docstring
+                        SELECT t.thought_id, t.text_search
+                        FROM thoughts t, websearch_to_tsquery('simple', :query) q
+                        WHERE t.text_search @@ q{and_conditions}
+                        LIMIT :fulltext_scan_max
+                    ) matched, websearch_to_tsquery('simple', :query) q
+                    ORDER BY text_rank DESC, matched.thought_id
+                    LIMIT :candidates
+                ) ranked
+            ),
+            fused AS (
+                SELECT
+                    coalesce(s.thought_id, f.thought_id) AS thought_id,
+                    coalesce(1.0 / (:rrf_k + s.rank), 0) + coalesce(1.0 / (:rrf_k + f.rank), 0) AS score
+                FROM semantic s
+                FULL OUTER JOIN fulltext f ON s.thought_id = f.thought_id
+            )
+            SELECT
+                t.thought_id,
+                t.text,
+                t.created_at,
+                (t.embedding <=> {query_vector}) AS distance,
+                fused.score
+            FROM fused
+            JOIN thoughts t ON t.thought_id = fused.thought_id
+            ORDER BY fused.score DESC, t.thought_id
+            LIMIT :limit OFFSET :offset
+        """)
+
+    def search(self) -> List[dict]:
+        """Returns matched thoughts, best score first."""
+        start_time = time.time()
+        embedding = asyncio.run(get_embeddings([self.query], use_cache=True))[0]
+
+        params = {
+            "embedding": embedding,
+            "limit": self.limit,
+            "offset": self.offset,
+            "created_after": self.created_after,
+            "created_before": self.created_before,
+            "source_types": self.source_types,
+        }
+        if self.hybrid:
+            statement = self._hybrid_statement()
+            params.update({
+                "query": self.query,
+                "candidates": max(settings.SEARCH_HYBRID_CANDIDATES, self.limit + self.offset),
+                "fulltext_scan_max": settings.SEARCH_FULLTEXT_SCAN_MAX,
+                "rrf_k": settings.SEARCH_RRF_K,
+            })
+        else:
+            statement = self._statement()
+
+        with get_db_session() as session:
+            # Transaction scoped index settings
+            set_ann_search(
+                session,
+                candidates=max(ANN_SEARCH_LIST_SIZE, self.limit + self.offset),
+                rescore=self.rescore or settings.DISKANN_QUERY_RESCORE,
+            )
+
+            with tracer.start_as_current_span("search.query", attributes={"search.hybrid": self.hybrid, "search.limit": self.limit}) as span:
+                rows = session.execute(statement, params).fetchall()
+                span.set_attribute("db.response.rows", len(rows))
+
+        results = [
+            {
+                "thought_id": thought_id,
+                "text": thought_text,
+                "created_at": created_at,
+                "distance": distance,
+                "score": score,
+            }
+            for thought_id, thought_text, created_at, distance, score in rows
+        ]
+        logger.info(f"Search found {len(results)} thoughts in {time.time() - start_time:.4f} seconds")
+        return results
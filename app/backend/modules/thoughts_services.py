@@ -1,16 +1,23 @@
-import asyncio
-import json
 import logging
+import re
 import time
+import numpy as np
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
-from sqlalchemy import text
+from sqlalchemy import text, select, event
+from sqlalchemy.dialects.postgresql import insert
+from opentelemetry import trace
 
-from db.models import Thoughts
+from db.models import Thoughts, Sources, ThoughtSources, SourceNotes
 from db.s3 import upload_texts_to_s3
-from utils.helpers import execute_cypher
-from utils.embeddings import get_embeddings
+from db.session import SessionLocal
+from utils.helpers import execute_cypher, LRUCache, canonical_source_keys, source_hash, text_hash
+from utils.embeddings import get_embeddings, vector_dimension
+from utils.vectors import collapse_near_duplicates, storage_sql, set_ann_search, truncate_embeddings
 from core.config import settings
+from core.deadline import CallDeadline
+from core.tracing import tracer
+from core.usage import usage_context
 from enums import ThoughtType
 
 # temp
@@ -19,28 +26,89 @@ nest_asyncio.apply()
 
 logger = logging.getLogger(__name__)
 
+# Property keys are part of the Cypher query text, only allow plain names
+CYPHER_PROPERTY_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+SOURCE_RESERVED_PROPERTIES = {'keys', 'created_at'}
+
+# Recent sources: hash of canonical keys -> AGE vertex ID
+_source_cache = LRUCache(maxsize=settings.SOURCE_CACHE_SIZE)
+# Sources created in a session, cached only once committed
+PENDING_SOURCES_KEY = "pending_sources"
+
+@event.listens_for(SessionLocal, "after_commit")
+def _cache_committed_sources(session: Session) -> None:
+    for hash_value, vertex_id in session.info.pop(PENDING_SOURCES_KEY, {}).items():
+        _source_cache.put(hash_value, vertex_id)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_pending_sources(session: Session) -> None:
+    session.info.pop(PENDING_SOURCES_KEY, None)
+
 # TO-DO: connection re-create after database server restart.
 class ThoughtsService:
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, deadline: Optional[CallDeadline] = None):
+        """
+        Args:
+          - deadline: of the calling RPC, work stops with `CallCancelled` once it is cancelled or expired
+        """
         self.session = session
-
-    def add_source(self, keys: dict, properties: dict = {}, contents: List[str] = []):
+        self.deadline = deadline or CallDeadline()
+
+        remaining = self.deadline.remaining()
+        if remaining is not None:
+            # Statements of this transaction end by the deadline too
+            self.session.execute(text(f"SET LOCAL statement_timeout = {max(int(remaining * 1000), 1)}"))
+
+    def _find_source(self, hash_value: bytes) -> Optional[int]:
+        """Vertex ID of a source by hash: pending in this session, LRU, then the unique index."""
+        pending = self.session.info.get(PENDING_SOURCES_KEY, {})
+        if hash_value in pending:
+            return pending[hash_value]
+
+        vertex_id = _source_cache.get(hash_value)
+        if vertex_id is not None:
+            return vertex_id
+
+        vertex_id = self.session.execute(
+            select(Sources.vertex_id).where(Sources.source_hash == hash_value)
+        ).scalar_one_or_none()
+        if vertex_id is not None:
+            _source_cache.put(hash_value, vertex_id)
+        return vertex_id
+
+    @tracer.start_as_current_span("thoughts.add_source")
+    def add_source(self, keys: dict, properties: dict = {}, contents: List[str] = []) -> int:
         """
-        Creates/merges a Source vertex, add or update properties.
+        Gets or creates a Source vertex, add or update properties.
         With keys as a group of identifiers for this source.
         Upload contents to S3 and save list of links.
 
+        Sources are identified by hash of the canonical keys, looked up
+        in the `sources` table instead of matching the keys map in the graph.
+
         Args:
           - keys: dict of identifiers including type
           - properties: additional properties for vertex
           - contents: list of original contents of this source
 
+        Returns: AGE vertex ID of the source
+
         TO-DO: keys must contains type and at least another identifier.
         """
 
         if not keys or not isinstance(keys, dict):
             raise ValueError("Source vertex keys must be a non-empty dictionary.")
 
+        keys = canonical_source_keys(keys)
+        if not keys.get('type'):
+            raise ValueError("Source vertex keys must contain `type`.")
+
+        properties = dict(properties) # Avoid changing the caller's dict
+        for key in properties:
+            if not CYPHER_PROPERTY_KEY.match(key) or key in SOURCE_RESERVED_PROPERTIES:
+                raise ValueError(f"Invalid Source property key: {key}")
+
+        self.deadline.check("thoughts.add_source")
         try:
             # TO-DO: move save contents logic out
             # Upload contents to S3
@@ -51,65 +119,86 @@ class ThoughtsService:
             if content_link: # Avoid add empty properties
                 properties['contents'] = content_link
 
-            # Build the SET clauses
-            set_clauses = ["v.created_at = timestamp()"]
-            cypher_params = {
-                "keys_param": keys
-            }
-
-            for key, value in properties.items():
-                set_clauses.append(f"v.{key} = ${key}")
-                cypher_params[key] = value
-
-            set_clause_string = ",\n                ".join(set_clauses)
-
-            # Cypher query: add or update properties
-            cypher_query_string = f"""
-                MERGE (v:Source {{ keys: $keys_param }})
-                SET
-                    {set_clause_string}
-                RETURN id(v), properties(v)
-            """
+            hash_value = source_hash(keys)
+            vertex_id = self._find_source(hash_value)
 
-            # !IMPORTANT: use parameter for graph name will result in error
-            sql_command = text(f"""
-                SELECT * FROM cypher(
-                    '{settings.GRAPH_NAME}',
-                    $$ {cypher_query_string} $$,
-                    :cypher_params
+            if vertex_id is None:
+                # Serialize creation of the same source, then check again
+                self.session.execute(
+                    text("SELECT pg_advisory_xact_lock(:lock_key)"),
+                    {"lock_key": int.from_bytes(hash_value[:8], "big", signed=True)},
                 )
-                AS (id agtype, properties agtype);;
-            """)
+                vertex_id = self._find_source(hash_value)
 
-            result = self.session.execute(
-                sql_command,
-                { "cypher_params": json.dumps(cypher_params) }
-            )
+            if vertex_id is None:
+                cypher_query_string = """
+                    CREATE (v:Source {keys: $keys_param, created_at: timestamp()})
+                    RETURN id(v)
+                """
+                vertex_data = execute_cypher(self.session, cypher_query_string, {"keys_param": keys})[0]
+                vertex_id = int(vertex_data[0])
+
+                self.session.add(Sources(
+                    source_hash=hash_value,
+                    vertex_id=vertex_id,
+                    source_type=keys['type'],
+                    keys=keys,
+                ))
+                self.session.flush()
+                # Cache only after commit, see `_cache_committed_sources`
+                self.session.info.setdefault(PENDING_SOURCES_KEY, {})[hash_value] = vertex_id
+                logger.debug(f"Added Source vertex: id {vertex_id}, keys {keys}")
+
+            if properties:
+                # Build the SET clauses, property values are passed as parameters
+                set_clauses = []
+                cypher_params = {"vertex_id": vertex_id}
+                for key, value in properties.items():
+                    set_clauses.append(f"v.{key} = $prop_{key}")
+                    cypher_params[f"prop_{key}"] = value
+                set_clause_string = ",\n                    ".join(set_clauses)
+
+                # Cypher query: add or update properties
+                cypher_query_string = f"""
+                    MATCH (v:Source)
+                    WHERE id(v) = $vertex_id
+                    SET
+                        {set_clause_string}
+                    RETURN properties(v)
+                """
+                vertex_data = execute_cypher(self.session, cypher_query_string, cypher_params)[0]
+                logger.debug(f"Updated Source vertex: id {vertex_id}, properties {vertex_data[0]}")
 
-            vertex_data = result.fetchone()
-            logger.debug(f"Added Source vertex: id {vertex_data[0]}, properties {vertex_data[1]}")
-            
-            return vertex_data
+            return vertex_id
 
         except Exception as e:
             logger.error(f"Failed to add Source vertex: {e}")
-            raise Exception(e)
+            raise # Keeps the type, statement timeouts are reported as deadline exceeded by the interceptor
 
     def add_thought(self, 
                     text: str, 
                     task: ThoughtType, 
                     source_ids: List[int], 
-                    embedding: Optional[List[float]] = None
+                    embedding: Optional[np.ndarray] = None
                     ) -> Thoughts:
-        """Adds a Thought to the DB, creates AGE vertex, and links to sources."""
+        """
+        Adds a Thought to the DB, creates AGE vertex, and links to sources.
+
+        Args:
+          - source_ids: AGE vertex IDs of the sources, as returned by `add_source`
+        """
         if not source_ids:
             raise ValueError("At least one source_id must be provided.")
 
-        if embedding:
-            if len(embedding) != settings.VECTOR_DIMENSION:
-                raise ValueError(f"Provided embedding dimension {len(embedding)} != required {settings.VECTOR_DIMENSION}")
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            dimension = vector_dimension()
+            if len(embedding) > dimension:
+                embedding = truncate_embeddings(embedding[np.newaxis], dimension)[0]
+            if len(embedding) != dimension:
+                raise ValueError(f"Provided embedding dimension {len(embedding)} != required {dimension}")
         else:
-            embedding = asyncio.run(get_embeddings([text]))[0]
+            embedding = self.deadline.run(get_embeddings([text]), "embeddings")[0]
 
         # Check for duplication
         duplicate = self.find_similar_content(
@@ -121,51 +210,222 @@ class ThoughtsService:
                         limit = 1,
                         distance_max = settings.DUPLICATE_EMBEDDING_DISTANCE_MAX,
                     )[0]['neighbors']
+        if not duplicate:
+            # The same text added by a concurrent call after the check: the insert waits
+            # for its transaction, then the committed thought is taken as duplicate
+            hash_value = text_hash(text)
+            thought_id = self.session.execute(
+                insert(Thoughts)
+                .values(text=text, embedding=embedding, text_hash=hash_value)
+                .on_conflict_do_nothing(index_elements=["text_hash"])
+                .returning(Thoughts.thought_id)
+            ).scalar_one_or_none()
+            if thought_id is None:
+                existing_id, existing_text = self.session.execute(
+                    select(Thoughts.thought_id, Thoughts.text).where(Thoughts.text_hash == hash_value)
+                ).one()
+                duplicate = [{"id": existing_id, "text": existing_text, "distance": 0.0}]
+
         if duplicate:
             logger.info(f"Duplicate found in table '{Thoughts.__tablename__}' with embedding distance {duplicate[0]['distance']}, original text: {text}")
             thought_id = duplicate[0]['id']
             # TO-DO: shall we create locally or fetch from db to match the result below?
             db_thought = Thoughts(thought_id=thought_id, text=duplicate[0]['text'])
+
+            # Lookup by the indexed `pg_table_id` property
+            cypher_query_thought = """
+            MATCH (t:Thought)
+            WHERE t.pg_table_id = $thought_id
+            RETURN id(t)
+            """
+            graph_thought_result = execute_cypher(
+                self.session, cypher_query_thought, {"thought_id": thought_id}
+            )
+            if not graph_thought_result:
+                raise ValueError(f"AGE vertex Thought not found for thought_id {thought_id}")
         else:
-            db_thought = Thoughts(text=text, embedding=embedding)
-            self.session.add(db_thought)
-            self.session.flush() # Get the thought_id
-            thought_id = db_thought.thought_id # TO-DO: could it be invalid?
+            db_thought = Thoughts(thought_id=thought_id, text=text)
             logger.info(f"Thought created with id: {thought_id}")
 
-            # Create thought vertex in AGE
-            cypher_query_thought = f"""
-            MERGE (t:Thought {{
-                pg_table_id: {thought_id}
-            }})
-            RETURN t
+            # Create thought vertex in AGE, the thought is new so no MERGE needed
+            cypher_query_thought = """
+            CREATE (t:Thought {pg_table_id: $thought_id})
+            RETURN id(t)
             """
             try:
-                graph_thought_result = execute_cypher(self.session, cypher_query_thought)
+                graph_thought_result = execute_cypher(
+                    self.session, cypher_query_thought, {"thought_id": thought_id}
+                )
                 logger.info(f"AGE vertex Thought creation result: {graph_thought_result}")
             except Exception as e:
                 logger.error(f"Failed to create AGE vertex thought for thought_id {thought_id}: {e}")
                 raise
+        thought_vertex_id = int(graph_thought_result[0][0])
 
-        # Link thought to each source vertex in AGE
+        # Link thought to each source vertex in AGE, match both ends by vertex ID
         # Set `task` as `type` of the connection
         for source_id in source_ids:
             logger.info(f"Linking thought {thought_id} to source {source_id}")
-            cypher_query_edge = f"""
-            MATCH (t:Thought {{pg_table_id: {thought_id}}})
-            MATCH (s:Source {{pg_table_id: {source_id}}})
-            MERGE (s)-[r:DERIVED_TO {{type: '{task.name}'}}]->(t)
+            cypher_query_edge = """
+            MATCH (s:Source), (t:Thought)
+            WHERE id(s) = $source_id AND id(t) = $thought_vertex_id
+            MERGE (s)-[r:DERIVED_TO {type: $task}]->(t)
             RETURN r
             """
             try:
-                graph_edge_result = execute_cypher(self.session, cypher_query_edge)
+                graph_edge_result = execute_cypher(
+                    self.session,
+                    cypher_query_edge,
+                    {"thought_vertex_id": thought_vertex_id, "source_id": source_id, "task": task.name},
+                )
+                if not graph_edge_result:
+                    raise ValueError(f"Vertex not found, source {source_id} or thought vertex {thought_vertex_id}")
                 logger.info(f"AGE DERIVED_TO edge creation result: {graph_edge_result}")
             except Exception as e:
                 logger.error(f"Failed linking thought {thought_id} to source {source_id}: {e}")
                 raise
 
+        # Relational copy of the links, for filtering thoughts by source in SQL
+        self.session.execute(
+            insert(ThoughtSources)
+            .values([{"thought_id": thought_id, "vertex_id": source_id} for source_id in source_ids])
+            .on_conflict_do_nothing()
+        )
+
         return db_thought
 
+    @tracer.start_as_current_span("thoughts.link")
+    def link_thoughts(self, thought_ids: List[int], source_ids: List[int], task: ThoughtType) -> int:
+        """
+        Links existing thoughts to sources, skips links that already exist.
+
+        Args:
+          - thought_ids: IDs of rows in table thoughts
+          - source_ids: AGE vertex IDs of the sources
+
+        Returns: number of links created
+        """
+        created = 0
+        for source_id in source_ids:
+            linked = set(self.session.execute(
+                select(ThoughtSources.thought_id).where(
+                    ThoughtSources.vertex_id == source_id,
+                    ThoughtSources.thought_id.in_(thought_ids),
+                )
+            ).scalars())
+            to_link = [i for i in dict.fromkeys(thought_ids) if i not in linked]
+            if not to_link:
+                continue
+
+            # One Cypher call for all thoughts of this source
+            cypher_query_edges = """
+            UNWIND $thought_ids AS thought_id
+            MATCH (t:Thought)
+            WHERE t.pg_table_id = thought_id
+            MATCH (s:Source)
+            WHERE id(s) = $source_id
+            MERGE (s)-[r:DERIVED_TO {type: $task}]->(t)
+            RETURN count(r)
+            """
+            execute_cypher(
+                self.session,
+                cypher_query_edges,
+                {"thought_ids": to_link, "source_id": source_id, "task": task.name},
+            )
+            self.session.execute(
+                insert(ThoughtSources)
+                .values([{"thought_id": thought_id, "vertex_id": source_id} for thought_id in to_link])
+                .on_conflict_do_nothing()
+            )
+            created += len(to_link)
+            logger.info(f"Linked {len(to_link)} existing thoughts to source {source_id}")
+
+        return created
+
+    def _add_contents(self, contents: List[str], task: ThoughtType, source_ids: List[int]) -> List[int]:
+        """
+        Adds thoughts and links them to sources, records them as notes of the sources.
+
+        Exact duplicates, by hash of the normalized text, are found with one
+        query for the whole batch and skip embedding and the similarity check.
+
+        Returns: thought ID per item of `contents`
+        """
+        # Exact duplicates: in database, or earlier in this batch
+        with tracer.start_as_current_span("dedup.exact_hash", attributes={"dedup.items": len(contents)}) as span:
+            hashes = [text_hash(content) for content in contents]
+            existing = dict(self.session.execute(
+                select(Thoughts.text_hash, Thoughts.thought_id).where(Thoughts.text_hash.in_(set(hashes)))
+            ).all())
+            span.set_attribute("dedup.existing", len(existing))
+        first_of_hash = {}
+        for index, hash_value in enumerate(hashes):
+            first_of_hash.setdefault(hash_value, index)
+        pending = [
+            index for index, hash_value in enumerate(hashes)
+            if hash_value not in existing and first_of_hash[hash_value] == index
+        ]
+        logger.info(f"Collection of {len(contents)} items: {len(hashes) - len(pending)} exact duplicates, {len(pending)} to check")
+
+        if existing:
+            self.link_thoughts(list(existing.values()), source_ids, task)
+
+        added = {} # Index -> thought ID, of items added or matched by similarity
+        if pending:
+            # Generate embeddings for all pending contents at once
+            pending_contents = [contents[index] for index in pending]
+            embeddings = self.deadline.run(get_embeddings(pending_contents), "embeddings")
+            # Basic verification
+            if len(embeddings) != len(pending_contents):
+                raise ValueError("Embedding generation returned incorrect number of vectors.")
+
+            # Collapse near duplicates within the batch, only representatives go to the database
+            with tracer.start_as_current_span("dedup.in_batch", attributes={"dedup.items": len(pending)}):
+                representatives = collapse_near_duplicates(
+                    embeddings,
+                    distance_max=settings.DUPLICATE_EMBEDDING_DISTANCE_MAX,
+                    block_size=settings.DEDUP_BLOCK_SIZE,
+                )
+
+            # Add thoughts and link them
+            with tracer.start_as_current_span("thoughts.add", attributes={"thoughts.items": len(pending)}):
+                for position, index in enumerate(pending):
+                    self.deadline.check("thoughts.add")
+                    representative = pending[int(representatives[position])]
+                    if representative != index:
+                        logger.info(f"Duplicate within batch, item {index} of item {representative}, text: {contents[index]}")
+                        added[index] = added[representative]
+                        continue
+
+                    thought = self.add_thought(
+                        text=contents[index],
+                        task=task,
+                        source_ids=source_ids, 
+                        embedding=embeddings[position]
+                    )
+                    added[index] = thought.thought_id
+
+        thought_ids = []
+        for index, hash_value in enumerate(hashes):
+            if hash_value in existing:
+                thought_ids.append(existing[hash_value])
+            else:
+                thought_ids.append(added[first_of_hash[hash_value]])
+
+        # Fingerprints of the ingested notes, for incremental re-imports
+        notes = {hash_value: thought_id for hash_value, thought_id in zip(hashes, thought_ids)}
+        for source_id in source_ids:
+            self.session.execute(
+                insert(SourceNotes)
+                .values([
+                    {"vertex_id": source_id, "text_hash": hash_value, "thought_id": thought_id}
+                    for hash_value, thought_id in notes.items()
+                ])
+                .on_conflict_do_nothing()
+            )
+
+        return thought_ids
+
     def add_collection(self, 
                        contents: List[str],
                        task: ThoughtType,
@@ -177,52 +437,87 @@ class ThoughtsService:
         
         Args:
           - contents: list of thoughts
+
+        Returns: source IDs, and thought ID per item of `contents`
         """
         logger.debug(f"Adding collection: source keys {source_keys}, source properties {source_properties}, {len(contents)} thoughts.")
 
         # Add the source first
-        source = self.add_source(keys=source_keys, properties=source_properties, contents=source_contents)
-        source_ids = [source[0]]
+        source_id = self.add_source(keys=source_keys, properties=source_properties, contents=source_contents)
+        source_ids = [source_id]
 
-        # Generate embeddings for all contents at once (more efficient potentially)
-        thought_ids = []
-        if contents:
-            embeddings = asyncio.run(get_embeddings(contents))
-            # Basic verification
-            if len(embeddings) != len(contents):
-                raise ValueError("Embedding generation returned incorrect number of vectors.")
-
-            # Add thoughts and link them
-            for index, content in enumerate(contents):
-                embed = embeddings[index]
-                thought = self.add_thought(
-                    text=content,
-                    task=task,
-                    source_ids=source_ids, 
-                    embedding=embed
-                )
-                thought_ids.append(thought.thought_id)
-        else:
+        if not contents:
             logger.warning("add_collection called with empty contents list.")
+            return source_ids, []
+
+        # Model calls are recorded by source, see `core.usage`
+        with usage_context(source_type=source_keys.get('type'), source_id=source_id):
+            return source_ids, self._add_contents(contents, task, source_ids)
+
+    @tracer.start_as_current_span("thoughts.sync_collection")
+    def sync_collection(self,
+                        contents: List[str],
+                        task: ThoughtType,
+                        source_keys: dict,
+                        source_properties: dict = {},
+                        source_contents: List[str] = []
+                    ) -> Dict[str, int]:
+        """
+        Re-imports the full list of notes of a source, only new notes are added.
 
-        return source_ids, thought_ids
+        Exports like Kindle highlights are cumulative, each one contains all earlier
+        notes. The list is compared with the fingerprints of notes already ingested
+        from the source. Notes missing from the list are counted as removed, their
+        thoughts are kept.
+
+        Returns: dict of source_id, and counts of added, unchanged and removed notes
+        """
+        start_time = time.time()
+        source_id = self.add_source(keys=source_keys, properties=source_properties, contents=source_contents)
+
+        fingerprints = set(self.session.execute(
+            select(SourceNotes.text_hash).where(SourceNotes.vertex_id == source_id)
+        ).scalars())
+        hashes = {}
+        for content in contents:
+            hashes.setdefault(text_hash(content), content)
+        new_contents = [content for hash_value, content in hashes.items() if hash_value not in fingerprints]
+
+        if new_contents:
+            with usage_context(source_type=source_keys.get('type'), source_id=source_id):
+                self._add_contents(new_contents, task, [source_id])
+
+        result = {
+            "source_id": source_id,
+            "added": len(new_contents),
+            "unchanged": len(hashes) - len(new_contents),
+            "removed": len(fingerprints.difference(hashes)),
+        }
+        span = trace.get_current_span()
+        for key in ("added", "unchanged", "removed"):
+            span.set_attribute(f"notes.{key}", result[key])
+        logger.info(f"Synced source {source_id}: {result['added']} added, {result['unchanged']} unchanged, "
+                    f"{result['removed']} removed, in {time.time() - start_time:.4f} seconds")
+        return result
 
 
     def link_source_to_source(self, parent_source_id: int, child_source_id: int) -> Optional[List]:
-        """Creates a 'CONTAINS' relationship between two sources in AGE."""
+        """Creates a 'CONTAINS' relationship between two sources in AGE, by their vertex IDs."""
         if (parent_source_id == child_source_id or
             not parent_source_id or not child_source_id):
              raise ValueError(f"Source IDs not valid: {parent_source_id}, {child_source_id}")
         
         logger.info(f"Linking source {parent_source_id} --CONTAINS-> source {child_source_id}")
-        cypher_query = f"""
-        MATCH (parent:Source {{pg_table_id: {parent_source_id}}})
-        MATCH (child:Source {{pg_table_id: {child_source_id}}})
+        cypher_query = """
+        MATCH (parent:Source), (child:Source)
+        WHERE id(parent) = $parent_id AND id(child) = $child_id
         MERGE (parent)-[r:CONTAINS]->(child) /* Use MERGE to avoid duplicate edges */
         RETURN r
         """
         try:
-            graph_result = execute_cypher(self.session, cypher_query)
+            graph_result = execute_cypher(
+                self.session, cypher_query, {"parent_id": parent_source_id, "child_id": child_source_id}
+            )
             logger.info(f"AGE CONTAINS edge creation/merge result: {graph_result}")
             return graph_result
         except Exception as e:
@@ -238,7 +533,7 @@ class ThoughtsService:
             limit: int = 1,
             distance_max: float = 2,
             embedding_column: str = 'embedding',
-            embeddings: List[List[float]] = None,
+            embeddings: Optional[np.ndarray] = None,
         ) -> Dict[int, Dict[str, Any]]:
         """
         Checks a list of texts for similar content in a pgvector database based on cosine distance.
@@ -247,7 +542,7 @@ class ThoughtsService:
             texts_to_check: A list of strings to check for duplicates.
             distance_max: The max cosine distance score (0.0 to 2.0)
             limit: select rows from top results
-            embeddings: list of embedding corresponding to the texts
+            embeddings: embeddings corresponding to the texts, one per row
 
         Returns:
             A dictionary where keys are the indices of the input texts in `texts_to_check`.
@@ -261,58 +556,58 @@ class ThoughtsService:
 
         start_time = time.time()
 
-        if embeddings:
+        if embeddings is not None:
             if len(texts_to_check) != len(embeddings):
                 raise ValueError(f"Number of texts and embeddings does not match")
         else:
-            embeddings = asyncio.run(get_embeddings(texts_to_check))
-
-        for i, (input_text, query_embedding) in enumerate(zip(texts_to_check, embeddings)):
-            # Search using cosine distance (<->)
-            # The <-> operator calculates distance (0=identical, 1=orthogonal, 2=opposite).
-
-            stmt = text(
-                f"""
-                SELECT
-                    {id_column},
-                    {text_column},
-                    ({embedding_column} <-> :embedding ::vector) AS distance
-                FROM {table_name}
-                ORDER BY distance ASC
-                LIMIT {limit}
-                """
-            )
+            embeddings = self.deadline.run(get_embeddings(texts_to_check), "embeddings")
+
+        set_ann_search(self.session)
+        with tracer.start_as_current_span("dedup.ann", attributes={"dedup.queries": len(texts_to_check), "db.table": table_name}):
+            for i, (input_text, query_embedding) in enumerate(zip(texts_to_check, embeddings)):
+                self.deadline.check("dedup.ann")
+                # Search using cosine distance (<=>), matching the `vector_cosine_ops` DiskANN index
+                # The <=> operator calculates distance (0=identical, 1=orthogonal, 2=opposite).
+
+                stmt = text(
+                    f"""
+                    SELECT
+                        {id_column},
+                        {text_column},
+                        ({embedding_column} <=> {storage_sql(":embedding")}) AS distance
+                    FROM {table_name}
+                    ORDER BY distance ASC
+                    LIMIT {limit}
+                    """
+                )
+
+                # Execute the query, binding the embedding vector
+                try:
+                    query_results = self.session.execute(
+                        stmt, {"embedding": np.asarray(query_embedding, dtype=np.float32)}
+                    ).fetchall()
+                except Exception as e:
+                    # The transaction is aborted, the call can not go on without the result
+                    logger.error(f"Error querying database for text index {i}: {e}")
+                    raise
+
+                found_neighbors = []
+
+                # Process db results
+                if query_results:
+                    for query_result in query_results:
+                        db_id, db_text, distance = query_result
+                        if distance <= distance_max:
+                            found_neighbors.append({
+                                "id": db_id,
+                                "text": db_text,
+                                "distance": distance
+                            })
 
-            # Execute the query, binding the embedding vector
-            try:
-                query_results = self.session.execute(stmt, {"embedding": query_embedding}).fetchall()
-            except Exception as e:
-                logger.error(f"Error querying database for text index {i}: {e}")
-                # Error handle
                 results[i] = {
                     "input_text": input_text,
-                    "neighbors": [],
-                    "error": str(e)
+                    "neighbors": found_neighbors,
                 }
-                continue
-
-            found_neighbors = []
-
-            # Process db results
-            if query_results:
-                for query_result in query_results:
-                    db_id, db_text, distance = query_result
-                    if distance <= distance_max:
-                        found_neighbors.append({
-                            "id": db_id,
-                            "text": db_text,
-                            "distance": distance
-                        })
-
-            results[i] = {
-                "input_text": input_text,
-                "neighbors": found_neighbors,
-            }
 
         query_time = time.time()
         logger.info(f"Total processing time (find similar content): {query_time - start_time:.4f} seconds")
@@ -0,0 +1,228 @@
+"""
+Sync a local vault of Markdown files, for example an Obsidian vault.
+
+Each file is a source of type `markdown`, its paragraphs are notes. A manifest
+of mtime, size and content hash per file is kept in `vault_files`, a resync only
+reads files whose mtime or size changed, and only ingests files whose content
+changed. Notes of a changed file are diffed with the notes ingested before,
+see `ThoughtsService.sync_collection`.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.dialects.postgresql import insert
+
+from core.config import settings
+from db.models import VaultFiles
+from db.session import get_db_session
+from enums import ThoughtType
+from modules.thoughts_services import ThoughtsService
+from utils.notes import extract_markdown_notes
+
+logger = logging.getLogger(__name__)
+
+MARKDOWN_EXTENSIONS = ('.md', '.markdown')
+FULL_SCAN = object() # Watcher marker: directory changed, rescan the whole vault
+
+
+class VaultSync:
+    SOURCE_TYPE = 'markdown'
+
+    def __init__(self, vault_dir: str, vault_name: Optional[str] = None):
+        self.vault_dir = os.path.abspath(vault_dir)
+        if not os.path.isdir(self.vault_dir):
+            raise ValueError(f"Vault directory not found: {vault_dir}")
+        self.vault_name = vault_name or os.path.basename(self.vault_dir)
+
+    def _relative(self, path: str) -> Optional[str]:
+        """Path relative to the vault, None if not a synced file. Hidden files and directories, like `.obsidian`, are skipped."""
+        relative = os.path.relpath(os.path.abspath(path), self.vault_dir)
+        parts = relative.split(os.sep)
+        if parts[0] == os.pardir or any(part.startswith('.') for part in parts):
+            return None
+        if not relative.lower().endswith(MARKDOWN_EXTENSIONS):
+            return None
+        return relative.replace(os.sep, '/')
+
+    def _scan_files(self) -> Dict[str, os.stat_result]:
+        """Stats of all Markdown files of the vault, by relative path."""
+        files = {}
+        stack = [self.vault_dir]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file() and entry.name.lower().endswith(MARKDOWN_EXTENSIONS):
+                        files[self._relative(entry.path)] = entry.stat()
+        return files
+
+    def _stat_paths(self, paths: Iterable[str]) -> Dict[str, os.stat_result]:
+        """Stats of existing files of `paths`, by relative path."""
+        files = {}
+        for path in paths:
+            try:
+                files[path] = os.stat(os.path.join(self.vault_dir, path))
+            except FileNotFoundError:
+                continue
+        return files
+
+    def _ingest_file(self, path: str, content: bytes, content_hash: bytes, stat: os.stat_result) -> int:
+        """Syncs notes of a file and updates its manifest row, in one transaction. Returns number of notes added."""
+        notes = extract_markdown_notes(content.decode(errors='replace'))
+        with get_db_session() as session:
+            added = 0
+            if notes:
+                result = ThoughtsService(session).sync_collection(
+                    contents=notes,
+                    task=ThoughtType.note,
+                    source_keys={'type': self.SOURCE_TYPE, 'vault': self.vault_name, 'path': path},
+                    source_properties={'title': os.path.splitext(os.path.basename(path))[0]},
+                )
+                added = result['added']
+
+            row = {
+                "vault": self.vault_name,
+                "path": path,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "content_hash": content_hash,
+            }
+            stmt = insert(VaultFiles).values(row)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=[VaultFiles.vault, VaultFiles.path],
+                set_={
+                    "mtime_ns": stmt.excluded.mtime_ns,
+                    "size": stmt.excluded.size,
+                    "content_hash": stmt.excluded.content_hash,
+                    "synced_at": func.now(),
+                },
+            ))
+        return added
+
+    def sync(self, paths: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        Syncs changed files of the vault.
+
+        Args:
+          - paths: relative paths to check, the whole vault if None
+
+        Returns: dict of counts
+        """
+        start_time = time.time()
+        if paths is None:
+            files = self._scan_files()
+        else:
+            paths = set(paths)
+            files = self._stat_paths(paths)
+
+        with get_db_session() as session:
+            stmt = select(VaultFiles.path, VaultFiles.mtime_ns, VaultFiles.size, VaultFiles.content_hash).where(
+                VaultFiles.vault == self.vault_name
+            )
+            if paths is not None:
+                stmt = stmt.where(VaultFiles.path.in_(paths))
+            manifest = {row[0]: row[1:] for row in session.execute(stmt).all()}
+
+        counts = {"files": len(files), "changed": 0, "touched": 0, "deleted": 0, "failed": 0, "notes_added": 0}
+        touched = []
+        for path, stat in files.items():
+            known = manifest.get(path)
+            if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+                continue
+
+            try:
+                with open(os.path.join(self.vault_dir, path), 'rb') as f:
+                    content = f.read()
+                content_hash = hashlib.sha256(content).digest()
+                if known and known[2] == content_hash:
+                    # Saved without changes, only update the stats
+                    touched.append({"vault": self.vault_name, "path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+                    continue
+
+                counts["notes_added"] += self._ingest_file(path, content, content_hash, stat)
+                counts["changed"] += 1
+            except Exception as e:
+                logger.error(f"Failed to sync vault file {path}: {e}")
+                counts["failed"] += 1
+
+        # Deleted files are removed from the manifest, their thoughts are kept
+        deleted = [path for path in manifest if path not in files]
+        with get_db_session() as session:
+            if touched:
+                session.execute(update(VaultFiles), touched) # Bulk update by primary key
+            if deleted:
+                session.execute(
+                    delete(VaultFiles).where(VaultFiles.vault == self.vault_name, VaultFiles.path.in_(deleted))
+                )
+        counts["touched"] = len(touched)
+        counts["deleted"] = len(deleted)
+
+        logger.info(f"Vault '{self.vault_name}' synced in {time.time() - start_time:.4f} seconds: {counts}")
+        return counts
+
+    def watch(self, debounce_seconds: float = settings.VAULT_DEBOUNCE_SECONDS) -> None:
+        """
+        Syncs the vault, then keeps syncing changed files until interrupted.
+
+        File events are collected until there are none for `debounce_seconds`,
+        so a burst of saves or a git pull is synced once.
+        """
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer # inotify on Linux
+        except ImportError as e:
+            raise RuntimeError("Watching a vault requires the `watchdog` package.") from e
+
+        self.sync()
+
+        pending = set()
+        lock = threading.Lock()
+        changed = threading.Event()
+        vault = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ('opened', 'closed_no_write'):
+                    return
+                with lock:
+                    if event.is_directory:
+                        if event.event_type in ('moved', 'deleted'):
+                            pending.add(FULL_SCAN)
+                    else:
+                        for path in (event.src_path, getattr(event, 'dest_path', '')):
+                            relative = vault._relative(path) if path else None
+                            if relative:
+                                pending.add(relative)
+                changed.set()
+
+        observer = Observer()
+        observer.schedule(Handler(), self.vault_dir, recursive=True)
+        observer.start()
+        logger.info(f"Watching vault '{self.vault_name}' at {self.vault_dir}")
+        try:
+            while True:
+                changed.wait()
+                # Debounce: wait for a quiet period
+                while True:
+                    changed.clear()
+                    if not changed.wait(debounce_seconds):
+                        break
+
+                with lock:
+                    paths = set(pending)
+                    pending.clear()
+                if not paths:
+                    continue
+                self.sync(None if FULL_SCAN in paths else paths)
+        except KeyboardInterrupt:
+            logger.info("Vault watcher stopped.")
+        finally:
+            observer.stop()
+            observer.join()
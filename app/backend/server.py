@@ -15,11 +15,20 @@ from servicers.config_servicer import ConfigServiceServicer
 from servicers.review_servicer import ReviewServiceServicer
 from servicers.add_servicer import DataServiceServicer
 from servicers.health_servicer import HealthServicer
+from servicers.usage_servicer import UsageServiceServicer
 
 # Import interceptors
 from interceptors.logging_timing import LoggingTimingInterceptor
+from interceptors.admission import AdmissionInterceptor, required_workers
+
+# Import scheduled jobs
+from modules.related_thoughts import RelatedThoughts
 
 from core.config import settings
+from core.metrics import observe_executor, start_metrics_server
+from core.tracing import init_tracing, shutdown_tracing
+from utils.embeddings import init_vector_dimension
+from utils.local_embeddings import local_worker
 
 # Import core settings or load from environment
 # from core.config import settings -> Adapt as needed
@@ -48,9 +57,21 @@ def _handle_sigterm(signum, frame):
         shutdown_result = _server.stop(30)
         shutdown_result.wait() # Wait for shutdown to complete
         logger.info("gRPC server stopped.")
+    shutdown_tracing()
     sys.exit(0)
 
 
+# --- Scheduled Jobs ---
+def _run_related_thoughts_job():
+    """Updates related thoughts every interval until shutdown."""
+    interval = settings.RELATED_THOUGHTS_INTERVAL_SECONDS
+    while not _stop_event.wait(interval):
+        try:
+            RelatedThoughts().run()
+        except Exception as e:
+            logger.error(f"Related thoughts job failed: {e}", exc_info=True)
+
+
 # --- Server Function ---
 def serve():
     global _server
@@ -59,7 +80,23 @@ def serve():
     signal.signal(signal.SIGTERM, _handle_sigterm)
     signal.signal(signal.SIGINT, _handle_sigterm)
 
-    interceptors = [LoggingTimingInterceptor()]
+    if settings.EMBEDDING_BACKEND == "local":
+        # Model loaded before serving, not by the first call
+        try:
+            local_worker(settings.EMBEDDING_MODEL)
+        except RuntimeError as e:
+            logger.error(f"Local embedding model not loaded, retried on first use: {e}")
+
+    # Embedding dimension from the model, or the database while the model can not be reached
+    try:
+        init_vector_dimension()
+    except ValueError as e:
+        logger.critical(f"Embedding dimension check failed: {e}")
+        sys.exit(1)
+
+    init_tracing()
+    # Logging first, so calls rejected by admission control are logged and measured
+    interceptors = [LoggingTimingInterceptor(), AdmissionInterceptor()]
 
     # --- Keepalive Options ---
     # These values are examples; tune them based on your network environment
@@ -76,10 +113,18 @@ def serve():
         ('grpc.http2.max_pings_without_data', 5),
     ]
 
+    # Enough workers for every admission pool, so slow pools can not starve the others.
+    # Calls beyond that are rejected by gRPC with RESOURCE_EXHAUSTED instead of queuing.
+    workers = required_workers()
+    if "GRPC_MAX_WORKERS" in os.environ:
+        logger.warning(f"GRPC_MAX_WORKERS is deprecated and ignored, workers are sized by the POOL_* settings: {workers}")
+    executor = futures.ThreadPoolExecutor(max_workers=workers)
+    observe_executor(executor)
     _server = grpc.server(
-        futures.ThreadPoolExecutor(max_workers=int(os.environ.get("GRPC_MAX_WORKERS", 10))),
+        executor,
         interceptors=interceptors,
-        options=server_options # Add keepalive options
+        options=server_options, # Add keepalive options
+        maximum_concurrent_rpcs=workers,
     )
 
     # Register servicers
@@ -88,6 +133,7 @@ def serve():
     conscious_api_pb2_grpc.add_ReviewServiceServicer_to_server(ReviewServiceServicer(), _server)
     conscious_api_pb2_grpc.add_HealthServicer_to_server(HealthServicer(), _server)
     conscious_api_pb2_grpc.add_DataServiceServicer_to_server(DataServiceServicer(), _server)
+    conscious_api_pb2_grpc.add_UsageServiceServicer_to_server(UsageServiceServicer(), _server)
 
     listen_addr = f'[::]:{GRPC_PORT}'
 
@@ -114,8 +160,13 @@ def serve():
 
 
     _server.start()
+    start_metrics_server(settings.METRICS_PORT)
     logger.info(f"gRPC Server started successfully on port {GRPC_PORT}. Waiting for termination signal...")
 
+    if settings.RELATED_THOUGHTS_INTERVAL_SECONDS > 0:
+        threading.Thread(target=_run_related_thoughts_job, name="related-thoughts", daemon=True).start()
+        logger.info(f"Related thoughts job scheduled every {settings.RELATED_THOUGHTS_INTERVAL_SECONDS} seconds.")
+
     # Keep the main thread alive until shutdown signal
     _stop_event.wait()
 
@@ -1,9 +1,12 @@
 import grpc
 import logging
+from sqlalchemy.exc import OperationalError
 
 from generated import conscious_api_pb2 as pb2
 from generated import conscious_api_pb2_grpc as pb2_grpc
 
+from core.deadline import CallDeadline, CallCancelled
+from core.gateway import ProviderUnavailable
 from modules.add_data import AddData
 
 class DataServiceServicer(pb2_grpc.DataServiceServicer):
@@ -27,16 +30,28 @@ class DataServiceServicer(pb2_grpc.DataServiceServicer):
             # TO-DO: is this needed
             text_list = list(request.text_list) if request.text_list else None
 
-            AddData(
+            result = AddData(
                 task=task,
                 source_type=source_type,
                 source_identifiers=source_identifiers,
                 file_content=file_bytes,
-                text_list=text_list
+                text_list=text_list,
+                deadline=CallDeadline.from_context(context),
             ).run()
 
-            logging.info("AddData processed successfully.")
-            return pb2.AddDataResponse(success=True, message="Data added successfully.")
+            logging.info(f"AddData processed successfully: {result}")
+            return pb2.AddDataResponse(
+                success=True,
+                message=f"Data added successfully: {result['added']} added, {result['unchanged']} unchanged, {result['removed']} removed.",
+                added=result["added"],
+                unchanged=result["unchanged"],
+                removed=result["removed"],
+            )
+
+        except (CallCancelled, ProviderUnavailable, OperationalError):
+            # Status is set by the interceptor, the import was rolled back.
+            # Database errors include statements ended by the deadline.
+            raise
 
         except Exception as e:
             logging.error(f"Error processing AddData request: {e}", exc_info=True)
@@ -2,6 +2,7 @@
 
 import logging
 import grpc
+from datetime import timezone
 from typing import Dict
 
 # Import generated types
@@ -9,8 +10,12 @@ from generated import conscious_api_pb2
 from generated import conscious_api_pb2_grpc
 
 # Import business logic and utilities
+from core.deadline import CallDeadline, CallCancelled
+from core.gateway import ProviderUnavailable
 from modules.find_thoughts import FindThoughts
+from modules.search_thoughts import SearchThoughts
 from utils.validators import decode_unicode_escapes_logic
+from servicers.review_servicer import datetime_to_timestamp
 
 # Import status types for richer errors
 from google.rpc import status_pb2, code_pb2
@@ -20,6 +25,11 @@ from interceptors.logging_timing import create_status_proto # Import helper
 
 logger = logging.getLogger(__name__)
 
+# Search page size if not specified, and the upper limit
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 100
+MAX_SEARCH_OFFSET = 1000 # Deep pages cost as much as a search of offset + limit
+
 class FindServiceServicer(conscious_api_pb2_grpc.FindServiceServicer):
     """Implements the FindService RPCs."""
 
@@ -65,17 +75,12 @@ class FindServiceServicer(conscious_api_pb2_grpc.FindServiceServicer):
             # Add type to identifiers (matching FastAPI logic)
             identifiers_dict['type'] = type_str
 
-            # --- Cancellation Check Point (Example) ---
-            # If FindThoughts service call could be long:
-            # if not context.is_active():
-            #     logger.info("Client cancelled FindThoughts request before processing.")
-            #     context.abort(grpc.StatusCode.CANCELLED, "Request cancelled by client.")
-            #     return conscious_api_pb2.FindThoughtsResponse()
-
             logger.debug(f"Processing find request for {identifiers_dict} -> text: {text[:100]}...")
 
             # --- Business Logic ---
-            find_thoughts_service = FindThoughts(text=text, identifiers=identifiers_dict)
+            # Stops LLM, embedding and database work once the client goes away or the deadline passes
+            deadline = CallDeadline.from_context(context)
+            find_thoughts_service = FindThoughts(text=text, identifiers=identifiers_dict, deadline=deadline)
             thoughts = find_thoughts_service.find() # Assume this can raise its own exceptions
 
             logger.info(f"Found {len(thoughts)} thoughts for {identifiers_dict}")
@@ -90,8 +95,75 @@ class FindServiceServicer(conscious_api_pb2_grpc.FindServiceServicer):
         #     context.abort(grpc.StatusCode.FAILED_PRECONDITION, str(e))
         #     return conscious_api_pb2.FindThoughtsResponse()
 
+        except (CallCancelled, ProviderUnavailable):
+            # Status is set by the interceptor, nothing was saved
+            raise
+
         except Exception as e:
             # Let the interceptor handle truly unexpected errors
             logger.error(f"Unhandled exception in FindThoughts servicer: {e}", exc_info=True)
             # Re-raise for the interceptor to catch and format as INTERNAL error
-            raise
\ No newline at end of file
+            raise
+
+    def SearchThoughts(self, request: conscious_api_pb2.SearchThoughtsRequest,
+                       context: grpc.ServicerContext) -> conscious_api_pb2.SearchThoughtsResponse:
+
+        logger.info(f"Received SearchThoughts request: limit={request.limit}, offset={request.offset}, source_types={list(request.source_types)}")
+
+        query = decode_unicode_escapes_logic(request.query).strip()
+        limit = request.limit or DEFAULT_SEARCH_LIMIT
+        created_after = request.created_after.ToDatetime(tzinfo=timezone.utc) if request.HasField('created_after') else None
+        created_before = request.created_before.ToDatetime(tzinfo=timezone.utc) if request.HasField('created_before') else None
+
+        validation_errors = []
+        if not query:
+            validation_errors.append(("query", "Query cannot be empty after decoding and stripping."))
+        if not (0 < limit <= MAX_SEARCH_LIMIT):
+            validation_errors.append(("limit", f"Limit must be between 1 and {MAX_SEARCH_LIMIT}."))
+        if not (0 <= request.offset <= MAX_SEARCH_OFFSET):
+            validation_errors.append(("offset", f"Offset must be between 0 and {MAX_SEARCH_OFFSET}."))
+        if request.rescore < 0:
+            validation_errors.append(("rescore", "Rescore cannot be negative."))
+        if created_after and created_before and created_after >= created_before:
+            validation_errors.append(("created_before", "Must be later than created_after."))
+
+        if validation_errors:
+            logger.warning(f"Validation failed for SearchThoughts: {validation_errors}")
+            bad_request_details = error_details_pb2.BadRequest(
+                field_violations=[
+                    error_details_pb2.BadRequest.FieldViolation(field=field, description=desc)
+                    for field, desc in validation_errors
+                ]
+            )
+            status_proto = create_status_proto(
+                code=code_pb2.INVALID_ARGUMENT,
+                message="Invalid request parameters.",
+                details=[bad_request_details]
+            )
+            context.set_trailing_metadata((('grpc-status-details-bin', status_proto.SerializeToString()),))
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Invalid request parameters.")
+
+        results = SearchThoughts(
+            query=query,
+            limit=limit,
+            offset=request.offset,
+            source_types=list(request.source_types),
+            include_discarded=request.include_discarded,
+            created_after=created_after,
+            created_before=created_before,
+            rescore=request.rescore,
+            hybrid=request.mode == conscious_api_pb2.SEARCH_MODE_HYBRID,
+        ).search()
+
+        matches = [
+            conscious_api_pb2.ThoughtMatch(
+                thought_id=result['thought_id'],
+                text=result['text'],
+                distance=result['distance'],
+                score=result['score'],
+                created_at=datetime_to_timestamp(result['created_at']),
+            )
+            for result in results
+        ]
+        next_offset = request.offset + len(matches) if len(matches) == limit else 0
+        return conscious_api_pb2.SearchThoughtsResponse(thoughts=matches, next_offset=next_offset)
@@ -3,6 +3,9 @@ import grpc
 from generated import conscious_api_pb2
 from generated import conscious_api_pb2_grpc
 
+from core.config import settings
+from core.gateway import OPEN, provider_states
+
 logger = logging.getLogger(__name__)
 
 # Map service names to their respective check logic (if needed)
@@ -12,9 +15,17 @@ SERVICE_MAP = {
     "conscious.v1.FindService": conscious_api_pb2.HealthCheckResponse.SERVING,
     "conscious.v1.ConfigService": conscious_api_pb2.HealthCheckResponse.SERVING,
     "conscious.v1.ReviewService": conscious_api_pb2.HealthCheckResponse.SERVING,
+    "conscious.v1.UsageService": conscious_api_pb2.HealthCheckResponse.SERVING,
+    "conscious.v1.DataService": conscious_api_pb2.HealthCheckResponse.SERVING,
     # Add more specific checks if necessary, e.g., database connection
 }
 
+# Models a service depends on, it is not serving while the circuit of one is open, see `core.gateway`
+SERVICE_MODELS = {
+    "conscious.v1.FindService": (settings.LLM_MODEL, settings.EMBEDDING_MODEL),
+    "conscious.v1.DataService": (settings.EMBEDDING_MODEL,),
+}
+
 class HealthServicer(conscious_api_pb2_grpc.HealthServicer):
     """Implements the standard gRPC Health Checking Protocol."""
 
@@ -29,6 +40,12 @@ class HealthServicer(conscious_api_pb2_grpc.HealthServicer):
         # else:
              # logger.debug(f"Health check for '{service}': status {status}")
 
+        states = provider_states()
+        open_models = [model for model in SERVICE_MODELS.get(service, ()) if states.get(model) == OPEN]
+        if open_models:
+            logger.warning(f"Health check for '{service}': not serving, circuit open for {', '.join(open_models)}")
+            status = conscious_api_pb2.HealthCheckResponse.NOT_SERVING
+
 
         # In a real scenario, you might add logic here to check dependencies
         # (e.g., database connection) and set status to NOT_SERVING if they fail.
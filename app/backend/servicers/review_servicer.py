@@ -15,6 +15,7 @@ from generated import conscious_api_pb2_grpc
 from db.session import get_db_session
 from db.models import Thoughts # Assuming ReviewLogs is used within review_card
 from modules.fsrs_services import review_card # Assuming this exists and works
+from modules.related_thoughts import get_related_thoughts
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +23,8 @@ logger = logging.getLogger(__name__)
 # Default number of cards to fetch if not specified or invalid
 DEFAULT_FETCH_COUNT = 3
 MAX_FETCH_COUNT = 10 # A reasonable upper limit
+DEFAULT_RELATED_COUNT = 5
+MAX_RELATED_COUNT = 20
 
 
 # Helper to convert Python datetime to Protobuf Timestamp
@@ -203,4 +206,40 @@ class ReviewServiceServicer(conscious_api_pb2_grpc.ReviewServiceServicer):
         except Exception as e:
             logger.error(f"Error discarding thought ID {thought_id}: {e}", exc_info=True)
             context.abort(grpc.StatusCode.INTERNAL, "An internal error occurred while discarding the thought.")
-            # return conscious_api_pb2.DiscardThoughtResponse() # Unreachable
\ No newline at end of file
+            # return conscious_api_pb2.DiscardThoughtResponse() # Unreachable
+
+
+    def GetRelatedThoughts(self, request: conscious_api_pb2.GetRelatedThoughtsRequest,
+                           context: grpc.ServicerContext) -> conscious_api_pb2.GetRelatedThoughtsResponse:
+        """
+        Handles the GetRelatedThoughts RPC.
+        Reads precomputed neighbors of a thought, see `modules.related_thoughts`.
+        """
+        thought_id = request.thought_id
+        limit = request.limit
+        if limit <= 0:
+            limit = DEFAULT_RELATED_COUNT
+        elif limit > MAX_RELATED_COUNT:
+            limit = MAX_RELATED_COUNT
+        logger.debug(f"Received GetRelatedThoughts request: thought_id={thought_id}, limit={limit}")
+
+        try:
+            with get_db_session() as db:
+                related = get_related_thoughts(db, thought_id, limit)
+
+            return conscious_api_pb2.GetRelatedThoughtsResponse(
+                thoughts=[
+                    conscious_api_pb2.ThoughtMatch(
+                        thought_id=r['thought_id'],
+                        text=r['text'],
+                        distance=r['distance'],
+                        created_at=datetime_to_timestamp(r['created_at']),
+                        score=1 - r['distance'],
+                    )
+                    for r in related
+                ]
+            )
+
+        except Exception as e:
+            logger.error(f"Error fetching related thoughts of thought ID {thought_id}: {e}", exc_info=True)
+            context.abort(grpc.StatusCode.INTERNAL, "An internal error occurred while fetching related thoughts.")
@@ -0,0 +1,65 @@
+# servicers/usage_servicer.py
+
+import logging
+import grpc
+
+from generated import conscious_api_pb2
+from generated import conscious_api_pb2_grpc
+
+from core.usage import summarize_usage, SUMMARY_GROUPS
+from db.session import get_db_session
+from servicers.review_servicer import datetime_to_timestamp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USAGE_DAYS = 30
+MAX_USAGE_DAYS = 366
+
+
+class UsageServiceServicer(conscious_api_pb2_grpc.UsageServiceServicer):
+    """Implements the UsageService RPCs."""
+
+    def GetUsageSummary(self, request: conscious_api_pb2.GetUsageSummaryRequest,
+                        context: grpc.ServicerContext) -> conscious_api_pb2.GetUsageSummaryResponse:
+        """
+        Handles the GetUsageSummary RPC.
+        Totals of the usage ledger, see `core.usage`.
+        """
+        days = request.days
+        if days <= 0:
+            days = DEFAULT_USAGE_DAYS
+        elif days > MAX_USAGE_DAYS:
+            days = MAX_USAGE_DAYS
+        group_by = request.group_by or "day"
+        if group_by not in SUMMARY_GROUPS:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"group_by must be one of: {', '.join(SUMMARY_GROUPS)}")
+        logger.debug(f"Received GetUsageSummary request: days={days}, group_by={group_by}")
+
+        try:
+            with get_db_session() as db:
+                rows = summarize_usage(db, days=days, group_by=group_by)
+        except Exception as e:
+            logger.error(f"Error summarizing usage: {e}", exc_info=True)
+            context.abort(grpc.StatusCode.INTERNAL, "An internal error occurred while summarizing usage.")
+
+        return conscious_api_pb2.GetUsageSummaryResponse(
+            rows=[
+                conscious_api_pb2.UsageSummaryRow(
+                    day=datetime_to_timestamp(row.get("day")),
+                    source_type=row.get("source_type") or "",
+                    source_id=row.get("source_id") or 0,
+                    rpc=row.get("rpc") or "",
+                    kind=row["kind"],
+                    model=row["model"],
+                    calls=row["calls"],
+                    items=row["items"],
+                    cached_items=row["cached_items"],
+                    input_tokens=row["input_tokens"],
+                    output_tokens=row["output_tokens"],
+                    latency_seconds=row["latency_seconds"],
+                    cost=row["cost"],
+                    failures=row["failures"],
+                )
+                for row in rows
+            ]
+        )
@@ -1,48 +1,211 @@
+import asyncio
 import logging
+import time
+import numpy as np
 from litellm import aembedding
-from typing import List
+from sqlalchemy import text
+from typing import List, Optional, Tuple
 
 from core.config import settings
+from core.gateway import gateway
+from core.lanes import LaneScheduler, current_lane
+from core.tracing import tracer
+from core.usage import record_usage
+from db.session import get_db_session
+from utils.helpers import LRUCache
+from utils.local_embeddings import local_worker
+from utils.vectors import truncate_embeddings
 
 logger = logging.getLogger(__name__)
 
-EmbeddingVector = List[float]
+EmbeddingVector = np.ndarray # 1-D float32
+
+DIMENSION_PROBE_TEXT = "dimension probe"
+
+# Recent embeddings: (model, dimension, text) -> embedding, for repeated queries
+_embedding_cache = LRUCache(maxsize=settings.EMBEDDING_CACHE_SIZE)
+# Slots of requests to the embedding server, shared by the calls of the process
+_scheduler = LaneScheduler(settings.EMBEDDING_CONCURRENCY, settings.EMBEDDING_BULK_SHARE)
+
+async def _embed_batch(texts: List[str], model: str, api_base: str, api_key: str, lane: str) -> Tuple[np.ndarray, int, Optional[float]]:
+    """One request to the embedding backend, in a slot of `lane`. Returns embeddings, input tokens and cost."""
+    if settings.EMBEDDING_BACKEND == "local":
+        # Off the event loop and outside the slot, a first call waits for the model to load
+        worker = await asyncio.to_thread(local_worker, model)
+    async with _scheduler.slot(lane):
+        if settings.EMBEDDING_BACKEND == "local":
+            return await worker.embed(texts), 0, None
+        # Rate limited, retried and failed fast while the provider is down
+        response = await gateway(model).acall(aembedding, model=model, api_base=api_base, api_key=api_key, input=texts)
+
+    # TO-DO: should we check order and other aspects of the returned embeddings?
+    embeddings = np.asarray([i['embedding'] for i in response['data']], dtype=np.float32)
+    usage = getattr(response, "usage", None)
+    # Cost is set by litellm if the model is priced
+    return embeddings, getattr(usage, "prompt_tokens", 0) or 0, getattr(response, "_hidden_params", {}).get("response_cost")
 
 async def get_embeddings(
     texts: List[str],
     model: str = settings.EMBEDDING_MODEL,
     api_base: str = settings.EMBEDDING_API_BASE,
     api_key: str = settings.EMBEDDING_API_KEY,
-) -> List[EmbeddingVector]:
+    use_cache: bool = False,
+    dimension: Optional[int] = None,
+) -> np.ndarray:
     """
     Generate embeddings for a list of texts.
 
+    Texts are sent in requests of `EMBEDDING_BATCH_SIZE`, in the lane of the
+    caller, see `core.lanes.embedding_lane`. With `EMBEDDING_BACKEND=local`
+    the model runs in process, see `utils.local_embeddings`, `api_base` and
+    `api_key` are then unused.
+
+    Args:
+        use_cache: reuse and keep embeddings in the in-process cache. Meant for
+            short texts that repeat, like search queries, not for bulk imports.
+        dimension: truncate embeddings of the model to this dimension and renormalize,
+            default to `VECTOR_DIMENSION`, 0 to keep the model's dimension.
+
     Returns:
-        A list of embedding vectors (each a list of floats), ordered
+        2-D float32 array, one embedding per row, ordered
         correspondingly to the input `texts` list.
 
     Raises:
-        Exception: Propagates exceptions from the litellm.aembedding call (e.g., connection errors).
-        ValueError: If length of embeddings and texts are not equal
+        ProviderUnavailable: If the provider keeps failing, or its circuit is open, see `core.gateway`.
+        Exception: Propagates other exceptions from the litellm.aembedding call (e.g., bad requests).
+        ValueError: If length of embeddings and texts are not equal, or the model dimension is below `dimension`
     """
     if not texts:
-        return [] # Return empty list if input is empty
+        return np.empty((0, 0), dtype=np.float32) # Empty array if input is empty
+
+    if dimension is None:
+        dimension = vector_dimension()
+
+    results: List[EmbeddingVector | None] = [None] * len(texts)
+    if use_cache:
+        for index, text in enumerate(texts):
+            results[index] = _embedding_cache.get((model, dimension, text))
+    missing = [index for index, embedding in enumerate(results) if embedding is None]
+    if not missing:
+        logger.debug(f"All {len(texts)} embeddings found in cache.")
+        record_usage(kind="embedding", model=model, latency=0, items=len(texts), cached_items=len(texts))
+        return np.stack(results)
+
+    lane = current_lane()
+    batch_size = max(settings.EMBEDDING_BATCH_SIZE, 1)
+    batches = [[texts[index] for index in missing[i:i + batch_size]] for i in range(0, len(missing), batch_size)]
+    with tracer.start_as_current_span("embeddings", attributes={
+        "embedding.model": model,
+        "embedding.texts": len(missing),
+        "embedding.cache_hits": len(texts) - len(missing),
+        "embedding.lane": lane,
+        "embedding.requests": len(batches),
+    }):
+        start_time = time.perf_counter()
+        tasks = [asyncio.ensure_future(_embed_batch(batch, model, api_base, api_key, lane)) for batch in batches]
+        try:
+            responses = await asyncio.gather(*tasks)
+        except Exception as e:
+            for task in tasks:
+                task.cancel()
+            logger.error(f"Error getting embeddings of {model}: {e}")
+            record_usage(kind="embedding", model=model, latency=time.perf_counter() - start_time,
+                         items=len(texts), cached_items=len(texts) - len(missing), success=False)
+            raise
+
+    costs = [cost for _, _, cost in responses]
+    record_usage(
+        kind="embedding",
+        model=model,
+        latency=time.perf_counter() - start_time,
+        items=len(texts),
+        cached_items=len(texts) - len(missing),
+        input_tokens=sum(tokens for _, tokens, _ in responses),
+        cost=None if None in costs else sum(costs),
+    )
+    embeddings = np.concatenate([batch for batch, _, _ in responses])
+
+    if len(embeddings) != len(missing):
+        raise ValueError(f"Length of embeddings ({len(embeddings)}) and texts ({len(missing)}) not equal")
+    if dimension and embeddings.shape[1] != dimension:
+        embeddings = truncate_embeddings(embeddings, dimension)
+
+    for index, embedding in zip(missing, embeddings):
+        results[index] = embedding
+        if use_cache:
+            _embedding_cache.put((model, dimension, texts[index]), embedding.copy()) # Copy: a row view keeps the whole batch alive
+
+    return np.stack(results)
+
+
+def detect_model_dimension(
+    model: str = settings.EMBEDDING_MODEL,
+    api_base: str = settings.EMBEDDING_API_BASE,
+    api_key: str = settings.EMBEDDING_API_KEY,
+) -> int:
+    """Dimension of embeddings returned by the model, by embedding a probe text."""
+    embeddings = asyncio.run(get_embeddings([DIMENSION_PROBE_TEXT], model, api_base, api_key, dimension=0))
+    return embeddings.shape[1]
+
+def get_column_dimension(table: str = "thoughts", column: str = "embedding") -> Optional[int]:
+    """Dimension of a vector column in the database, None if the column does not exist."""
+    with get_db_session() as session:
+        return session.execute(
+            text("""
+                SELECT atttypmod FROM pg_attribute
+                WHERE attrelid = to_regclass(:table) AND attname = :column AND NOT attisdropped
+            """),
+            {"table": table, "column": column},
+        ).scalar_one_or_none()
+
+def vector_dimension() -> int:
+    """
+    `VECTOR_DIMENSION`, 0 resolved from the `thoughts.embedding` column on first
+    use, for scripts and fallbacks where the model dimension was not detected.
+
+    Raises:
+        ValueError: If the column does not exist or has no dimension
+    """
+    if settings.VECTOR_DIMENSION <= 0:
+        column_dimension = get_column_dimension()
+        if column_dimension is None or column_dimension <= 0:
+            raise ValueError("Embedding dimension unknown: VECTOR_DIMENSION is 0 and column thoughts.embedding has no dimension")
+        settings.VECTOR_DIMENSION = column_dimension
+    return settings.VECTOR_DIMENSION
+
+def init_vector_dimension() -> int:
+    """
+    Resolves the dimension of stored embeddings, at startup.
+
+    `VECTOR_DIMENSION` 0 takes the dimension of the model, a value below the
+    model's dimension truncates the embeddings. The result must match the
+    `thoughts.embedding` column, see `cli.migrate_embeddings` for changing it.
+    If the model can not be reached, the dimension is not checked against it:
+    `VECTOR_DIMENSION` 0 takes the dimension of the column instead.
 
+    Raises:
+        ValueError: If the model dimension is too small, or the database column differs
+    """
     try:
-        response = await aembedding(
-            model=model,
-            api_base=api_base,
-            api_key=api_key,
-            input=texts,
-        )
+        model_dimension = detect_model_dimension()
     except Exception as e:
-        logger.error(f"Error calling litellm.aembedding: {e}")
-        raise
+        logger.warning(f"Failed to detect embedding dimension of model {settings.EMBEDDING_MODEL}, not checked against it: {e}")
+        model_dimension = None
 
-    # TO-DO: should we check order and other aspects of the returned embeddings?
-    embeddings = [i['embedding'] for i in response['data']]
+    if model_dimension:
+        if settings.VECTOR_DIMENSION <= 0:
+            settings.VECTOR_DIMENSION = model_dimension
+        elif settings.VECTOR_DIMENSION > model_dimension:
+            raise ValueError(f"VECTOR_DIMENSION {settings.VECTOR_DIMENSION} above dimension {model_dimension} of model {settings.EMBEDDING_MODEL}")
+        elif settings.VECTOR_DIMENSION < model_dimension:
+            logger.info(f"Embeddings of model {settings.EMBEDDING_MODEL} truncated from {model_dimension} to {settings.VECTOR_DIMENSION} dimensions")
+
+    column_dimension = get_column_dimension()
+    if settings.VECTOR_DIMENSION <= 0: # Model not reached
+        vector_dimension()
+    elif column_dimension != settings.VECTOR_DIMENSION:
+        raise ValueError(f"Column thoughts.embedding has dimension {column_dimension}, embeddings have {settings.VECTOR_DIMENSION}. "
+                         "Migrate with `python -m cli.migrate_embeddings`.")
 
-    if len(embeddings) != len(texts):
-        raise ValueError(f"Length of embeddings ({len(embeddings)}) and texts ({len(texts)}) not equal")
-    
-    return embeddings
\ No newline at end of file
+    logger.info(f"Embedding dimension: {settings.VECTOR_DIMENSION}")
+    return settings.VECTOR_DIMENSION
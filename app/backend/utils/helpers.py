@@ -1,33 +1,82 @@
 # app/utils/helpers.py
+import hashlib
+import json
 import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Any, Dict, Type, Optional
-from sqlalchemy import text
+
+import psycopg
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
+from core import metrics
 from core.config import settings
-from db.session import Base # Needed for type hinting if check_duplicate_row takes Base subclasses
+from core.tracing import tracer
+from db.session import Base, ensure_age_loaded # Base needed for type hinting if check_duplicate_row takes Base subclasses
 
 logger = logging.getLogger(__name__)
 
 
-def execute_cypher(session: Session, query: str, columns: int = 1) -> List:
-    """Executes a Cypher query using AGE."""
+@lru_cache(maxsize=256)
+def _build_cypher_sql(query: str, columns: int, with_params: bool) -> str:
+    """Builds the SQL command text of a Cypher query template, same template same text."""
     # Define return definition dynamically
-    _parts = [f"r{i} agtype" for i in range(columns)]
+    _parts = [f"r{i} ag_catalog.agtype" for i in range(columns)]
     return_as = ", ".join(_parts)
 
-    # Get command
-    command_text = f"SELECT * FROM cypher('{settings.GRAPH_NAME}', $${query.strip()}$$) AS ({return_as});"
-    command = text(command_text)
-    logger.debug(f"Executing Cypher command: {command}")
+    # Escape `%` for the driver placeholder syntax
+    query = query.replace("%", "%%")
+    params_arg = ", %s" if with_params else ""
 
-    try:
-        result = session.execute(command)
-        return result.fetchall()
-    except SQLAlchemyError as e:
-        logger.error(f"Error executing Cypher query: {e}", exc_info=True)
-        raise # Re-raise to be handled by caller or session context
+    # Schema qualified so search_path stays default
+    # !IMPORTANT: use parameter for graph name will result in error
+    return f"SELECT * FROM ag_catalog.cypher('{settings.GRAPH_NAME}', $${query}$${params_arg}) AS ({return_as});"
+
+
+def execute_cypher(session: Session, query: str, params: Optional[Dict[str, Any]] = None, columns: int = 1) -> List:
+    """
+    Executes a Cypher query template using AGE, loads AGE for the connection if not yet.
+
+    Values must be referenced as `$name` in the query and passed by `params`,
+    they are sent as one agtype map instead of being formatted into the query text.
+    Each template is a server-side prepared statement on the connection,
+    so repeated calls reuse the parsed query and plan.
+
+    Args:
+        session: SQLAlchemy session, the query joins its transaction
+        query: Cypher query template
+        params: values of the `$name` parameters in the template
+        columns: number of columns returned by the query
+    """
+    ensure_age_loaded(session)
+
+    query = query.strip()
+    command_text = _build_cypher_sql(query, columns, params is not None)
+    logger.debug(f"Executing Cypher command: {command_text}, params: {params}")
+
+    # Driver connection of the session transaction, SQLAlchemy does not expose `prepare`
+    driver_connection = session.connection().connection.driver_connection
+    # The template has no values, safe to record
+    with tracer.start_as_current_span("age.cypher", attributes={"db.system": "postgresql", "db.query.text": query}) as span:
+        try:
+            with driver_connection.cursor() as cursor:
+                cursor.execute(
+                    command_text,
+                    (json.dumps(params),) if params is not None else None,
+                    prepare=True,
+                )
+                rows = cursor.fetchall()
+        except psycopg.Error as e:
+            logger.error(f"Error executing Cypher query: {e}", exc_info=True)
+            raise # Re-raise to be handled by caller or session context
+        span.set_attribute("db.response.rows", len(rows))
+
+    # Templates are fixed in the code, whitespace collapsed for a readable label
+    metrics.CYPHER_EXECUTIONS.labels(" ".join(query.split())).inc()
+    return rows
 
 
 def check_duplicate_row(session: Session, model: Type[Base], row_dict: Dict[str, Any]) -> Optional[Any]:
@@ -78,4 +127,71 @@ def check_duplicate_row(session: Session, model: Type[Base], row_dict: Dict[str,
         return None # Indicate database error
     except Exception as e:
         logger.error(f"Unexpected error during duplicate check for '{model.__tablename__}': {e}", exc_info=True)
-        return None # Indicate other errors
\ No newline at end of file
+        return None # Indicate other errors
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a fixed number of entries."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Any, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def canonical_source_keys(keys: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Canonical form of source identifiers: keys in lower case, values as stripped strings,
+    empty values removed. Sources with the same canonical keys are the same source.
+    """
+    canonical = {}
+    for key, value in keys.items():
+        if value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            canonical[str(key).strip().lower()] = value
+    return canonical
+
+
+def source_hash(keys: Dict[str, Any]) -> bytes:
+    """BLAKE2b 128 bits hash of the canonical source identifiers."""
+    payload = json.dumps(canonical_source_keys(keys), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).digest()
+
+
+def normalize_text(text: str) -> str:
+    """NFKC normalized, runs of whitespace collapsed to one space, stripped."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def text_hash(text: str) -> bytes:
+    """
+    SHA-256 of the normalized text, for finding exact duplicates.
+
+    Mirrored in SQL by the backfill of `migrations/006-thoughts-text-hash.sql`.
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
@@ -0,0 +1,238 @@
+"""
+Embeddings of a sentence-transformers model in a worker process on CPU, for
+`EMBEDDING_BACKEND=local`: no embedding server and no HTTP round trip.
+
+Requests of all threads go to one worker process per model. The worker
+batches requests arriving within `EMBEDDING_LOCAL_MAX_WAIT_MS`, up to
+`EMBEDDING_LOCAL_MAX_BATCH` texts, encodes them together and writes the
+embeddings of the batch to a shared memory block. Only the block name and
+the rows of each request go through the queue, a reader thread of the
+parent copies the rows out and frees the block.
+
+The model runs with PyTorch, or ONNX Runtime with `EMBEDDING_LOCAL_RUNTIME=onnx`.
+Needs the `sentence-transformers` package, `sentence-transformers[onnx]` for ONNX.
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STARTUP_TIMEOUT_SECONDS = 600 # Model download and load
+POLL_SECONDS = 1.0 # Reader thread checks the worker is alive this often
+
+
+def _load_model(model: str, runtime: str, threads: int):
+    if threads > 0:
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        raise RuntimeError("EMBEDDING_BACKEND local requires the `sentence-transformers` package.") from e
+    if threads > 0 and runtime == "torch":
+        import torch
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model, device="cpu", backend=runtime)
+
+def _serve(model_name: str, runtime: str, threads: int, max_batch: int, max_wait: float,
+           requests: multiprocessing.Queue, responses: multiprocessing.Queue) -> None:
+    """Worker process: batches requests `(request_id, texts)` until `None`."""
+    try:
+        model = _load_model(model_name, runtime, threads)
+    except Exception as e:
+        responses.put(("failed", f"{type(e).__name__}: {e}"))
+        return
+    responses.put(("ready", model.get_sentence_embedding_dimension()))
+
+    held = None # Request taken from the queue that did not fit the last batch
+    stopping = False
+    while not stopping:
+        first = held if held is not None else requests.get()
+        held = None
+        if first is None:
+            return
+        batch, count = [first], len(first[1])
+        wait_until = time.monotonic() + max_wait
+        while count < max_batch:
+            try:
+                request = requests.get(timeout=max(wait_until - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if request is None:
+                stopping = True
+                break
+            if count + len(request[1]) > max_batch:
+                held = request
+                break
+            batch.append(request)
+            count += len(request[1])
+
+        try:
+            texts = [text for _, request_texts in batch for text in request_texts]
+            embeddings = model.encode(texts, batch_size=max_batch, normalize_embeddings=True, convert_to_numpy=True)
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            block = SharedMemory(create=True, size=max(embeddings.nbytes, 1))
+            np.ndarray(embeddings.shape, dtype=np.float32, buffer=block.buf)[:] = embeddings
+            rows, start = [], 0
+            for request_id, request_texts in batch:
+                rows.append((request_id, start, start + len(request_texts)))
+                start += len(request_texts)
+            responses.put(("batch", block.name, embeddings.shape, rows))
+            block.close() # Unlinked by the parent
+        except Exception as e:
+            responses.put(("error", [request_id for request_id, _ in batch], f"{type(e).__name__}: {e}"))
+
+
+class LocalEmbeddingWorker:
+    """Worker process of one model, see the module docstring."""
+
+    def __init__(
+        self,
+        model: str,
+        runtime: str = settings.EMBEDDING_LOCAL_RUNTIME,
+        threads: int = settings.EMBEDDING_LOCAL_THREADS,
+        max_batch: int = settings.EMBEDDING_LOCAL_MAX_BATCH,
+        max_wait_ms: float = settings.EMBEDDING_LOCAL_MAX_WAIT_MS,
+    ):
+        self.model = model
+        self.runtime = runtime
+        self.threads = threads
+        self.max_batch = max(max_batch, 1)
+        self.max_wait = max(max_wait_ms, 0) / 1000
+        self.dimension: Optional[int] = None
+        self.process = None
+        self.pending: Dict[int, concurrent.futures.Future] = {}
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def start(self, timeout: float = STARTUP_TIMEOUT_SECONDS) -> None:
+        """Starts the worker and waits for the model to load."""
+        # Spawn, a fork of the server would copy its threads and gRPC state
+        context = multiprocessing.get_context("spawn")
+        self.requests = context.Queue()
+        self.responses = context.Queue()
+        self.process = context.Process(
+            target=_serve,
+            args=(self.model, self.runtime, self.threads, self.max_batch, self.max_wait, self.requests, self.responses),
+            name=f"embeddings-{self.model}",
+            daemon=True,
+        )
+        start_time = time.time()
+        self.process.start()
+        try:
+            kind, value = self.responses.get(timeout=timeout)
+        except queue.Empty:
+            self.process.kill()
+            raise RuntimeError(f"Local embedding model {self.model} not loaded within {timeout} seconds")
+        if kind != "ready":
+            self.process.join()
+            raise RuntimeError(f"Failed to load local embedding model {self.model}: {value}")
+        self.dimension = value
+        threading.Thread(target=self._read, name=f"embeddings-{self.model}-reader", daemon=True).start()
+        logger.info(f"Local embedding model {self.model} loaded in {time.time() - start_time:.2f} seconds, "
+                    f"dimension {self.dimension}, runtime {self.runtime}")
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            self.requests.put(None)
+            self.process.join(timeout=10)
+
+    def submit(self, texts: List[str]) -> concurrent.futures.Future:
+        """Queues texts, the future gets a 2-D float32 array of normalized embeddings."""
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.process is None or not self.process.is_alive():
+                future.set_exception(RuntimeError(f"Local embedding worker of {self.model} is not running"))
+                return future
+            request_id = next(self.ids)
+            self.pending[request_id] = future
+        self.requests.put((request_id, list(texts)))
+        return future
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def _resolve(self, request_id: int, result: Optional[np.ndarray] = None, error: Optional[str] = None) -> None:
+        with self.lock:
+            future = self.pending.pop(request_id, None)
+        if future is None or future.done(): # Cancelled by the caller
+            return
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(f"Local embedding of {self.model} failed: {error}"))
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def _read(self) -> None:
+        """Hands results of the worker to the waiting futures."""
+        while True:
+            try:
+                message = self.responses.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if self.process.is_alive():
+                    continue
+                logger.error(f"Local embedding worker of {self.model} exited with code {self.process.exitcode}")
+                with self.lock:
+                    request_ids = list(self.pending)
+                for request_id in request_ids:
+                    self._resolve(request_id, error="worker exited")
+                return
+
+            if message[0] == "error":
+                _, request_ids, error = message
+                for request_id in request_ids:
+                    self._resolve(request_id, error=error)
+                continue
+
+            _, name, shape, rows = message
+            block = SharedMemory(name=name)
+            try:
+                embeddings = np.ndarray(shape, dtype=np.float32, buffer=block.buf)
+                for request_id, start, end in rows:
+                    self._resolve(request_id, embeddings[start:end].copy()) # Copy: the block is freed below
+                del embeddings
+            finally:
+                block.close()
+                block.unlink()
+
+
+_workers: Dict[str, LocalEmbeddingWorker] = {}
+_start_locks: Dict[str, threading.Lock] = {} # Per model, a loading model does not hold up the others
+_workers_lock = threading.Lock()
+
+
+def local_worker(model: str) -> LocalEmbeddingWorker:
+    """
+    Running worker of a model, started on first use. Starting blocks until the
+    model is loaded, the server starts the worker of `EMBEDDING_MODEL` before serving.
+    """
+    with _workers_lock:
+        worker = _workers.get(model)
+        if worker is not None and worker.process.is_alive():
+            return worker
+        start_lock = _start_locks.setdefault(model, threading.Lock())
+    with start_lock:
+        with _workers_lock:
+            worker = _workers.get(model)
+        if worker is None or not worker.process.is_alive():
+            worker = LocalEmbeddingWorker(model)
+            worker.start()
+            with _workers_lock:
+                _workers[model] = worker
+            atexit.register(worker.stop)
+        return worker
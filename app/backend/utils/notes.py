@@ -1,8 +1,14 @@
 import logging
+import re
+from html import escape
 from bs4 import BeautifulSoup
 
 logger = logging.getLogger(__name__)
 
+MARKDOWN_FRONT_MATTER = re.compile(r'\A---[ \t]*\n.*?\n---[ \t]*(\n|\Z)', re.S)
+MARKDOWN_HEADING = re.compile(r'#{1,6}(\s|$)')
+MARKDOWN_FENCES = ('```', '~~~')
+
 def extract_book_notes(html_string: str):
     """
     Parses HTML export of book notes.
@@ -75,4 +81,59 @@ def extract_book_notes(html_string: str):
 
     except Exception as e:
         logger.error(f"Failed parsing html for highlights: {e}")
-        return {}
\ No newline at end of file
+        return {}
+
+
+def kindle_html(title: str, notes: list[str], authors: str = "Benchmark") -> bytes:
+    """Kindle HTML export of notes, as parsed by `extract_book_notes`. For benchmarks and load tests."""
+    note_divs = "\n".join(
+        f'<div class="noteHeading">Highlight (yellow) - Location {i}</div>\n<div class="noteText">{escape(note)}</div>'
+        for i, note in enumerate(notes)
+    )
+    return f"""<html><body>
+<div class="bookTitle">{escape(title)}</div>
+<div class="authors">{escape(authors)}</div>
+{note_divs}
+</body></html>""".encode()
+
+def extract_markdown_notes(markdown_string: str) -> list[str]:
+    """
+    Splits a Markdown note into paragraphs, each paragraph as a note.
+
+    Supports:
+      - Obsidian vault notes
+
+    YAML front matter and headings are removed, same as headers of book notes.
+    Fenced code blocks are kept whole, blank lines inside do not split them.
+
+    Returns: list of notes, duplicates removed
+    """
+    text = MARKDOWN_FRONT_MATTER.sub('', markdown_string)
+
+    notes = []
+    block = []
+    in_fence = False
+
+    def flush():
+        note = "\n".join(block).strip()
+        if note:
+            notes.append(note)
+        block.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith(MARKDOWN_FENCES):
+            in_fence = not in_fence
+            block.append(line)
+        elif in_fence:
+            block.append(line)
+        elif not stripped:
+            flush()
+        elif MARKDOWN_HEADING.match(stripped):
+            flush() # Heading ends the paragraph and is dropped
+        else:
+            block.append(line)
+    flush()
+
+    # Remove duplicates while preserving order
+    return list(dict.fromkeys(notes))
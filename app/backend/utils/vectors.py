@@ -0,0 +1,131 @@
+import logging
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+HNSW_EF_SEARCH_MAX = 1000 # Upper bound of `hnsw.ef_search`
+
+
+def storage_sql(expression: str) -> str:
+    """
+    SQL of a `vector` value cast to the embedding storage type.
+
+    Query vectors are bound as `vector`, with `halfvec` storage they must be cast
+    so the distance operator matches the column and its index.
+    """
+    if settings.EMBEDDING_STORAGE == "halfvec":
+        return f"({expression})::halfvec({settings.VECTOR_DIMENSION})"
+    return expression
+
+
+def set_ann_search(session: Session, candidates: int = 0, rescore: int = settings.DISKANN_QUERY_RESCORE) -> None:
+    """
+    Sets the ANN index search parameters for the rest of the transaction.
+
+    `vector` storage uses the DiskANN index, its memory optimized layout ranks
+    candidates by binary quantized vectors and `rescore` of them are rescored
+    with the full vectors. `halfvec` storage uses a pgvector HNSW index,
+    scanned iteratively so filtered queries still fill their limit.
+
+    Args:
+        candidates: candidate list size, 0 for server default
+        rescore: DiskANN candidates rescored, 0 for server default
+    """
+    if settings.EMBEDDING_STORAGE == "halfvec":
+        params = {"hnsw.iterative_scan": "strict_order"}
+        if candidates > 0:
+            params["hnsw.ef_search"] = min(candidates, HNSW_EF_SEARCH_MAX)
+    else:
+        params = {}
+        if candidates > 0:
+            params["diskann.query_search_list_size"] = candidates
+        if rescore > 0:
+            params["diskann.query_rescore"] = rescore
+
+    for name, value in params.items():
+        session.execute(
+            text("SELECT set_config(:name, :value, true)"),
+            {"name": name, "value": str(value)},
+        )
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scales each row to unit length as float32, zero rows are left as is."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def truncate_embeddings(vectors: np.ndarray, dimension: int) -> np.ndarray:
+    """
+    Keeps the first `dimension` values of each row and scales rows back to unit length.
+
+    Only meaningful for models trained for it (Matryoshka representation learning),
+    where leading dimensions carry most of the information.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.shape[-1] < dimension:
+        raise ValueError(f"Embedding dimension {vectors.shape[-1]} is below {dimension}")
+    return normalize_rows(vectors[:, :dimension])
+
+
+def collapse_near_duplicates(embeddings: np.ndarray, distance_max: float, block_size: int = 1024) -> np.ndarray:
+    """
+    Finds near duplicates within a batch by cosine distance.
+
+    Items are taken in order, each one is a duplicate of the first earlier
+    representative within `distance_max`, otherwise a representative itself.
+    The similarity matrix is computed in blocks of `block_size` x `block_size`,
+    so memory is bounded for large batches.
+
+    Args:
+        embeddings: 2-D array, one embedding per row
+        distance_max: max cosine distance to be considered duplicate
+        block_size: rows per block
+
+    Returns:
+        Array of representative index per item, `result[i] == i` for representatives.
+    """
+    vectors = normalize_rows(embeddings)
+    count = len(vectors)
+    representative = np.arange(count)
+    is_representative = np.ones(count, dtype=bool)
+    similarity_min = 1 - distance_max
+
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+        block = vectors[start:stop]
+
+        # Earlier blocks: their representatives are final
+        first_match = np.full(stop - start, -1)
+        for column_start in range(0, start, block_size):
+            column_stop = min(column_start + block_size, start)
+            columns = np.flatnonzero(is_representative[column_start:column_stop]) + column_start
+            if not len(columns):
+                continue
+            close = (block @ vectors[columns].T) >= similarity_min
+            matched = close.any(axis=1) & (first_match < 0)
+            first_match[matched] = columns[close[matched].argmax(axis=1)]
+
+        # Within the block: in order, depends on earlier rows of the same block
+        close = (block @ block.T) >= similarity_min
+        for offset in range(stop - start):
+            index = start + offset
+            if first_match[offset] >= 0:
+                match = first_match[offset]
+            else:
+                earlier = np.flatnonzero(close[offset, :offset] & is_representative[start:index])
+                match = start + earlier[0] if len(earlier) else -1
+            if match >= 0:
+                representative[index] = match
+                is_representative[index] = False
+
+    duplicates = count - int(is_representative.sum())
+    if duplicates:
+        logger.debug(f"Collapsed {duplicates} near duplicates within batch of {count}")
+    return representative
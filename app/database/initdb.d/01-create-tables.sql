@@ -3,8 +3,10 @@
 CREATE TABLE IF NOT EXISTS thoughts (
     thought_id BIGSERIAL PRIMARY KEY,       -- Use BIGSERIAL for potentially large tables
     text TEXT NOT NULL,                     -- Text content
-    embedding VECTOR(1536) NOT NULL,        -- Vector embedding. Replace the dimension number.
+    text_hash BYTEA UNIQUE,                 -- SHA-256 of the normalized text, for exact duplicates
+    embedding VECTOR(1536) NOT NULL,        -- Vector embedding. Replace the dimension number by the model's, or `VECTOR_DIMENSION` if set. HALFVEC with HNSW index for `EMBEDDING_STORAGE=halfvec`, see migrations/009
     created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP, -- Timestamp when the record was created
+    text_search TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', text)) STORED, -- Full-text search, `simple` keeps names and codes as is
 
     -- SRS columns
     srs_rating SMALLINT,       -- Last review rating. 1:Again, 2:Hard, 3:Good, 4:Easy
@@ -20,7 +22,94 @@ CREATE TABLE IF NOT EXISTS thoughts (
 CREATE INDEX idx_thoughts_srs_due ON thoughts (srs_due); -- For querying of due cards
 
 -- Create a StreamingDiskANN index on embedding for faster similarity search 
-CREATE INDEX idx_thoughts_embedding ON thoughts USING diskann (embedding vector_cosine_ops);  -- cosine distance
+-- Memory optimized layout keeps binary quantized vectors in the index, candidates are rescored with the full vectors
+CREATE INDEX idx_thoughts_embedding ON thoughts USING diskann (embedding vector_cosine_ops) WITH (storage_layout = memory_optimized);  -- cosine distance
+
+-- Full-text search index, for the hybrid search mode
+CREATE INDEX idx_thoughts_text_search ON thoughts USING gin (text_search);
+
+
+-- Create the 'sources' table --
+-- Lookup of Source vertices by hash of their canonical identifiers
+CREATE TABLE IF NOT EXISTS sources (
+    source_id BIGSERIAL PRIMARY KEY,
+    source_hash BYTEA NOT NULL UNIQUE,      -- BLAKE2b 128 bits of the canonical identifiers
+    vertex_id BIGINT NOT NULL UNIQUE,       -- AGE vertex ID of the Source
+    source_type TEXT NOT NULL,
+    keys JSONB NOT NULL,                    -- Canonical identifiers, including type
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+
+-- Create the 'thought_sources' table --
+-- Relational copy of the Source -DERIVED_TO-> Thought links, for filtering thoughts by source
+CREATE TABLE IF NOT EXISTS thought_sources (
+    thought_id BIGINT NOT NULL REFERENCES thoughts (thought_id) ON DELETE CASCADE,
+    vertex_id BIGINT NOT NULL REFERENCES sources (vertex_id) ON DELETE CASCADE, -- AGE vertex ID of the Source
+    PRIMARY KEY (thought_id, vertex_id)
+);
+CREATE INDEX idx_thought_sources_vertex_id ON thought_sources (vertex_id);
+
+
+-- Create the 'source_notes' table --
+-- Fingerprints of notes ingested from each source, re-imports only add notes not listed here
+CREATE TABLE IF NOT EXISTS source_notes (
+    vertex_id BIGINT NOT NULL REFERENCES sources (vertex_id) ON DELETE CASCADE, -- AGE vertex ID of the Source
+    text_hash BYTEA NOT NULL,               -- SHA-256 of the normalized note text
+    thought_id BIGINT NOT NULL REFERENCES thoughts (thought_id) ON DELETE CASCADE,
+    PRIMARY KEY (vertex_id, text_hash)
+);
+
+
+-- Create the 'thought_neighbors' table --
+-- Precomputed top-k nearest thoughts of each thought, by embedding cosine distance
+CREATE TABLE IF NOT EXISTS thought_neighbors (
+    thought_id BIGINT NOT NULL REFERENCES thoughts (thought_id) ON DELETE CASCADE,
+    neighbor_id BIGINT NOT NULL REFERENCES thoughts (thought_id) ON DELETE CASCADE,
+    distance REAL NOT NULL,
+    PRIMARY KEY (thought_id, neighbor_id)
+);
+CREATE INDEX IF NOT EXISTS idx_thought_neighbors_distance ON thought_neighbors (thought_id, distance);
+
+-- Create the 'related_thoughts_queue' table --
+-- Thoughts whose neighbors are not computed yet, filled on insert, emptied by the related thoughts job
+CREATE TABLE IF NOT EXISTS related_thoughts_queue (
+    thought_id BIGINT PRIMARY KEY REFERENCES thoughts (thought_id) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION queue_related_thoughts() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO related_thoughts_queue (thought_id) SELECT thought_id FROM new_thoughts ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS queue_related_thoughts ON thoughts;
+CREATE TRIGGER queue_related_thoughts
+    AFTER INSERT ON thoughts
+    REFERENCING NEW TABLE AS new_thoughts
+    FOR EACH STATEMENT EXECUTE FUNCTION queue_related_thoughts();
+
+-- Create the 'job_watermarks' table --
+-- Progress of incremental jobs, by last processed ID
+CREATE TABLE IF NOT EXISTS job_watermarks (
+    job_name TEXT PRIMARY KEY,
+    last_id BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
+
+-- Create the 'vault_files' table --
+-- Manifest of synced Markdown files of local vaults, unchanged files are skipped by mtime and size
+CREATE TABLE IF NOT EXISTS vault_files (
+    vault TEXT NOT NULL,                    -- Vault name
+    path TEXT NOT NULL,                     -- Path relative to the vault
+    mtime_ns BIGINT NOT NULL,
+    size BIGINT NOT NULL,
+    content_hash BYTEA NOT NULL,            -- SHA-256 of the file content
+    synced_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (vault, path)
+);
 
 
 -- Create flashcard review logs table with TimescaleDB --
@@ -49,6 +138,32 @@ CREATE TABLE review_logs (
 SELECT create_hypertable('review_logs', by_range('time'));
 
 
+-- Create the 'inference_usage' table with TimescaleDB --
+-- Ledger of LLM and embedding calls
+CREATE TABLE inference_usage (
+    time TIMESTAMPTZ NOT NULL,
+    kind TEXT NOT NULL,           -- 'llm' or 'embedding'
+    model TEXT NOT NULL,
+    rpc TEXT,                     -- Calling RPC method, NULL for jobs and CLIs
+    source_type TEXT,
+    source_id BIGINT,             -- AGE vertex ID of the source, if known
+    items INTEGER NOT NULL,       -- Texts embedded, or 1 per LLM call
+    cached_items INTEGER NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    cost REAL,                    -- USD by the litellm price table, NULL if unknown
+    success BOOLEAN NOT NULL
+);
+SELECT create_hypertable('inference_usage', by_range('time', INTERVAL '7 days'));
+ALTER TABLE inference_usage SET (
+    timescaledb.compress,
+    timescaledb.compress_segmentby = 'kind, model',
+    timescaledb.compress_orderby = 'time DESC'
+);
+SELECT add_compression_policy('inference_usage', INTERVAL '7 days');
+
+
 -- Setup graph --
 CREATE EXTENSION IF NOT EXISTS age;
 LOAD 'age';  -- Load the AGE extension into the current session's library path
@@ -60,10 +175,18 @@ SELECT create_elabel('conscious_graph','DERIVED_TO');
 SELECT create_elabel('conscious_graph','CONTAINS');
 RESET search_path;  -- Reset so that table created after this will have the right schema
 
--- Create index for label Source
--- TO-DO: create index for `keys` only abd verify
+-- Graph indexes --
+-- Label tables hold `id` (graphid) and `properties` (agtype) columns.
+-- Edges match both ends by vertex ID, Thought is looked up by `pg_table_id`,
+-- Source is looked up by the `sources` table.
 -- Reference: https://github.com/apache/age/issues/2137
--- CREATE INDEX IF NOT EXISTS idx_conscious_graph_source ON conscious_graph."Source" USING gin (properties); 
+CREATE INDEX IF NOT EXISTS idx_conscious_graph_source_id ON conscious_graph."Source" USING btree (id);
+CREATE INDEX IF NOT EXISTS idx_conscious_graph_thought_id ON conscious_graph."Thought" USING btree (id);
+CREATE INDEX IF NOT EXISTS idx_conscious_graph_thought_pg_table_id ON conscious_graph."Thought"
+    USING btree (ag_catalog.agtype_access_operator(VARIADIC ARRAY[properties, '"pg_table_id"'::ag_catalog.agtype]));
+-- For edge MERGE and traversals
+CREATE INDEX IF NOT EXISTS idx_conscious_graph_derived_to_start_id ON conscious_graph."DERIVED_TO" USING btree (start_id);
+CREATE INDEX IF NOT EXISTS idx_conscious_graph_derived_to_end_id ON conscious_graph."DERIVED_TO" USING btree (end_id);
 
 
 \echo "Database initialization complete."
\ No newline at end of file
@@ -0,0 +1,20 @@
+-- Migration: graph lookup indexes --
+-- For databases initialized before these indexes were added to `01-create-tables.sql`.
+-- Safe to run more than once.
+--
+-- Source vertices created before this change have no DERIVED_TO edges:
+-- the edge MATCH looked for a `pg_table_id` that Source vertices never had.
+-- Those links can not be recovered here, re-import the sources if needed.
+
+LOAD 'age';
+
+CREATE INDEX IF NOT EXISTS idx_conscious_graph_source_id ON conscious_graph."Source" USING btree (id);
+CREATE INDEX IF NOT EXISTS idx_conscious_graph_thought_id ON conscious_graph."Thought" USING btree (id);
+CREATE INDEX IF NOT EXISTS idx_conscious_graph_thought_pg_table_id ON conscious_graph."Thought"
+    USING btree (ag_catalog.agtype_access_operator(VARIADIC ARRAY[properties, '"pg_table_id"'::ag_catalog.agtype]));
+CREATE INDEX IF NOT EXISTS idx_conscious_graph_derived_to_start_id ON conscious_graph."DERIVED_TO" USING btree (start_id);
+CREATE INDEX IF NOT EXISTS idx_conscious_graph_derived_to_end_id ON conscious_graph."DERIVED_TO" USING btree (end_id);
+
+ANALYZE conscious_graph."Source";
+ANALYZE conscious_graph."Thought";
+ANALYZE conscious_graph."DERIVED_TO";
@@ -0,0 +1,11 @@
+-- Migration: relational lookup table of Source vertices --
+-- After this, run `python -m cli.backfill_sources` from the backend to add existing Source vertices.
+
+CREATE TABLE IF NOT EXISTS sources (
+    source_id BIGSERIAL PRIMARY KEY,
+    source_hash BYTEA NOT NULL UNIQUE,      -- BLAKE2b 128 bits of the canonical identifiers
+    vertex_id BIGINT NOT NULL UNIQUE,       -- AGE vertex ID of the Source
+    source_type TEXT NOT NULL,
+    keys JSONB NOT NULL,                    -- Canonical identifiers, including type
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,21 @@
+-- Migration: relational copy of Source -DERIVED_TO-> Thought links --
+-- Run after `002-sources-table.sql` and `python -m cli.backfill_sources`.
+
+CREATE TABLE IF NOT EXISTS thought_sources (
+    thought_id BIGINT NOT NULL REFERENCES thoughts (thought_id) ON DELETE CASCADE,
+    vertex_id BIGINT NOT NULL REFERENCES sources (vertex_id) ON DELETE CASCADE, -- AGE vertex ID of the Source
+    PRIMARY KEY (thought_id, vertex_id)
+);
+CREATE INDEX IF NOT EXISTS idx_thought_sources_vertex_id ON thought_sources (vertex_id);
+
+-- Backfill from existing edges
+LOAD 'age';
+INSERT INTO thought_sources (thought_id, vertex_id)
+SELECT g.thought_id::text::bigint, s.vertex_id
+FROM ag_catalog.cypher('conscious_graph', $$
+    MATCH (s:Source)-[:DERIVED_TO]->(t:Thought)
+    RETURN id(s), t.pg_table_id
+$$) AS g (vertex_id ag_catalog.agtype, thought_id ag_catalog.agtype)
+JOIN sources s ON s.vertex_id = g.vertex_id::text::bigint
+JOIN thoughts t ON t.thought_id = g.thought_id::text::bigint
+ON CONFLICT DO NOTHING;
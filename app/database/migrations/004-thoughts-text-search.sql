@@ -0,0 +1,6 @@
+-- Migration: full-text search column and index on thoughts --
+-- Adding a stored generated column rewrites the table.
+
+ALTER TABLE thoughts
+    ADD COLUMN IF NOT EXISTS text_search TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', text)) STORED;
+CREATE INDEX IF NOT EXISTS idx_thoughts_text_search ON thoughts USING gin (text_search);
@@ -0,0 +1,41 @@
+-- Migration: related thoughts tables --
+
+-- Create the 'thought_neighbors' table --
+-- Precomputed top-k nearest thoughts of each thought, by embedding cosine distance
+CREATE TABLE IF NOT EXISTS thought_neighbors (
+    thought_id BIGINT NOT NULL REFERENCES thoughts (thought_id) ON DELETE CASCADE,
+    neighbor_id BIGINT NOT NULL REFERENCES thoughts (thought_id) ON DELETE CASCADE,
+    distance REAL NOT NULL,
+    PRIMARY KEY (thought_id, neighbor_id)
+);
+CREATE INDEX IF NOT EXISTS idx_thought_neighbors_distance ON thought_neighbors (thought_id, distance);
+
+-- Create the 'related_thoughts_queue' table --
+-- Thoughts whose neighbors are not computed yet, filled on insert, emptied by the related thoughts job
+CREATE TABLE IF NOT EXISTS related_thoughts_queue (
+    thought_id BIGINT PRIMARY KEY REFERENCES thoughts (thought_id) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION queue_related_thoughts() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO related_thoughts_queue (thought_id) SELECT thought_id FROM new_thoughts ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS queue_related_thoughts ON thoughts;
+CREATE TRIGGER queue_related_thoughts
+    AFTER INSERT ON thoughts
+    REFERENCING NEW TABLE AS new_thoughts
+    FOR EACH STATEMENT EXECUTE FUNCTION queue_related_thoughts();
+
+-- Existing thoughts are computed by the first run
+INSERT INTO related_thoughts_queue (thought_id) SELECT thought_id FROM thoughts ON CONFLICT DO NOTHING;
+
+-- Create the 'job_watermarks' table --
+-- Progress of incremental jobs, by last processed ID
+CREATE TABLE IF NOT EXISTS job_watermarks (
+    job_name TEXT PRIMARY KEY,
+    last_id BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
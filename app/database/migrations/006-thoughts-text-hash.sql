@@ -0,0 +1,21 @@
+-- Migration: hash of normalized text on thoughts, for exact duplicates --
+-- Normalization mirrors `utils.helpers.normalize_text`: NFKC, whitespace runs to one space, stripped.
+-- Rows where the two differ only miss the fast path, the embedding check still finds them.
+
+ALTER TABLE thoughts ADD COLUMN IF NOT EXISTS text_hash BYTEA;
+
+UPDATE thoughts
+SET text_hash = sha256(convert_to(btrim(regexp_replace(normalize(text, NFKC), '\s+', ' ', 'g')), 'UTF8'))
+WHERE text_hash IS NULL;
+
+-- Existing exact duplicates: keep the hash on the oldest thought only
+UPDATE thoughts t
+SET text_hash = NULL
+FROM (
+    SELECT thought_id, row_number() OVER (PARTITION BY text_hash ORDER BY thought_id) AS rank
+    FROM thoughts
+    WHERE text_hash IS NOT NULL
+) ranked
+WHERE t.thought_id = ranked.thought_id AND ranked.rank > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS thoughts_text_hash_key ON thoughts (text_hash);
@@ -0,0 +1,17 @@
+-- Migration: fingerprints of notes ingested from each source --
+
+CREATE TABLE IF NOT EXISTS source_notes (
+    vertex_id BIGINT NOT NULL REFERENCES sources (vertex_id) ON DELETE CASCADE,
+    text_hash BYTEA NOT NULL,
+    thought_id BIGINT NOT NULL REFERENCES thoughts (thought_id) ON DELETE CASCADE,
+    PRIMARY KEY (vertex_id, text_hash)
+);
+
+-- Backfill from existing links. Notes merged into a similar thought have a different
+-- hash than the thought, they are added once more on the next import and matched again.
+INSERT INTO source_notes (vertex_id, text_hash, thought_id)
+SELECT ts.vertex_id, t.text_hash, t.thought_id
+FROM thought_sources ts
+JOIN thoughts t ON t.thought_id = ts.thought_id
+WHERE t.text_hash IS NOT NULL
+ON CONFLICT DO NOTHING;
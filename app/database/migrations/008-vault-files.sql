@@ -0,0 +1,11 @@
+-- Migration: manifest of synced Markdown vault files --
+
+CREATE TABLE IF NOT EXISTS vault_files (
+    vault TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    size BIGINT NOT NULL,
+    content_hash BYTEA NOT NULL,
+    synced_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (vault, path)
+);
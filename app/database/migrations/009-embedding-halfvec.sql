@@ -0,0 +1,32 @@
+-- Migration: OPTIONAL, store embeddings in half precision --
+-- Apply only together with `EMBEDDING_STORAGE=halfvec`. The dimension is read from the current column.
+--
+-- `halfvec` takes 2 bytes per dimension instead of 4, table and index are about half the size.
+-- The DiskANN index supports `vector` only, half precision embeddings use a pgvector HNSW index.
+--
+-- The column type change rewrites the table under an exclusive lock, plan downtime
+-- proportional to the number of thoughts. Raise `maintenance_work_mem` for a faster index build.
+-- To revert: drop the index, change the column back with `USING embedding::vector(<dimension>)`,
+-- then create the DiskANN index of `initdb.d/01-create-tables.sql`.
+
+BEGIN;
+
+DROP INDEX IF EXISTS idx_thoughts_embedding;
+
+DO $$
+DECLARE
+    dimension integer;
+BEGIN
+    -- Type modifier of a `vector` column is its dimension
+    SELECT atttypmod INTO dimension FROM pg_attribute
+    WHERE attrelid = 'thoughts'::regclass AND attname = 'embedding' AND NOT attisdropped;
+    IF dimension IS NULL OR dimension <= 0 THEN
+        RAISE EXCEPTION 'Column thoughts.embedding has no dimension';
+    END IF;
+    EXECUTE format('ALTER TABLE thoughts ALTER COLUMN embedding TYPE HALFVEC(%s) USING embedding::halfvec(%s)', dimension, dimension);
+END
+$$;
+
+CREATE INDEX idx_thoughts_embedding ON thoughts USING hnsw (embedding halfvec_cosine_ops);
+
+COMMIT;
@@ -0,0 +1,27 @@
+-- Migration: ledger of LLM and embedding calls --
+
+CREATE TABLE IF NOT EXISTS inference_usage (
+    time TIMESTAMPTZ NOT NULL,
+    kind TEXT NOT NULL,           -- 'llm' or 'embedding'
+    model TEXT NOT NULL,
+    rpc TEXT,                     -- Calling RPC method, NULL for jobs and CLIs
+    source_type TEXT,
+    source_id BIGINT,             -- AGE vertex ID of the source, if known
+    items INTEGER NOT NULL,       -- Texts embedded, or 1 per LLM call
+    cached_items INTEGER NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    cost REAL,                    -- USD by the litellm price table, NULL if unknown
+    success BOOLEAN NOT NULL
+);
+
+SELECT create_hypertable('inference_usage', by_range('time', INTERVAL '7 days'), if_not_exists => TRUE);
+
+-- Older chunks are compressed, columns of repeated values compress to little
+ALTER TABLE inference_usage SET (
+    timescaledb.compress,
+    timescaledb.compress_segmentby = 'kind, model',
+    timescaledb.compress_orderby = 'time DESC'
+);
+SELECT add_compression_policy('inference_usage', INTERVAL '7 days', if_not_exists => TRUE);
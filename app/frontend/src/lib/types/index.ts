@@ -53,4 +53,7 @@ export interface AddDataRequest {
 export interface AddDataResponse {
   success: boolean;
   message: string;
+  added: number;
+  unchanged: number;
+  removed: number;
 }